@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""Micro-benchmark for cdsync.logparse.classify_line and the rclonelog digest.
+
+Usage:
+    benchmarks/bench_logparse.py                 # synthetic 8MB bisync log
+    benchmarks/bench_logparse.py --log cdsync.log
+    benchmarks/bench_logparse.py --min-mbps 20   # exit 1 below this rate
+
+The synthetic fixture is generated deterministically from line shapes taken
+from real `rclone bisync --verbose` and cdsync-core.sh output, so results are
+comparable between runs and machines without shipping a multi-MB file.
+The digest is measured on the same lines converted to rclone's JSON log
+(--use-json-log): one pass producing ignore entries, events and statistics.
+"""
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cdsync.logparse import classify_line, format_event  # noqa: E402
+from cdsync.rclonelog import RunDigest, parse_line  # noqa: E402
+from cdsync.tuning import RunMeter  # noqa: E402
+
+# (weight, template) pairs. Most lines of a verbose bisync are noise.
+TEMPLATES = [
+    (30, "{date} {time} INFO  : - Path1    File is new                  - {path}"),
+    (30, "{date} {time} INFO  : - Path2    File is newer                - {path}"),
+    (40, "{date} {time} INFO  : {path}: Copied (new)"),
+    (20, "{date} {time} INFO  : {path}: Copied (replaced existing)"),
+    (10, "{date} {time} INFO  : {path}: Deleted"),
+    (5, "{date} {time} INFO  : {path}: Moved (server-side) to: {path}.bak"),
+    (5, "{date} {time} INFO  : - Path1             Directory is new                            - {dir}"),
+    (2, "{date} {time} INFO  : - Path2             Directory was deleted                        - {dir}"),
+    (3, "{date} {time} INFO  : {dir}: Made directory"),
+    (150, "{date} {time} INFO  : - Path1    Queue copy to Path2          - {path}"),
+    (150, "{date} {time} INFO  : - Path2    Do queued copies to          - Path1"),
+    (200, "{date} {time} DEBUG : {path}: Size and modification time the same (differ by 0s, within tolerance 1s)"),
+    (200, "{date} {time} DEBUG : {path}: Unchanged skipping"),
+    (60, "{date} {time} INFO  : Path1 checking for diffs"),
+    (60, "{date} {time} INFO  : Bisync successful"),
+    (40, "{date} {time} NOTICE: {path}: Duplicate object found in source - ignoring"),
+    (40, "{date} {time} INFO  : \nTransferred:   \t  1.234 GiB / 2.000 GiB, 62%, 12.345 MiB/s, ETA 1m2s\nChecks:     12345 / 12345, 100%"),
+    (20, "{date2} {time} - INFO: 🚀 Targeted Sync triggered for: {path}"),
+    (10, "{date2} {time} - SKIP: Smart Sync ignored (System busy). Will be picked up by Timer."),
+    (5, "{date2} {time} - SUCCESS: ✅ Synchronization completed."),
+    (5, "{date} {time} ERROR : {path}: Failed to copy: googleapi: Error 403: User rate limit exceeded., userRateLimitExceeded"),
+]
+
+WORDS = ["Documents", "Photos", "2024", "Invoices", "project", "src", "build",
+         "backup", "Shared", "Clientes", "Relatórios", "notes", "assets", "old"]
+EXTS = [".txt", ".pdf", ".jpg", ".docx", ".xlsx", ".py", ".mp4", ".json"]
+
+
+def generate_fixture(path, size_bytes, seed=1234):
+    rng = random.Random(seed)
+    weights = [w for w, _ in TEMPLATES]
+    templates = [t for _, t in TEMPLATES]
+    written = 0
+    with open(path, "w", encoding="utf-8") as f:
+        while written < size_bytes:
+            depth = rng.randint(0, 5)
+            dirname = "/".join(rng.choice(WORDS) for _ in range(depth)) or "."
+            filename = f"{rng.choice(WORDS)}_{rng.randint(0, 99999)}{rng.choice(EXTS)}"
+            h, m, s = rng.randint(0, 23), rng.randint(0, 59), rng.randint(0, 59)
+            line = rng.choices(templates, weights)[0].format(
+                date="2025/12/09",
+                date2="2025-12-09",
+                time=f"{h:02d}:{m:02d}:{s:02d}",
+                path=f"{dirname}/{filename}",
+                dir=dirname,
+            ) + "\n"
+            f.write(line)
+            written += len(line.encode("utf-8"))
+
+
+_TEXT_RE = re.compile(
+    r"(\d{4})/(\d{2})/(\d{2}) (\S+) (\w+)\s*: (?:(?P<object>[^-\s][^:]*): "
+    r"(?=Copied|Updated|Deleted|Moved|Made directory|Size|Unchanged|Duplicate|Failed))?(?P<msg>.*)",
+    re.DOTALL,
+)
+
+
+def to_json(line):
+    """The rclone --use-json-log form of a text log line (cdsync lines stay text)."""
+    m = _TEXT_RE.match(line)
+    if m is None:
+        return line
+    y, mo, d, t, level = m.groups()[:5]
+    record = {"time": f"{y}-{mo}-{d}T{t}.000000+00:00", "level": level.lower(), "msg": m.group("msg")}
+    if m.group("object"):
+        record["object"] = m.group("object")
+    return json.dumps(record)
+
+
+def run_digest(lines, repeat):
+    """Best time of one RunDigest pass (ignore entries, events, statistics)."""
+    json_lines = [to_json(line) for line in lines]
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        digest = RunDigest(RunMeter("/nonexistent"), track_local=True)
+        for line in json_lines:
+            digest.add(parse_line(line))
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return digest, best
+
+
+def run(log_path, repeat):
+    with open(log_path, "r", errors="replace") as f:
+        lines = f.read().splitlines()
+    size = os.path.getsize(log_path)
+
+    best = None
+    hits = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        hits = 0
+        for line in lines:
+            event = classify_line(line)
+            if event is not None:
+                hits += 1
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    # Formatting is a separate step; measure it on its own
+    events = [e for e in map(classify_line, lines) if e is not None]
+    start = time.perf_counter()
+    for event in events:
+        format_event(event)
+    fmt_elapsed = time.perf_counter() - start
+
+    digest, digest_elapsed = run_digest(lines, repeat)
+
+    return {
+        "log": log_path,
+        "bytes": size,
+        "lines": len(lines),
+        "events": hits,
+        "classify_seconds": round(best, 4),
+        "lines_per_second": int(len(lines) / best) if best else None,
+        "mb_per_second": round(size / (1024 * 1024) / best, 2) if best else None,
+        "format_seconds": round(fmt_elapsed, 4),
+        "digest_seconds": round(digest_elapsed, 4),
+        "digest_lines_per_second": int(len(lines) / digest_elapsed) if digest_elapsed else None,
+        "digest_events": len(digest.events),
+        "digest_local_changes": len(digest.local_changes),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--log", help="Benchmark an existing log instead of the synthetic fixture")
+    parser.add_argument("--size-mb", type=float, default=8, help="Synthetic fixture size (default: 8)")
+    parser.add_argument("--repeat", type=int, default=3, help="Best of N runs (default: 3)")
+    parser.add_argument("--min-mbps", type=float, help="Fail if throughput drops below this")
+    args = parser.parse_args()
+
+    fixture = args.log
+    cleanup = False
+    if not fixture:
+        fixture = os.path.join(os.environ.get("TMPDIR", "/tmp"), f"cdsync_bench_{os.getpid()}.log")
+        generate_fixture(fixture, int(args.size_mb * 1024 * 1024))
+        cleanup = True
+
+    try:
+        result = run(fixture, args.repeat)
+    finally:
+        if cleanup:
+            os.remove(fixture)
+
+    print(json.dumps(result, indent=2))
+    if args.min_mbps is not None and result["mb_per_second"] < args.min_mbps:
+        print(f"REGRESSION: {result['mb_per_second']} MB/s < {args.min_mbps} MB/s", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
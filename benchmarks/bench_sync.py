@@ -0,0 +1,481 @@
+#!/usr/bin/env python3
+"""End-to-end benchmark of the watcher and cdsync-core.sh on synthetic trees.
+
+Usage:
+    benchmarks/bench_sync.py                          # 1k-file tree, all scenarios
+    benchmarks/bench_sync.py --tree 100k --tree 1m --output results.json
+    benchmarks/bench_sync.py --checkout ../cdsync-v1 --scenario single_edit
+    benchmarks/bench_sync.py --engine rcd
+
+Each run copies the checkout under test into a scratch directory, writes a
+config.env for it whose remote is a plain local directory (rclone treats it
+as a local-filesystem remote), seeds identical local and remote trees,
+runs the initial `cdsync-core.sh --force-resync` and starts
+`cdsync-watcher.sh` the way the systemd unit does. The scratch directory also
+holds XDG_STATE_HOME/XDG_RUNTIME_DIR, so nothing touches the real instance.
+
+Scenarios:
+    single_edit     rewrite one existing file
+    burst_1000      create 1000 files across existing folders at once
+    dir_rename      rename a populated folder
+    remote_change   add and edit files on the remote, then Sync Now
+    large_copy      write a large file slowly (copy in progress)
+
+Reported per scenario: event-to-uploaded latency, wall time until the
+watcher is idle again, CPU seconds (watcher and everything it ran), rclone
+invocations (through a PATH wrapper) and processes forked. The fork count
+comes from /proc/stat and is system-wide: run on a quiet machine.
+Results are JSON, meant to be compared across versions.
+"""
+import argparse
+import fcntl
+import json
+import os
+import random
+import resource
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+from cdsync.status import get_status, instance_name  # noqa: E402
+
+TREES = {"1k": 1_000, "10k": 10_000, "100k": 100_000, "1m": 1_000_000}
+SCENARIOS = ("single_edit", "burst_1000", "dir_rename", "remote_change", "large_copy")
+
+FILES_PER_DIR = 50
+MAX_DEPTH = 6
+# (share, max size): mostly small files, a few larger ones
+SIZE_MIX = ((0.90, 4 * 1024), (0.099, 64 * 1024), (0.001, 1024 * 1024))
+WORDS = ["Documents", "Photos", "2024", "Invoices", "project", "src", "build",
+         "backup", "Shared", "Clientes", "Relatórios", "notes", "assets", "old"]
+EXTS = [".txt", ".pdf", ".jpg", ".docx", ".xlsx", ".py", ".json"]
+
+CLK_TCK = os.sysconf("SC_CLK_TCK")
+POLL = 0.02
+# Watcher idle this long (no run, nothing queued) ends a scenario
+SETTLE = 2.0
+
+RCLONE_WRAPPER = """#!/bin/sh
+echo "$(date +%s.%N) $1" >> "{log}"
+exec "{real}" "$@"
+"""
+
+
+# --- Synthetic tree ---
+
+def generate_tree(roots, count, seed=1234):
+    """Writes the same `count` files under every root. Returns (files, bytes, rel_paths)."""
+    rng = random.Random(seed)
+    blob = rng.randbytes(2 * 1024 * 1024)
+    dirs = [""]
+    depth = {"": 0}
+    for i in range(max(1, count // FILES_PER_DIR)):
+        parent = rng.choice([d for d in dirs[-64:] if depth[d] < MAX_DEPTH] or [""])
+        rel = os.path.join(parent, f"{rng.choice(WORDS)}_{i}")
+        dirs.append(rel)
+        depth[rel] = depth[parent] + 1
+    for root in roots:
+        for rel in dirs:
+            os.makedirs(os.path.join(root, rel), exist_ok=True)
+
+    paths = []
+    total = 0
+    shares = [share for share, _ in SIZE_MIX]
+    for i in range(count):
+        rel = os.path.join(rng.choice(dirs), f"{rng.choice(WORDS)}_{i}{rng.choice(EXTS)}")
+        size = rng.randint(0, rng.choices(SIZE_MIX, shares)[0][1])
+        offset = rng.randint(0, len(blob) - size)
+        data = blob[offset:offset + size]
+        for root in roots:
+            with open(os.path.join(root, rel), "wb") as f:
+                f.write(data)
+        paths.append(rel)
+        total += size
+    return count, total, paths
+
+
+# --- Sandbox ---
+
+class Sandbox:
+    def __init__(self, work, checkout, engine, real_rclone):
+        self.work = work
+        self.app = os.path.join(work, "app")
+        self.local = os.path.join(work, "local")
+        self.remote = os.path.join(work, "remote")
+        self.log_file = os.path.join(work, "cdsync.log")
+        self.lock_file = os.path.join(work, "cdsync.lock")
+        self.rclone_log = os.path.join(work, "rclone-invocations.log")
+        self.watcher_log = os.path.join(work, "watcher.log")
+        self.watcher = None
+
+        shutil.copytree(checkout, self.app, ignore=shutil.ignore_patterns(
+            ".git", "__pycache__", "benchmarks", "config.env", "*.log", "*.lock"))
+        for d in (self.local, self.remote, os.path.join(work, "bin"),
+                  os.path.join(work, "state"), os.path.join(work, "run")):
+            os.makedirs(d, exist_ok=True)
+        os.chmod(os.path.join(work, "run"), 0o700)
+
+        wrapper = os.path.join(work, "bin", "rclone")
+        with open(wrapper, "w") as f:
+            f.write(RCLONE_WRAPPER.format(log=self.rclone_log, real=real_rclone))
+        os.chmod(wrapper, 0o755)
+        open(os.path.join(work, "rclone.conf"), "w").close()
+        open(self.rclone_log, "w").close()
+
+        with open(os.path.join(self.app, "config.env"), "w") as f:
+            f.write(
+                f'RCLONE_REMOTE="{self.remote}"\n'
+                f'LOCAL_SYNC_DIR="{self.local}"\n'
+                f'LOCK_FILE="{self.lock_file}"\n'
+                f'CUSTOM_LOG_FILE="{self.log_file}"\n'
+                f'RCLONE_CONFIG_PATH="{os.path.join(work, "rclone.conf")}"\n'
+                "NOTIFY_LEVEL=0\n"
+                # No periodic bisync: scenarios trigger every run they measure
+                "POLL_INTERVAL=0\n"
+                f"SYNC_ENGINE={engine}\n"
+            )
+
+        self.env = dict(
+            os.environ,
+            PATH=os.path.join(work, "bin") + os.pathsep + os.environ.get("PATH", ""),
+            XDG_STATE_HOME=os.path.join(work, "state"),
+            XDG_RUNTIME_DIR=os.path.join(work, "run"),
+        )
+        self.env.pop("CDSYNC_SCHEDULED", None)
+
+    def core(self, *args):
+        return subprocess.run(["bash", os.path.join(self.app, "cdsync-core.sh"), *args],
+                              env=self.env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL).returncode
+
+    def start_watcher(self):
+        log = open(self.watcher_log, "a")
+        self.watcher = subprocess.Popen(["bash", os.path.join(self.app, "cdsync-watcher.sh")], env=self.env,
+                                        stdout=log, stderr=subprocess.STDOUT, start_new_session=True)
+        log.close()
+
+    def stop_watcher(self):
+        if self.watcher is None:
+            return
+        try:
+            os.killpg(self.watcher.pid, signal.SIGTERM)
+            self.watcher.wait(timeout=30)
+        except (ProcessLookupError, subprocess.TimeoutExpired):
+            try:
+                os.killpg(self.watcher.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+            self.watcher.wait()
+        self.watcher = None
+
+    # --- Probes ---
+
+    def watcher_cpu(self):
+        """CPU seconds of the watcher plus every child it has reaped."""
+        if self.watcher is None:
+            return 0.0
+        try:
+            with open(f"/proc/{self.watcher.pid}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+        except OSError:
+            return 0.0
+        # utime, stime, cutime, cstime (fields 14-17)
+        return sum(int(v) for v in fields[11:15]) / CLK_TCK
+
+    def rclone_calls(self):
+        with open(self.rclone_log) as f:
+            return [line.split()[1] if len(line.split()) > 1 else "" for line in f]
+
+    def core_running(self):
+        """True while a cdsync-core.sh run holds the lock."""
+        try:
+            fd = os.open(self.lock_file, os.O_RDONLY)
+        except FileNotFoundError:
+            return False
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return False
+        except BlockingIOError:
+            return True
+        finally:
+            os.close(fd)
+
+    def hub_busy(self):
+        """Running or queued jobs, per the watcher's status socket (versions that have one)."""
+        state = get_status(os.path.join(self.env["XDG_RUNTIME_DIR"], instance_name(self.app) + ".sock"))
+        return bool(state and (state.get("running") or state.get("queue_depth")))
+
+    def wait_idle(self, timeout):
+        """Waits until no run is active or queued for SETTLE seconds."""
+        deadline = time.monotonic() + timeout
+        quiet_since = None
+        while time.monotonic() < deadline:
+            if self.core_running() or self.hub_busy():
+                quiet_since = None
+            elif quiet_since is None:
+                quiet_since = time.monotonic()
+            elif time.monotonic() - quiet_since >= SETTLE:
+                return True
+            time.sleep(0.1)
+        return False
+
+
+def _same(a, b):
+    try:
+        with open(a, "rb") as fa, open(b, "rb") as fb:
+            return fa.read() == fb.read()
+    except OSError:
+        return False
+
+
+def wait_for(checks, timeout):
+    """Polls {key: check()} until all pass. Returns {key: seconds or None}, timed from now."""
+    start = time.monotonic()
+    pending = dict(checks)
+    done = {}
+    while pending and time.monotonic() - start < timeout:
+        for key, check in list(pending.items()):
+            if check():
+                done[key] = time.monotonic() - start
+                del pending[key]
+        if pending:
+            time.sleep(POLL)
+    done.update((key, None) for key in pending)
+    return done
+
+
+def _latency_stats(latencies):
+    values = sorted(v for v in latencies.values() if v is not None)
+    if not values:
+        return {"latency_seconds": None, "timed_out": len(latencies)}
+    result = {
+        "latency_seconds": round(values[-1], 3),
+        "latency_p50_seconds": round(values[len(values) // 2], 3),
+        "latency_p95_seconds": round(values[min(len(values) - 1, int(len(values) * 0.95))], 3),
+    }
+    missing = len(latencies) - len(values)
+    if missing:
+        result["timed_out"] = missing
+    return result
+
+
+# --- Scenarios ---
+# Each returns {key: check} to wait for, after doing its change.
+
+def scenario_single_edit(box, tree, rng, args):
+    rel = rng.choice(tree)
+    with open(os.path.join(box.local, rel), "ab") as f:
+        f.write(b"benchmark edit\n")
+    return {rel: lambda: _same(os.path.join(box.local, rel), os.path.join(box.remote, rel))}
+
+
+def scenario_burst_1000(box, tree, rng, args):
+    dirs = sorted({os.path.dirname(rel) for rel in tree})
+    checks = {}
+    for i in range(1000):
+        rel = os.path.join(rng.choice(dirs), f"burst_{i}.txt")
+        with open(os.path.join(box.local, rel), "w") as f:
+            f.write(f"burst file {i}\n")
+        checks[rel] = (lambda r: lambda: _same(os.path.join(box.local, r), os.path.join(box.remote, r)))(rel)
+    return checks
+
+
+def scenario_dir_rename(box, tree, rng, args):
+    candidates = sorted({os.path.dirname(rel) for rel in tree if os.path.dirname(rel)})
+    old = rng.choice(candidates)
+    new = old + "_renamed"
+    os.rename(os.path.join(box.local, old), os.path.join(box.local, new))
+    moved = [rel for rel in tree if rel.startswith(old + "/")]
+    # Later scenarios pick files by their current path
+    tree[:] = [new + rel[len(old):] if rel.startswith(old + "/") else rel for rel in tree]
+
+    def renamed():
+        if os.path.exists(os.path.join(box.remote, old)):
+            return False
+        return all(os.path.exists(os.path.join(box.remote, new, rel[len(old) + 1:])) for rel in moved)
+    return {new: renamed}
+
+
+def scenario_remote_change(box, tree, rng, args):
+    edited = rng.choice(tree)
+    with open(os.path.join(box.remote, edited), "ab") as f:
+        f.write(b"remote edit\n")
+    added = os.path.join(os.path.dirname(edited), "remote_new.txt")
+    with open(os.path.join(box.remote, added), "w") as f:
+        f.write("added on the remote\n")
+    # Remote changes are only seen by a bisync: ask for one like the tray does
+    box.core("--sync-now")
+    return {
+        rel: (lambda r: lambda: _same(os.path.join(box.remote, r), os.path.join(box.local, r)))(rel)
+        for rel in (edited, added)
+    }
+
+
+def scenario_large_copy(box, tree, rng, args):
+    rel = "large_copy.bin"
+    chunk = os.urandom(1024 * 1024)
+    interval = 1.0 / args.large_rate_mib
+    with open(os.path.join(box.local, rel), "wb") as f:
+        for _ in range(args.large_mib):
+            f.write(chunk)
+            f.flush()
+            time.sleep(interval)
+    size = args.large_mib * 1024 * 1024
+
+    def uploaded():
+        try:
+            return os.path.getsize(os.path.join(box.remote, rel)) == size
+        except OSError:
+            return False
+    # Latency is counted from the end of the copy
+    return {rel: uploaded}
+
+
+def run_scenario(box, name, tree, args):
+    rng = random.Random(f"{args.seed}-{name}")
+    calls_before = len(box.rclone_calls())
+    forks_before = _forks()
+    cpu_before = box.watcher_cpu()
+    children_before = resource.getrusage(resource.RUSAGE_CHILDREN)
+    start = time.monotonic()
+
+    checks = globals()[f"scenario_{name}"](box, tree, rng, args)
+    changed_at = time.monotonic()
+    latencies = wait_for(checks, args.timeout)
+    idle = box.wait_idle(args.timeout)
+    wall = time.monotonic() - start
+
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    calls = box.rclone_calls()[calls_before:]
+    result = {
+        "wall_seconds": round(wall, 3),
+        "change_seconds": round(changed_at - start, 3),
+        "cpu_seconds": round(
+            box.watcher_cpu() - cpu_before
+            + (children.ru_utime + children.ru_stime) - (children_before.ru_utime + children_before.ru_stime), 3),
+        "processes_forked": _forks() - forks_before,
+        "rclone_invocations": len(calls),
+        "rclone_commands": {cmd: calls.count(cmd) for cmd in sorted(set(calls))},
+        "settled": idle,
+    }
+    result.update(_latency_stats(latencies))
+    return result
+
+
+def _forks():
+    with open("/proc/stat") as f:
+        for line in f:
+            if line.startswith("processes "):
+                return int(line.split()[1])
+    return 0
+
+
+def _version(checkout):
+    try:
+        return subprocess.run(["git", "-C", checkout, "describe", "--always", "--dirty"],
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def bench_tree(size_name, args, real_rclone):
+    work = tempfile.mkdtemp(prefix=f"cdsync_bench_{size_name}_", dir=args.workdir)
+    box = Sandbox(work, args.checkout, args.engine, real_rclone)
+    result = {"tree": size_name}
+    try:
+        start = time.monotonic()
+        files, nbytes, tree = generate_tree([box.local, box.remote], TREES[size_name], args.seed)
+        result["files"] = files
+        result["bytes"] = nbytes
+        result["generate_seconds"] = round(time.monotonic() - start, 2)
+        print(f"[{size_name}] tree: {files} files, {nbytes / 1024 / 1024:.1f} MiB", file=sys.stderr)
+
+        start = time.monotonic()
+        children_before = resource.getrusage(resource.RUSAGE_CHILDREN)
+        code = box.core("--force-resync")
+        children = resource.getrusage(resource.RUSAGE_CHILDREN)
+        result["initial_resync"] = {
+            "exit_code": code,
+            "wall_seconds": round(time.monotonic() - start, 3),
+            "cpu_seconds": round((children.ru_utime + children.ru_stime)
+                                 - (children_before.ru_utime + children_before.ru_stime), 3),
+            "rclone_invocations": len(box.rclone_calls()),
+        }
+        if code != 0:
+            result["error"] = f"initial resync failed (exit {code}), see {box.log_file}"
+            return result
+
+        # Warm-up: the watcher is ready once a probe file makes it to the remote
+        start = time.monotonic()
+        box.start_watcher()
+        probe = "cdsync_bench_probe.txt"
+        deadline = time.monotonic() + args.timeout
+        while time.monotonic() < deadline and box.watcher.poll() is None:
+            with open(os.path.join(box.local, probe), "w") as f:
+                f.write(f"{time.time()}\n")
+            if wait_for({probe: lambda: _same(os.path.join(box.local, probe),
+                                              os.path.join(box.remote, probe))}, 15)[probe] is not None:
+                break
+        else:
+            result["error"] = f"watcher did not start syncing, see {box.watcher_log}"
+            return result
+        box.wait_idle(args.timeout)
+        result["watcher_ready_seconds"] = round(time.monotonic() - start, 3)
+
+        result["scenarios"] = {}
+        for name in args.scenario or SCENARIOS:
+            print(f"[{size_name}] {name}...", file=sys.stderr)
+            result["scenarios"][name] = run_scenario(box, name, tree, args)
+    finally:
+        box.stop_watcher()
+        if args.keep:
+            result["workdir"] = work
+        else:
+            shutil.rmtree(work, ignore_errors=True)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tree", action="append", choices=TREES, help="Tree size; repeatable (default: 1k)")
+    parser.add_argument("--scenario", action="append", choices=SCENARIOS, help="Repeatable (default: all)")
+    parser.add_argument("--checkout", default=REPO_DIR, help="CDSync checkout to benchmark (default: this one)")
+    parser.add_argument("--engine", choices=("cli", "rcd"), default="cli", help="SYNC_ENGINE (default: cli)")
+    parser.add_argument("--rclone", default=shutil.which("rclone"), help="rclone binary (default: from PATH)")
+    parser.add_argument("--large-mib", type=int, default=256, help="large_copy file size (default: 256)")
+    parser.add_argument("--large-rate-mib", type=float, default=64, help="large_copy write rate, MiB/s (default: 64)")
+    parser.add_argument("--timeout", type=float, default=600, help="Per-scenario timeout, seconds (default: 600)")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--workdir", help="Scratch directory parent (default: $TMPDIR)")
+    parser.add_argument("--keep", action="store_true", help="Keep the scratch directories")
+    parser.add_argument("--output", help="Write the JSON results here instead of stdout")
+    args = parser.parse_args()
+
+    if not args.rclone:
+        parser.error("rclone not found in PATH (use --rclone)")
+    args.checkout = os.path.abspath(args.checkout)
+
+    results = {
+        "checkout": args.checkout,
+        "version": _version(args.checkout),
+        "engine": args.engine,
+        "started_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "rclone": subprocess.run([args.rclone, "version"], capture_output=True, text=True).stdout.split("\n")[0],
+        "trees": [bench_tree(size_name, args, os.path.abspath(args.rclone)) for size_name in args.tree or ["1k"]],
+    }
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    return 1 if any("error" in tree for tree in results["trees"]) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
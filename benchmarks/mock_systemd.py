@@ -0,0 +1,341 @@
+#!/usr/bin/env python3
+"""Mock systemd user manager on a private D-Bus, for cdsync/systemd.py.
+
+Usage:
+    benchmarks/mock_systemd.py                      # start a bus, the mock and run the checks
+    benchmarks/mock_systemd.py --units a.service b.timer --delay 0.2
+    benchmarks/mock_systemd.py serve --address unix:path=...   # only the mock
+
+`check` (the default) starts a private dbus-daemon. It then runs this
+script's `serve` on that bus. `serve` owns org.freedesktop.systemd1 and
+serves mock units. `check` drives cdsync.systemd.SystemdUnits against the
+mock, the way the tray does, through its bus_address override (the same
+one CDSYNC_SYSTEMD_BUS sets). The steps are:
+
+    enable_and_start    units become enabled and active
+    restart             units pass through activating and are active again
+    external_failure    a unit fails on its own; only the signal reports it
+    stop_and_disable    units become inactive and disabled
+
+Unit state changes are announced with PropertiesChanged only, as systemd
+does. Each step therefore checks that the tray's view (is_active,
+on_change) follows the signals without polling. Results are JSON with the
+latency of every step. The exit code is 1 if a step failed.
+
+Needs dbus-daemon and PyGObject (the tray's own dependencies); nothing
+touches the real user session.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+from gi.repository import Gio, GLib
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+from cdsync.systemd import (  # noqa: E402
+    MANAGER_IFACE, SYSTEMD_BUS_NAME, SYSTEMD_PATH, UNIT_IFACE, SystemdUnits,
+)
+
+# Test-only interface of the mock, to change units behind the client's back
+MOCK_IFACE = "org.cdsync.MockSystemd"
+
+DEFAULT_UNITS = ("cdsync-mock.service", "cdsync-mock.timer")
+# Seconds a unit spends activating/deactivating
+DEFAULT_DELAY = 0.1
+STEP_TIMEOUT = 5.0
+
+INTROSPECTION = f"""
+<node>
+  <interface name="{MANAGER_IFACE}">
+    <method name="Subscribe"/>
+    <method name="Reload"/>
+    <method name="LoadUnit">
+      <arg type="s" direction="in"/><arg type="o" direction="out"/>
+    </method>
+    <method name="GetUnit">
+      <arg type="s" direction="in"/><arg type="o" direction="out"/>
+    </method>
+    <method name="StartUnit">
+      <arg type="s" direction="in"/><arg type="s" direction="in"/><arg type="o" direction="out"/>
+    </method>
+    <method name="StopUnit">
+      <arg type="s" direction="in"/><arg type="s" direction="in"/><arg type="o" direction="out"/>
+    </method>
+    <method name="RestartUnit">
+      <arg type="s" direction="in"/><arg type="s" direction="in"/><arg type="o" direction="out"/>
+    </method>
+    <method name="EnableUnitFiles">
+      <arg type="as" direction="in"/><arg type="b" direction="in"/><arg type="b" direction="in"/>
+      <arg type="b" direction="out"/><arg type="a(sss)" direction="out"/>
+    </method>
+    <method name="DisableUnitFiles">
+      <arg type="as" direction="in"/><arg type="b" direction="in"/>
+      <arg type="a(sss)" direction="out"/>
+    </method>
+    <method name="GetUnitFileState">
+      <arg type="s" direction="in"/><arg type="s" direction="out"/>
+    </method>
+  </interface>
+  <interface name="{MOCK_IFACE}">
+    <method name="SetActiveState">
+      <arg type="s" direction="in"/><arg type="s" direction="in"/>
+    </method>
+    <method name="Calls">
+      <arg type="a{{su}}" direction="out"/>
+    </method>
+  </interface>
+</node>
+"""
+
+UNIT_INTROSPECTION = f"""
+<node>
+  <interface name="{UNIT_IFACE}">
+    <property name="Id" type="s" access="read"/>
+    <property name="ActiveState" type="s" access="read"/>
+    <property name="SubState" type="s" access="read"/>
+    <property name="UnitFileState" type="s" access="read"/>
+  </interface>
+</node>
+"""
+
+_SUB_STATES = {"active": "running", "activating": "start", "deactivating": "stop",
+               "inactive": "dead", "failed": "failed"}
+
+
+def unit_path(name):
+    """Object path of a unit, escaped the way systemd does it."""
+    escaped = "".join(c if c.isalnum() else f"_{ord(c):02x}" for c in name)
+    return f"{SYSTEMD_PATH}/unit/{escaped}"
+
+
+class MockSystemd:
+    """Units with an ActiveState and UnitFileState, served under SYSTEMD_PATH."""
+
+    def __init__(self, bus, units, delay=DEFAULT_DELAY):
+        self.bus = bus
+        self.delay = delay
+        self.units = {name: {"active": "inactive", "file": "disabled"} for name in units}
+        self.calls = {}
+        self.job = 0
+        manager_info = Gio.DBusNodeInfo.new_for_xml(INTROSPECTION)
+        for iface in manager_info.interfaces:
+            bus.register_object(SYSTEMD_PATH, iface, self._on_manager_call, None, None)
+        self.unit_info = Gio.DBusNodeInfo.new_for_xml(UNIT_INTROSPECTION).interfaces[0]
+        for name in self.units:
+            bus.register_object(unit_path(name), self.unit_info, None, self._get_property, None)
+
+    def _unit_for_path(self, path):
+        return next(name for name in self.units if unit_path(name) == path)
+
+    def _get_property(self, bus, sender, path, iface, prop):
+        name = self._unit_for_path(path)
+        unit = self.units[name]
+        value = {"Id": name, "ActiveState": unit["active"], "SubState": _SUB_STATES[unit["active"]],
+                 "UnitFileState": unit["file"]}[prop]
+        return GLib.Variant("s", value)
+
+    def set_active(self, name, state):
+        if self.units[name]["active"] == state:
+            return
+        self.units[name]["active"] = state
+        changed = {"ActiveState": GLib.Variant("s", state), "SubState": GLib.Variant("s", _SUB_STATES[state])}
+        self.bus.emit_signal(None, unit_path(name), "org.freedesktop.DBus.Properties", "PropertiesChanged",
+                             GLib.Variant("(sa{sv}as)", (UNIT_IFACE, changed, [])))
+
+    def _transition(self, name, through, final):
+        self.set_active(name, through)
+
+        def done():
+            self.set_active(name, final)
+            return GLib.SOURCE_REMOVE
+
+        GLib.timeout_add(int(self.delay * 1000), done)
+
+    def _new_job(self):
+        self.job += 1
+        return f"{SYSTEMD_PATH}/job/{self.job}"
+
+    def _on_manager_call(self, bus, sender, path, iface, method, params, invocation):
+        self.calls[method] = self.calls.get(method, 0) + 1
+        args = params.unpack()
+        if method in ("LoadUnit", "GetUnit", "StartUnit", "StopUnit", "RestartUnit", "GetUnitFileState",
+                      "SetActiveState") and args[0] not in self.units:
+            invocation.return_dbus_error("org.freedesktop.systemd1.NoSuchUnit", f"Unit {args[0]} not found.")
+            return
+
+        if method in ("Subscribe", "Reload"):
+            invocation.return_value(None)
+        elif method in ("LoadUnit", "GetUnit"):
+            invocation.return_value(GLib.Variant("(o)", (unit_path(args[0]),)))
+        elif method == "StartUnit":
+            if self.units[args[0]]["active"] != "active":
+                self._transition(args[0], "activating", "active")
+            invocation.return_value(GLib.Variant("(o)", (self._new_job(),)))
+        elif method == "StopUnit":
+            if self.units[args[0]]["active"] != "inactive":
+                self._transition(args[0], "deactivating", "inactive")
+            invocation.return_value(GLib.Variant("(o)", (self._new_job(),)))
+        elif method == "RestartUnit":
+            self._transition(args[0], "activating", "active")
+            invocation.return_value(GLib.Variant("(o)", (self._new_job(),)))
+        elif method == "EnableUnitFiles":
+            changes = []
+            for name in args[0]:
+                if name in self.units and self.units[name]["file"] != "enabled":
+                    self.units[name]["file"] = "enabled"
+                    changes.append(("symlink", name, name))
+            invocation.return_value(GLib.Variant("(ba(sss))", (False, changes)))
+        elif method == "DisableUnitFiles":
+            changes = []
+            for name in args[0]:
+                if name in self.units and self.units[name]["file"] != "disabled":
+                    self.units[name]["file"] = "disabled"
+                    changes.append(("unlink", name, ""))
+            invocation.return_value(GLib.Variant("(a(sss))", (changes,)))
+        elif method == "GetUnitFileState":
+            invocation.return_value(GLib.Variant("(s)", (self.units[args[0]]["file"],)))
+        elif method == "SetActiveState":
+            self.set_active(args[0], args[1])
+            invocation.return_value(None)
+        elif method == "Calls":
+            invocation.return_value(GLib.Variant("(a{su})", (self.calls,)))
+
+
+def connect(address):
+    return Gio.DBusConnection.new_for_address_sync(
+        address,
+        Gio.DBusConnectionFlags.AUTHENTICATION_CLIENT | Gio.DBusConnectionFlags.MESSAGE_BUS_CONNECTION,
+        None, None,
+    )
+
+
+def serve(address, units, delay):
+    bus = connect(address)
+    MockSystemd(bus, units, delay)
+    reply = bus.call_sync("org.freedesktop.DBus", "/org/freedesktop/DBus", "org.freedesktop.DBus",
+                          "RequestName", GLib.Variant("(su)", (SYSTEMD_BUS_NAME, 4)),  # DO_NOT_QUEUE
+                          None, Gio.DBusCallFlags.NONE, -1, None)
+    if reply.unpack()[0] != 1:  # PRIMARY_OWNER
+        print(f"Could not own {SYSTEMD_BUS_NAME}", file=sys.stderr)
+        return 1
+    print("ready", flush=True)
+    GLib.MainLoop().run()
+    return 0
+
+
+# --- Checks ---
+
+def wait_for(condition, timeout=STEP_TIMEOUT):
+    """Runs the main loop until condition() holds. Returns seconds waited, or None."""
+    context = GLib.MainContext.default()
+    start = time.monotonic()
+    while not condition():
+        if time.monotonic() - start > timeout:
+            return None
+        context.iteration(False) or time.sleep(0.005)
+    return round(time.monotonic() - start, 4)
+
+
+def start_bus():
+    """A private dbus-daemon. Returns (process, address)."""
+    proc = subprocess.Popen(["dbus-daemon", "--session", "--nofork", "--print-address=1"],
+                            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+    address = proc.stdout.readline().strip()
+    if not address:
+        proc.kill()
+        raise RuntimeError("dbus-daemon did not start")
+    return proc, address
+
+
+def check(units, delay):
+    bus_proc, address = start_bus()
+    mock_proc = None
+    try:
+        mock_proc = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), "serve", "--address", address,
+             "--delay", str(delay), "--units", *units],
+            stdout=subprocess.PIPE, text=True,
+        )
+        if mock_proc.stdout.readline().strip() != "ready":
+            raise RuntimeError("mock systemd did not start")
+        return run_checks(address, units)
+    finally:
+        for proc in (mock_proc, bus_proc):
+            if proc is not None:
+                proc.terminate()
+                proc.wait()
+
+
+def run_checks(address, units):
+    seen = []
+    client = SystemdUnits(units, lambda unit, state: seen.append((unit, state)), bus_address=address)
+    control = connect(address)
+
+    def mock_call(iface, method, params=None):
+        return control.call_sync(SYSTEMD_BUS_NAME, SYSTEMD_PATH, iface, method, params,
+                                 None, Gio.DBusCallFlags.NONE, -1, None).unpack()
+
+    def file_state(unit):
+        return mock_call(MANAGER_IFACE, "GetUnitFileState", GLib.Variant("(s)", (unit,)))[0]
+
+    def all_active():
+        return all(client.is_active(u) for u in units)
+
+    def none_active():
+        return not any(client.is_active(u) for u in units)
+
+    results = {"units": list(units), "steps": {}}
+
+    def step(name, action, condition, extra=None):
+        del seen[:]
+        action()
+        waited = wait_for(condition)
+        ok = waited is not None and (extra is None or extra())
+        results["steps"][name] = {"ok": ok, "seconds": waited, "signals": [list(s) for s in seen]}
+        return ok
+
+    results["initial"] = {"ok": none_active(), "states": dict(client.states)}
+    step("enable_and_start", lambda: client.enable_and_start(units), all_active,
+         lambda: all(file_state(u) == "enabled" for u in units))
+    step("restart", lambda: client.restart(units),
+         lambda: all_active() and all((u, "activating") in seen for u in units))
+    failing = units[0]
+    step("external_failure",
+         lambda: mock_call(MOCK_IFACE, "SetActiveState", GLib.Variant("(ss)", (failing, "failed"))),
+         lambda: not client.is_active(failing),
+         lambda: client.states[failing] == "failed")
+    step("stop_and_disable", lambda: client.stop_and_disable(units), none_active,
+         lambda: all(file_state(u) == "disabled" for u in units))
+
+    # Manager calls the client made (one Subscribe/LoadUnit per unit at startup)
+    results["calls"] = mock_call(MOCK_IFACE, "Calls")[0]
+    results["ok"] = results["initial"]["ok"] and all(s["ok"] for s in results["steps"].values())
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("command", nargs="?", choices=("check", "serve"), default="check")
+    parser.add_argument("--address", help="Bus to serve on (serve)")
+    parser.add_argument("--units", nargs="+", default=list(DEFAULT_UNITS))
+    parser.add_argument("--delay", type=float, default=DEFAULT_DELAY,
+                        help=f"Seconds units spend (de)activating (default: {DEFAULT_DELAY})")
+    args = parser.parse_args(argv)
+
+    if args.command == "serve":
+        if not args.address:
+            parser.error("serve needs --address")
+        return serve(args.address, args.units, args.delay)
+
+    result = check(args.units, args.delay)
+    print(json.dumps(result, indent=2))
+    return 0 if result["ok"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,8 @@
+#!/usr/bin/env python3
+# Entry point for the `cdsync` command (install.sh links it into ~/.local/bin)
+import sys
+
+from cdsync.cli import main
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -11,6 +11,40 @@ else
     exit 1
 fi
 
+# 2a. Select the Sync Pair (cdsync/pairs.py)
+# --pair NAME (or CDSYNC_PAIR) picks one of SYNC_PAIRS; its PAIR_<name>_*
+# settings replace the default pair's. Lock, log and state files get the
+# pair's name unless set explicitly.
+for ((i = 1; i < $#; i++)); do
+    if [ "${!i}" = "--pair" ]; then
+        j=$((i + 1))
+        CDSYNC_PAIR="${!j}"
+    fi
+done
+[ "$CDSYNC_PAIR" = "default" ] && CDSYNC_PAIR=""
+if [ -n "$CDSYNC_PAIR" ]; then
+    if [[ ! "$CDSYNC_PAIR" =~ ^[A-Za-z0-9_]+$ ]] || [[ " $SYNC_PAIRS " != *" $CDSYNC_PAIR "* ]]; then
+        echo "ERROR: Unknown sync pair '$CDSYNC_PAIR' (not in SYNC_PAIRS)"
+        exit 1
+    fi
+    PAIR_VAR="PAIR_${CDSYNC_PAIR}_REMOTE"; RCLONE_REMOTE="${!PAIR_VAR}"
+    PAIR_VAR="PAIR_${CDSYNC_PAIR}_LOCAL"; LOCAL_SYNC_DIR="${!PAIR_VAR}"
+    # Named after the default pair's lock (or its fallback, see 4. below)
+    PAIR_LOCK_BASE="${LOCK_FILE:-/tmp/cdsync_default.lock}"
+    PAIR_VAR="PAIR_${CDSYNC_PAIR}_LOCK_FILE"; LOCK_FILE="${!PAIR_VAR:-${PAIR_LOCK_BASE%.lock}-$CDSYNC_PAIR.lock}"
+    PAIR_VAR="PAIR_${CDSYNC_PAIR}_LOG_FILE"; CUSTOM_LOG_FILE="${!PAIR_VAR:-$BASE_DIR/cdsync-$CDSYNC_PAIR.log}"
+    [ -n "$METRICS_TEXTFILE" ] && METRICS_TEXTFILE="${METRICS_TEXTFILE%.prom}-$CDSYNC_PAIR.prom"
+    if [ -z "$RCLONE_REMOTE" ] || [ -z "$LOCAL_SYNC_DIR" ]; then
+        echo "ERROR: Sync pair '$CDSYNC_PAIR' needs PAIR_${CDSYNC_PAIR}_REMOTE and PAIR_${CDSYNC_PAIR}_LOCAL"
+        exit 1
+    fi
+    # The Python helpers keep their state per pair (cdsync/status.py)
+    export CDSYNC_PAIR
+elif [ -z "$RCLONE_REMOTE" ] || [ -z "$LOCAL_SYNC_DIR" ]; then
+    # Only SYNC_PAIRS configured: there is no default pair to sync
+    DEFAULT_PAIR_UNSET=true
+fi
+
 # 3. Define Log File
 LOG_FILE="${CUSTOM_LOG_FILE:-$BASE_DIR/cdsync.log}"
 
@@ -47,29 +81,169 @@ send_notification() {
 }
 
 # --- FILTER LOGIC ---
+# A pair's own filter-rules-<name>.txt replaces the shared one
 FILTER_FLAGS=""
-if [ -f "$BASE_DIR/filter-rules.txt" ]; then
+if [ -n "$CDSYNC_PAIR" ] && [ -f "$BASE_DIR/filter-rules-$CDSYNC_PAIR.txt" ]; then
+    FILTER_FLAGS="--filter-from $BASE_DIR/filter-rules-$CDSYNC_PAIR.txt"
+elif [ -f "$BASE_DIR/filter-rules.txt" ]; then
     FILTER_FLAGS="--filter-from $BASE_DIR/filter-rules.txt"
 fi
 
+# --- RESOURCE LIMITS ---
+# Runs started by the watcher get their share of the global MAX_TRANSFERS
+# and BWLIMIT (cdsync/scheduler.py), from the schedule window in force
+# (cdsync/schedule.py); other runs are alone and get all of the window's.
+if [ -z "$CDSYNC_BWLIMIT" ] && [ -n "$SCHEDULE_WINDOWS" ]; then
+    IFS=$'\t' read -r _ SCHEDULE_BWLIMIT SCHEDULE_TRANSFERS < <(PYTHONPATH="$BASE_DIR" python3 -m cdsync.schedule active 2>/dev/null)
+    [ -n "$SCHEDULE_BWLIMIT" ] && BWLIMIT="$SCHEDULE_BWLIMIT"
+    [ "${SCHEDULE_TRANSFERS:-0}" != "0" ] && MAX_TRANSFERS="$SCHEDULE_TRANSFERS"
+fi
+RUN_MAX_TRANSFERS="${CDSYNC_MAX_TRANSFERS:-$MAX_TRANSFERS}"
+RUN_BWLIMIT="${CDSYNC_BWLIMIT:-$BWLIMIT}"
+LIMIT_FLAGS=""
+if [ -n "$RUN_BWLIMIT" ]; then
+    LIMIT_FLAGS="--bwlimit $RUN_BWLIMIT"
+fi
+
 # Log Function
 log() {
     echo "$(date '+%Y-%m-%d %H:%M:%S') - $1" >> "$LOG_FILE"
 }
 
+# --- Status Helper ---
+# Publishes live state to the watcher's status socket (tray, `cdsync status`).
+# Silently does nothing when the watcher (hub) is not running.
+publish_status() {
+    PYTHONPATH="$BASE_DIR" python3 -m cdsync.status publish "$@" >/dev/null 2>&1
+}
+
+# Follows an rclone log in the background and publishes transfer progress
+start_progress_relay() {
+    PYTHONPATH="$BASE_DIR" python3 -m cdsync.status relay "$1" --parent $$ >/dev/null 2>&1 &
+    RELAY_PID=$!
+}
+
+stop_progress_relay() {
+    if [ -n "$RELAY_PID" ]; then
+        kill "$RELAY_PID" 2>/dev/null
+        RELAY_PID=""
+    fi
+}
+
+# --- Manifest Helper ---
+# Records what a successful run synced in the local manifest
+# (cdsync/manifest.py), which the watcher uses to find offline changes.
+update_manifest() {
+    PYTHONPATH="$BASE_DIR" python3 -m cdsync.manifest "$1" "$LOCAL_SYNC_DIR" >/dev/null 2>&1
+}
+
+# --- Bisync State Helpers ---
+# Snapshots of bisync's listings after each successful run, put back on
+# "Must run --resync" before resorting to a full resync
+# (cdsync/bisyncstate.py). restore_bisync_state prints the snapshot name.
+save_bisync_state() {
+    PYTHONPATH="$BASE_DIR" python3 -m cdsync.bisyncstate save "$RCLONE_REMOTE" "$LOCAL_SYNC_DIR" >/dev/null 2>&1
+}
+
+restore_bisync_state() {
+    local line
+    PYTHONPATH="$BASE_DIR" python3 -m cdsync.bisyncstate restore "$RCLONE_REMOTE" "$LOCAL_SYNC_DIR" 2>&1 \
+        | while IFS= read -r line; do
+            case "$line" in
+                WARNING:*) log "$line" ;;
+                *) echo "$line" ;;
+            esac
+        done
+}
+
+# --- Tuning Helper ---
+# Transfers, checkers and chunk size for the next run, chosen from the
+# previous runs' statistics (cdsync/tuning.py, bounds in config.env).
+tune_flags() {
+    PYTHONPATH="$BASE_DIR" python3 -m cdsync.tuning flags "$1" \
+        ${RUN_MAX_TRANSFERS:+--max-transfers "$RUN_MAX_TRANSFERS"} 2>/dev/null \
+        || echo "--transfers ${RUN_MAX_TRANSFERS:-8}"
+}
+
+# --- Run Log Helper ---
+# One pass over a finished run's rclone log ($1, JSON records): appends it to
+# the CDSync log as text and records the tray activity; with "--tune PROFILE"
+# it also measures the run for auto-tuning (and logs the next settings), with
+# "--ignore" it sends the Smart Ignore entries, with "--report" it logs the
+# per-file results of the paths on stdin (cdsync/rclonelog.py). It adds the
+# files and bytes to RUN_RECORD for metrics ("--resync": a resync's log).
+# RESYNC_REQUIRED tells whether bisync asked for a --resync.
+# Should that fail, the raw log is still appended.
+digest_log() {
+    local rclone_log="$1" digest
+    shift
+    if digest=$(PYTHONPATH="$BASE_DIR" python3 -m cdsync.rclonelog digest "$rclone_log" "$LOG_FILE" \
+            "$LOCAL_SYNC_DIR" --started "$RUN_STARTED_AT" ${RUN_RECORD:+--record "$RUN_RECORD"} "$@" \
+            2>/dev/null); then
+        [ "$digest" = "resync-required" ] && RESYNC_REQUIRED=true || RESYNC_REQUIRED=false
+    else
+        cat "$rclone_log" >> "$LOG_FILE"
+        grep -q "Must run --resync" "$rclone_log" && RESYNC_REQUIRED=true || RESYNC_REQUIRED=false
+    fi
+}
+
+# --- Metrics Helper ---
+# Appends one record per run to the metrics JSON-lines file and refreshes the
+# Prometheus textfile (cdsync/metrics.py). $1 exit code, then extra options.
+record_metrics() {
+    local code="$1"
+    shift
+    PYTHONPATH="$BASE_DIR" python3 -m cdsync.metrics record --mode "$RUN_MODE" \
+        --started "${METRICS_STARTED_AT:-$(date +%s)}" --exit-code "$code" \
+        ${RUN_RECORD:+--run-record "$RUN_RECORD"} \
+        ${METRICS_TEXTFILE:+--textfile "$METRICS_TEXTFILE"} "$@" >/dev/null 2>&1
+}
+
+# --- Log Rotation Helper ---
+# Archives the log into compressed, indexed segments once it is over
+# LOG_MAX_MB or LOG_MAX_AGE_DAYS (cdsync/logarchive.py). Only called while
+# the lock is held, so no run is writing to it.
+rotate_log() {
+    PYTHONPATH="$BASE_DIR" python3 -m cdsync.logarchive rotate "$LOG_FILE" >/dev/null 2>&1
+}
+
+# rclone remote control on the socket the watcher gave this run, so it can
+# change the bandwidth of the running rclone when the schedule window
+# changes. Each rclone process binds it anew.
+rc_flags() {
+    [ -n "$CDSYNC_RC_SOCKET" ] || return 0
+    rm -f "$CDSYNC_RC_SOCKET"
+    echo "--rc --rc-addr unix://$CDSYNC_RC_SOCKET --rc-no-auth"
+}
+
+# --- Engine Helper ---
+# With SYNC_ENGINE=rcd, operations go to the watcher's long-lived
+# `rclone rcd` (cdsync/rcd.py). Exit code 125 means it is not running or
+# the command is not supported: a fresh rclone process is used instead.
+rclone_op() {
+    if [ "$SYNC_ENGINE" = "rcd" ]; then
+        PYTHONPATH="$BASE_DIR" python3 -m cdsync.rcd run "$@"
+        local code=$?
+        [ $code -ne 125 ] && return $code
+    fi
+    rclone "$@" $(rc_flags)
+}
+
 # 4. Lock Mechanism (Mutex)
 if [ -z "$LOCK_FILE" ]; then
     LOCK_FILE="/tmp/cdsync_default.lock"
     log "WARNING: LOCK_FILE not set in config. Using default: $LOCK_FILE"
 fi
 
-# Smart Ignore List
-IGNORE_LIST="/tmp/cdsync_smart_ignore.list"
-
 # Check for manual resync request
 FORCE_RESYNC=false
 DIR_EVENT=false
 SMART_SYNC_PATH=""
+SMART_SYNC_BATCH=false
+DIR_SYNC=false
+MOVE_SYNC=false
+
+CORE_ARGS=("$@")
 
 # Parse Arguments
 for arg in "$@"; do
@@ -82,6 +256,23 @@ for arg in "$@"; do
             SMART_SYNC_PATH="$2"
             shift 2
             ;;
+        --smart-sync-batch)
+            # Absolute paths, one per line, on stdin (sent by the watcher)
+            SMART_SYNC_BATCH=true
+            shift
+            ;;
+        --dir-sync)
+            # Subtrees on stdin, "+ rel/dir" (upload) or "- rel/dir" (purge),
+            # planned by the watcher (see cdsync/dirsync.py)
+            DIR_SYNC=true
+            shift
+            ;;
+        --moves)
+            # Renames on stdin, "from<TAB>to" (relative), paired by the
+            # watcher from inotify move events (see cdsync/watcher.py)
+            MOVE_SYNC=true
+            shift
+            ;;
         --dir-event)
             DIR_EVENT=true
             SMART_SYNC_PATH="$2" # We use this just for logging if needed
@@ -92,16 +283,140 @@ for arg in "$@"; do
             DEDUPE_MODE="$2"
             shift 2
             ;;
+        --sync-now)
+            # User-requested full sync (tray): same run, higher priority
+            shift
+            ;;
+        --pair)
+            # Read above (2a)
+            shift 2
+            ;;
         *)
             # shift
             ;;
     esac
 done
 
+# A full sync naming no pair also covers SYNC_PAIRS when no watcher runs
+# (see below); every other run needs the default pair
+ALL_PAIRS_SYNC=false
+if [ -z "$CDSYNC_PAIR" ] && [ -n "$SYNC_PAIRS" ] && [ "$FORCE_RESYNC" != "true" ] \
+        && [ -z "$DEDUPE_MODE" ] && [ -z "$SMART_SYNC_PATH" ] && [ "$SMART_SYNC_BATCH" != "true" ] \
+        && [ "$DIR_SYNC" != "true" ] && [ "$MOVE_SYNC" != "true" ]; then
+    ALL_PAIRS_SYNC=true
+fi
+if [ "$DEFAULT_PAIR_UNSET" = "true" ] && [ "$ALL_PAIRS_SYNC" != "true" ]; then
+    echo "ERROR: RCLONE_REMOTE and LOCAL_SYNC_DIR are not set. Use --pair NAME for one of SYNC_PAIRS."
+    exit 1
+fi
+
+# Hand the run to the watcher's scheduler (cdsync/scheduler.py), which
+# queues it by priority and merges it with pending work. Runs it starts
+# itself carry CDSYNC_SCHEDULED; without a watcher we run right here.
+if [ -z "$CDSYNC_SCHEDULED" ] && [ "$SMART_SYNC_BATCH" != "true" ] && [ "$DIR_SYNC" != "true" ] \
+        && [ "$MOVE_SYNC" != "true" ]; then
+    if PYTHONPATH="$BASE_DIR" python3 -m cdsync.scheduler submit "${CORE_ARGS[@]}" >/dev/null 2>&1; then
+        exit 0
+    fi
+
+    # No watcher: a full sync naming no pair covers the other pairs too,
+    # one after the other (each with its own lock), then the default pair
+    if [ "$ALL_PAIRS_SYNC" = "true" ]; then
+        PAIRS_EXIT=0
+        for PAIR in $SYNC_PAIRS; do
+            CDSYNC_PAIR="$PAIR" /bin/bash "$BASE_DIR/cdsync-core.sh" "${CORE_ARGS[@]}" || PAIRS_EXIT=$?
+        done
+        if [ "$DEFAULT_PAIR_UNSET" = "true" ]; then
+            exit $PAIRS_EXIT
+        fi
+    fi
+fi
+
+# Read the batch BEFORE waiting for the lock, so the watcher never blocks
+# writing to our stdin while another sync runs
+if [ "$SMART_SYNC_BATCH" = "true" ]; then
+    UPLOAD_LIST=()
+    DELETE_LIST=()
+    while IFS= read -r CHANGED_FILE; do
+        [ -z "$CHANGED_FILE" ] && continue
+        if [[ "$CHANGED_FILE" != "$LOCAL_SYNC_DIR/"* ]]; then
+            continue # Outside sync dir
+        fi
+        REL_FILE="${CHANGED_FILE#$LOCAL_SYNC_DIR/}"
+        if [ -f "$CHANGED_FILE" ]; then
+            UPLOAD_LIST+=("$REL_FILE")
+        elif [ ! -e "$CHANGED_FILE" ]; then
+            DELETE_LIST+=("$REL_FILE")
+        fi
+    done
+    BATCH_SIZE=$(( ${#UPLOAD_LIST[@]} + ${#DELETE_LIST[@]} ))
+    if [ "$BATCH_SIZE" -eq 0 ]; then
+        exit 0
+    fi
+    SMART_SYNC_PATH="$BATCH_SIZE files"
+fi
+
+if [ "$DIR_SYNC" = "true" ]; then
+    COPY_DIRS=()
+    PURGE_DIRS=()
+    while IFS= read -r SCOPE_LINE; do
+        SCOPE_REL="${SCOPE_LINE:2}"
+        [ -z "$SCOPE_REL" ] && continue
+        case "${SCOPE_LINE:0:1}" in
+            +) COPY_DIRS+=("$SCOPE_REL") ;;
+            -) PURGE_DIRS+=("$SCOPE_REL") ;;
+        esac
+    done
+    SCOPE_COUNT=$(( ${#COPY_DIRS[@]} + ${#PURGE_DIRS[@]} ))
+    if [ "$SCOPE_COUNT" -eq 0 ]; then
+        exit 0
+    fi
+    SMART_SYNC_PATH="$SCOPE_COUNT directories"
+fi
+
+if [ "$MOVE_SYNC" = "true" ]; then
+    MOVE_SRCS=()
+    MOVE_DSTS=()
+    while IFS=$'\t' read -r MOVE_SRC MOVE_DST; do
+        [ -z "$MOVE_SRC" ] || [ -z "$MOVE_DST" ] && continue
+        MOVE_SRCS+=("$MOVE_SRC")
+        MOVE_DSTS+=("$MOVE_DST")
+    done
+    if [ ${#MOVE_SRCS[@]} -eq 0 ]; then
+        exit 0
+    fi
+    SMART_SYNC_PATH="${#MOVE_SRCS[@]} moves"
+fi
+
+# Run mode as reported on the status socket
+if [ -n "$DEDUPE_MODE" ]; then
+    RUN_MODE="dedupe"
+elif [ "$FORCE_RESYNC" = "true" ]; then
+    RUN_MODE="resync"
+elif [ "$DIR_EVENT" = "true" ] || [ "$DIR_SYNC" = "true" ] || [ "$MOVE_SYNC" = "true" ]; then
+    RUN_MODE="dir-event"
+elif [ -n "$SMART_SYNC_PATH" ]; then
+    RUN_MODE="smart"
+else
+    RUN_MODE="periodic"
+fi
+
 exec 200>"$LOCK_FILE"
 
 # LOCKING STRATEGY
-if [ -n "$SMART_SYNC_PATH" ]; then
+if [ -n "$CDSYNC_SCHEDULED" ]; then
+    # Started by the scheduler, which runs one job at a time: only a run
+    # outside the watcher can hold the lock, so waiting is bounded.
+    flock 200
+elif [ "$SMART_SYNC_BATCH" = "true" ]; then
+    # Batch Smart Sync: WAIT
+    # One process per batch (not per file), so waiting is bounded and no
+    # change is lost to a "System busy" skip.
+    log "WAIT: Queued behind active sync (Smart Sync Batch)..."
+    publish_status queue --delta 1
+    flock 200
+    publish_status queue --delta -1
+elif [ -n "$SMART_SYNC_PATH" ]; then
     # *** DISABLED ***
     # Shallow Sync (Smart): QUEUE/WAIT
     # We use a blocking lock. This script will PAUSE here until the lock is released.
@@ -111,23 +426,53 @@ if [ -n "$SMART_SYNC_PATH" ]; then
     # *** ENABLED ***
     # Shallow Sync (Smart): SKIP IF BUSY
     # Prevent "Thundering Herd" from backup software like Duplicati
-    flock -n 200 || { log "SKIP: Smart Sync ignored (System busy). Will be picked up by Timer."; exit 0; }
-elif [ "$DIR_EVENT" = "true" ]; then
+    flock -n 200 || {
+        log "SKIP: Smart Sync ignored (System busy). Will be picked up by Timer."
+        record_metrics 0 --result skipped
+        exit 0
+    }
+elif [ "$DIR_EVENT" = "true" ] || [ "$DIR_SYNC" = "true" ] || [ "$MOVE_SYNC" = "true" ]; then
     # Directory Event: WAIT
     # Full Bisync triggered by directory change. Needs to wait.
     log "WAIT: Queued behind active sync (Dir Event)..."
+    publish_status queue --delta 1
     flock 200
+    publish_status queue --delta -1
 elif [ "$FORCE_RESYNC" = "true" ]; then
     # Force Resync: WAIT
     log "WAIT: Queued behind active sync..."
+    publish_status queue --delta 1
     flock 200
+    publish_status queue --delta -1
 else
     # Timer (Periodic): SKIP
-    flock -n 200 || { log "SKIP: Instance already running (Lock detected)."; exit 0; }
+    flock -n 200 || {
+        log "SKIP: Instance already running (Lock detected)."
+        record_metrics 0 --result skipped
+        exit 0
+    }
 fi
 
+# Files, bytes and resyncs of this run: each log digest adds to its record
+METRICS_STARTED_AT=$(date +%s.%N)
+RUN_RECORD=$(mktemp)
+
 log "--- STARTING SYNC ($RCLONE_REMOTE <-> $LOCAL_SYNC_DIR) ---"
 
+publish_status start --mode "$RUN_MODE" --target "$SMART_SYNC_PATH"
+RUN_STARTED_AT=$(date +%s)
+
+# Report the outcome on every exit path
+on_exit() {
+    local code=$?
+    stop_progress_relay
+    publish_status finish --exit-code "${EXIT_CODE:-$code}"
+    record_metrics "${EXIT_CODE:-$code}"
+    rm -f "$RUN_RECORD"
+    rotate_log
+}
+trap on_exit EXIT
+
 # 5. Execute Rclone Bisync with AUTO-HEALING
 
 # Define Rclone Config Path (Default or Custom)
@@ -152,14 +497,20 @@ run_rclone() {
         CONFLICT_FLAGS="" # Rclone default (creates .conflict files)
     fi
 
-    rclone bisync "$RCLONE_REMOTE" "$LOCAL_SYNC_DIR" \
+    start_progress_relay "$OUTPUT_LOG"
+    RUN_STARTED_AT=$(date +%s)
+
+    rclone_op bisync "$RCLONE_REMOTE" "$LOCAL_SYNC_DIR" \
         --config "$RCLONE_CONFIG" \
         --log-format date,time \
+        --use-json-log \
         --log-file "$OUTPUT_LOG" \
+        --stats 5s \
+        --stats-one-line \
         --drive-acknowledge-abuse \
         --fast-list \
-        --checkers 16 \
-        --transfers 8 \
+        $(tune_flags bisync) \
+        $LIMIT_FLAGS \
         $CONFLICT_FLAGS \
         --create-empty-src-dirs \
         $FILTER_FLAGS \
@@ -167,21 +518,13 @@ run_rclone() {
         --verbose
     
     EXIT_CODE=$?
+    stop_progress_relay
     
-    # Generate Smart Ignore List from Output Log
-    # We want to catch files that Rclone MODIFIED LOCALLY, which triggers inotify.
-    # 1. Bisync "Queue copy to Path2" (Remote->Local Download)
-    #    Format: "... - Path1 Queue copy to Path2 - path/to/file"
-    sed -n 's/.*Queue copy to Path2.*-\s*\(.*\)/\1/p' "$OUTPUT_LOG" | while read -r line; do echo "$LOCAL_SYNC_DIR/$line" >> "$IGNORE_LIST"; done
-    
-    # 2. Standard Sync "Copied (new/replaced)" (Shallow Sync or Standard Rclone)
-    #    Format: "INFO : path/to/file: Copied (new)"
-    sed -n 's/.*INFO\s*:\s*\(.*\):\s*Copied.*/\1/p' "$OUTPUT_LOG" | while read -r line; do echo "$LOCAL_SYNC_DIR/$line" >> "$IGNORE_LIST"; done
-
-    # 3. Deleted files (prevent "delete" event loop if we just deleted it)
-    #    Format: "... - Path2 Deleted - path" (Bisync) OR "INFO : path: Deleted" (Standard)
-    sed -n 's/.*Path2\s*Deleted.*-\s*\(.*\)/\1/p' "$OUTPUT_LOG" | while read -r line; do echo "$LOCAL_SYNC_DIR/$line" >> "$IGNORE_LIST"; done
-    sed -n 's/.*INFO\s*:\s*\(.*\):\s*Deleted.*/\1/p' "$OUTPUT_LOG" | while read -r line; do echo "$LOCAL_SYNC_DIR/$line" >> "$IGNORE_LIST"; done
+    # Smart Ignore: tell the watcher which files Rclone MODIFIED LOCALLY
+    # (downloads, copies, deletions), with their resulting size/mtime, so
+    # the inotify events they caused are not synced back. Same single pass
+    # as the log, activity and auto-tuning.
+    digest_log "$OUTPUT_LOG" --tune bisync --ignore ${extra_flags:+--resync}
     
     return $EXIT_CODE
 }
@@ -200,6 +543,255 @@ if [ "$DIR_EVENT" = "true" ]; then
     FORCE_RESYNC=false
 fi
 
+# --- 3a. SCOPED DIRECTORY SYNC (AFFECTED SUBTREES ONLY) ---
+# Only the subtrees the watcher planned are listed and reconciled; the
+# periodic timer still runs the full bisync.
+if [ "$DIR_SYNC" = "true" ]; then
+    log "INFO: 📂 Scoped Directory Sync: ${#COPY_DIRS[@]} to upload, ${#PURGE_DIRS[@]} to delete"
+    send_notification "Structure Change" "Syncing: $SCOPE_COUNT directories" "normal"
+
+    EXIT_CODE=0
+    start_progress_relay "$OUTPUT_LOG"
+    UPLOAD_FLAGS=$(tune_flags upload)
+
+    # New or moved-in directories: upload the subtree. `copy` never deletes
+    # on the remote, so files only present there are kept for the bisync.
+    for SCOPE_REL in "${COPY_DIRS[@]}"; do
+        [ -d "$LOCAL_SYNC_DIR/$SCOPE_REL" ] || continue
+        log "INFO: ⬆️ Directory Upload: $SCOPE_REL"
+        rclone_op copy "$LOCAL_SYNC_DIR/$SCOPE_REL" "$RCLONE_REMOTE/$SCOPE_REL" \
+            --create-empty-src-dirs \
+            $UPLOAD_FLAGS \
+            $LIMIT_FLAGS \
+            --config "$RCLONE_CONFIG" \
+            --log-format date,time \
+            --use-json-log \
+            --log-file "$OUTPUT_LOG" \
+            --drive-acknowledge-abuse \
+            --stats 5s \
+            --stats-one-line \
+            $FILTER_FLAGS \
+            --verbose
+        SCOPE_EXIT=$?
+        [ $EXIT_CODE -eq 0 ] && EXIT_CODE=$SCOPE_EXIT
+    done
+
+    # Deleted or moved-out directories: remove them remotely, unless they
+    # were recreated locally in the meantime
+    for SCOPE_REL in "${PURGE_DIRS[@]}"; do
+        [ -e "$LOCAL_SYNC_DIR/$SCOPE_REL" ] && continue
+        log "INFO: 🗑️ Directory Delete: $SCOPE_REL"
+        rclone_op purge "$RCLONE_REMOTE/$SCOPE_REL" \
+            --config "$RCLONE_CONFIG" \
+            --log-format date,time \
+            --use-json-log \
+            --log-file "$OUTPUT_LOG" \
+            --drive-acknowledge-abuse \
+            --verbose
+        SCOPE_EXIT=$?
+        # Exit code 3 (directory not found): already gone remotely, e.g.
+        # a directory that was never uploaded. Not a failure.
+        if [ $SCOPE_EXIT -ne 0 ] && [ $SCOPE_EXIT -ne 3 ]; then
+            [ $EXIT_CODE -eq 0 ] && EXIT_CODE=$SCOPE_EXIT
+        fi
+    done
+
+    stop_progress_relay
+    digest_log "$OUTPUT_LOG" --tune upload
+    rm -f "$OUTPUT_LOG"
+
+    if [ $EXIT_CODE -eq 0 ]; then
+        printf '%s\n' "${COPY_DIRS[@]}" "${PURGE_DIRS[@]}" | update_manifest synced
+        log "INFO: ✅ Scoped Directory Sync Success."
+        exit 0
+    else
+        log "ERROR: ❌ Scoped Directory Sync Failed. Full Bisync will reconcile on the next timer run."
+        send_notification "Sync Failed" "Check log for details." "critical"
+        exit $EXIT_CODE
+    fi
+fi
+
+# --- 3b. SERVER-SIDE MOVES (RENAMED FILES AND DIRECTORIES) ---
+# The remote copy is moved instead of uploaded again. Copying the new
+# place afterwards uploads only what differs (written before the rename,
+# or never uploaded); when the move fails (e.g. the source never reached
+# the remote), that copy uploads it and the old remote path is deleted.
+if [ "$MOVE_SYNC" = "true" ]; then
+    log "INFO: 🔀 Server-side Moves: ${#MOVE_SRCS[@]}"
+    send_notification "Smart Sync" "Moving: $SMART_SYNC_PATH" "normal"
+
+    EXIT_CODE=0
+    start_progress_relay "$OUTPUT_LOG"
+    UPLOAD_FLAGS=$(tune_flags upload)
+
+    for i in "${!MOVE_SRCS[@]}"; do
+        MOVE_SRC="${MOVE_SRCS[$i]}"
+        MOVE_DST="${MOVE_DSTS[$i]}"
+        if rclone_op moveto "$RCLONE_REMOTE/$MOVE_SRC" "$RCLONE_REMOTE/$MOVE_DST" \
+            $LIMIT_FLAGS \
+            --config "$RCLONE_CONFIG" \
+            --log-format date,time \
+            --use-json-log \
+            --log-file "$OUTPUT_LOG" \
+            --drive-acknowledge-abuse \
+            --verbose; then
+            log "INFO: 🔀 Moved: $MOVE_SRC -> $MOVE_DST"
+            MOVED=true
+        else
+            log "WARNING: Server-side move failed: $MOVE_SRC -> $MOVE_DST. Uploading instead."
+            MOVED=false
+        fi
+
+        # Gone again locally: a later batch deletes it
+        if [ -d "$LOCAL_SYNC_DIR/$MOVE_DST" ]; then
+            rclone_op copy "$LOCAL_SYNC_DIR/$MOVE_DST" "$RCLONE_REMOTE/$MOVE_DST" \
+                --create-empty-src-dirs \
+                $UPLOAD_FLAGS \
+                $LIMIT_FLAGS \
+                --config "$RCLONE_CONFIG" \
+                --log-format date,time \
+                --use-json-log \
+                --log-file "$OUTPUT_LOG" \
+                --drive-acknowledge-abuse \
+                --stats 5s \
+                --stats-one-line \
+                $FILTER_FLAGS \
+                --verbose
+            STEP_EXIT=$?
+            if [ "$MOVED" = "false" ]; then
+                rclone_op purge "$RCLONE_REMOTE/$MOVE_SRC" \
+                    --config "$RCLONE_CONFIG" \
+                    --log-format date,time \
+                    --use-json-log \
+                    --log-file "$OUTPUT_LOG" \
+                    --drive-acknowledge-abuse \
+                    --verbose
+            fi
+        elif [ -f "$LOCAL_SYNC_DIR/$MOVE_DST" ]; then
+            printf '%s\n' "$MOVE_DST" | rclone_op copy "$LOCAL_SYNC_DIR" "$RCLONE_REMOTE" \
+                --files-from-raw - \
+                --no-traverse \
+                $UPLOAD_FLAGS \
+                $LIMIT_FLAGS \
+                --config "$RCLONE_CONFIG" \
+                --log-format date,time \
+                --use-json-log \
+                --log-file "$OUTPUT_LOG" \
+                --drive-acknowledge-abuse \
+                --stats 5s \
+                --stats-one-line \
+                --verbose
+            STEP_EXIT=$?
+            if [ "$MOVED" = "false" ]; then
+                printf '%s\n' "$MOVE_SRC" | rclone_op delete "$RCLONE_REMOTE" \
+                    --files-from-raw - \
+                    --config "$RCLONE_CONFIG" \
+                    --log-format date,time \
+                    --use-json-log \
+                    --log-file "$OUTPUT_LOG" \
+                    --drive-acknowledge-abuse \
+                    --verbose
+            fi
+        else
+            STEP_EXIT=0
+        fi
+        # Only the upload decides: a failed delete of a path the remote
+        # never had is no failure
+        [ $EXIT_CODE -eq 0 ] && EXIT_CODE=$STEP_EXIT
+    done
+
+    stop_progress_relay
+    digest_log "$OUTPUT_LOG" --tune upload
+    rm -f "$OUTPUT_LOG"
+
+    if [ $EXIT_CODE -eq 0 ]; then
+        printf '%s\n' "${MOVE_SRCS[@]}" "${MOVE_DSTS[@]}" | update_manifest synced
+        log "INFO: ✅ Move Sync Success."
+        exit 0
+    else
+        log "ERROR: ❌ Move Sync Failed. Full Bisync will reconcile on the next timer run."
+        send_notification "Sync Failed" "Check log for details." "critical"
+        exit $EXIT_CODE
+    fi
+fi
+
+# --- 4a. BATCH SMART SYNC (FILES ONLY, ONE RCLONE RUN) ---
+if [ "$SMART_SYNC_BATCH" = "true" ]; then
+    log "INFO: 🚀 Batch Sync triggered for ${#UPLOAD_LIST[@]} uploads, ${#DELETE_LIST[@]} deletions"
+    send_notification "Smart Sync" "Syncing: $BATCH_SIZE files" "normal"
+
+    EXIT_CODE=0
+    REPORT_LIST=("${UPLOAD_LIST[@]}" "${DELETE_LIST[@]}")
+
+    # Content-hash cache: files rewritten with identical bytes or only
+    # touched are not uploaded again (cdsync/manifest.py). They are
+    # reported as unchanged.
+    if [ ${#UPLOAD_LIST[@]} -gt 0 ] && [ "${HASH_CACHE:-true}" = "true" ]; then
+        declare -A SAME_CONTENT=()
+        while IFS= read -r REL_FILE; do
+            SAME_CONTENT["$REL_FILE"]=1
+        done < <(printf '%s\n' "${UPLOAD_LIST[@]}" | \
+            PYTHONPATH="$BASE_DIR" python3 -m cdsync.manifest unchanged "$LOCAL_SYNC_DIR" 2>/dev/null)
+        if [ ${#SAME_CONTENT[@]} -gt 0 ]; then
+            CHANGED_LIST=()
+            for REL_FILE in "${UPLOAD_LIST[@]}"; do
+                [ -z "${SAME_CONTENT[$REL_FILE]}" ] && CHANGED_LIST+=("$REL_FILE")
+            done
+            UPLOAD_LIST=("${CHANGED_LIST[@]}")
+            log "INFO: ⏸️ Content unchanged, upload skipped for ${#SAME_CONTENT[@]} files."
+        fi
+    fi
+
+    start_progress_relay "$OUTPUT_LOG"
+
+    # Upload every changed file in a single run with bounded parallelism.
+    # --no-traverse: only the listed files are checked on the remote.
+    if [ ${#UPLOAD_LIST[@]} -gt 0 ]; then
+        printf '%s\n' "${UPLOAD_LIST[@]}" | rclone_op copy "$LOCAL_SYNC_DIR" "$RCLONE_REMOTE" \
+            --files-from-raw - \
+            --no-traverse \
+            $(tune_flags upload) \
+            $LIMIT_FLAGS \
+            --config "$RCLONE_CONFIG" \
+            --log-format date,time \
+            --use-json-log \
+            --log-file "$OUTPUT_LOG" \
+            --drive-acknowledge-abuse \
+            --stats 5s \
+            --stats-one-line \
+            --verbose
+        EXIT_CODE=$?
+    fi
+
+    # Files gone locally are deleted remotely (like the per-file sync did)
+    if [ ${#DELETE_LIST[@]} -gt 0 ]; then
+        printf '%s\n' "${DELETE_LIST[@]}" | rclone_op delete "$RCLONE_REMOTE" \
+            --files-from-raw - \
+            --config "$RCLONE_CONFIG" \
+            --log-format date,time \
+            --use-json-log \
+            --log-file "$OUTPUT_LOG" \
+            --drive-acknowledge-abuse \
+            --verbose
+        DELETE_EXIT=$?
+        [ $EXIT_CODE -eq 0 ] && EXIT_CODE=$DELETE_EXIT
+    fi
+
+    stop_progress_relay
+    # Same pass: per-file results + summary line
+    printf '%s\n' "${REPORT_LIST[@]}" | digest_log "$OUTPUT_LOG" --tune upload --report
+    rm -f "$OUTPUT_LOG"
+
+    if [ $EXIT_CODE -eq 0 ]; then
+        log "INFO: ✅ Batch Sync Success."
+        exit 0
+    else
+        log "ERROR: ❌ Batch Sync Failed."
+        send_notification "Smart Sync Failed" "Check log for details." "critical"
+        exit $EXIT_CODE
+    fi
+fi
+
 # --- 4. SHALLOW SYNC LOGIC (FILE ONLY) ---
 if [ -n "$SMART_SYNC_PATH" ] && [ "$DIR_EVENT" != "true" ]; then
     # 3.1 Calculate Relative Directory
@@ -236,6 +828,14 @@ if [ -n "$SMART_SYNC_PATH" ] && [ "$DIR_EVENT" != "true" ]; then
     # Extract just the filename for Targeted Sync
     TARGET_FILE_NAME=$(basename "$SMART_SYNC_PATH")
     
+    if [ -f "$SMART_SYNC_PATH" ] && [ "${HASH_CACHE:-true}" = "true" ] && \
+            [ -n "$(echo "${SMART_SYNC_PATH#$LOCAL_SYNC_DIR/}" | \
+                PYTHONPATH="$BASE_DIR" python3 -m cdsync.manifest unchanged "$LOCAL_SYNC_DIR" 2>/dev/null)" ]; then
+        log "INFO: ⏸️ Content unchanged, upload skipped: $LOG_MSG$TARGET_FILE_NAME"
+        rm -f "$LOCK_FILE"
+        exit 0
+    fi
+
     log "INFO: 🚀 Targeted Sync triggered for: $LOG_MSG$TARGET_FILE_NAME"
     send_notification "Smart Sync" "Syncing: $TARGET_FILE_NAME" "normal"
 
@@ -245,14 +845,25 @@ if [ -n "$SMART_SYNC_PATH" ] && [ "$DIR_EVENT" != "true" ]; then
     # --filter "+ /NAME"    -> Matches the file itself.
     # --filter "- *"        -> Exclude everything else (Safety)
     
+    start_progress_relay "$OUTPUT_LOG"
+
     rclone sync "$LOCAL_TARGET" "$REMOTE_TARGET" \
         --filter "+ /$TARGET_FILE_NAME" \
         --filter "- *" \
+        $LIMIT_FLAGS \
+        $(rc_flags) \
         --config "$RCLONE_CONFIG" \
+        --use-json-log \
+        --log-file "$OUTPUT_LOG" \
         --drive-acknowledge-abuse \
-        --verbose >> "$LOG_FILE" 2>&1
+        --stats 5s \
+        --stats-one-line \
+        --verbose
 
     EXIT_CODE=$?
+    stop_progress_relay
+    digest_log "$OUTPUT_LOG"
+    rm -f "$OUTPUT_LOG"
     
     # Cleanup and Exit
     rm -f "$LOCK_FILE"
@@ -274,11 +885,11 @@ if [ "$FORCE_RESYNC" = "true" ]; then
     
     # Force resync
     if run_rclone "--resync"; then
-         cat "$OUTPUT_LOG" >> "$LOG_FILE"
+         update_manifest baseline
+         save_bisync_state
          log "MANUAL RESYNC SUCCESSFUL."
          send_notification "Resync Success" "Database repaired." "normal"
     else
-         cat "$OUTPUT_LOG" >> "$LOG_FILE"
          log "MANUAL RESYNC FAILED."
          send_notification "Resync Failed" "Check logs." "critical"
     fi
@@ -297,12 +908,14 @@ if [ -n "$DEDUPE_MODE" ]; then
     
     rclone dedupe "$DEDUPE_MODE" "$RCLONE_REMOTE" \
         --config "$RCLONE_CONFIG" \
+        --use-json-log \
+        --log-file "$OUTPUT_LOG" \
         --drive-acknowledge-abuse \
-        --verbose >> "$OUTPUT_LOG" 2>&1
+        --verbose
         
     EXIT_CODE=$?
     
-    cat "$OUTPUT_LOG" >> "$LOG_FILE"
+    digest_log "$OUTPUT_LOG"
     rm "$OUTPUT_LOG"
     
     if [ $EXIT_CODE -eq 0 ]; then
@@ -318,32 +931,58 @@ fi
 
 # Attempt 1: Normal Sync
 if run_rclone ""; then
-    # Success: Append output to main log
-    cat "$OUTPUT_LOG" >> "$LOG_FILE"
+    # Success (run_rclone already appended its output to the main log)
+    update_manifest clean
+    save_bisync_state
     log "SUCCESS: ✅ Synchronization completed."
 else
     # Failure: Analyze the error
-    cat "$OUTPUT_LOG" >> "$LOG_FILE"
     
     # Check specifically for the "Must run --resync" corruption error
-    if grep -q "Must run --resync" "$OUTPUT_LOG"; then
+    # (found by the log digest in run_rclone)
+    if [ "$RESYNC_REQUIRED" = "true" ]; then
         log "CRITICAL ERROR DETECTED: State corruption (likely due to interruption)."
-        log "INITIATING AUTO-HEALING (--resync)..."
-        
         send_notification "Database Corruption" "Repairing sync database automatically..." "critical"
-        
-        # Clear the temp log for the retry
-        truncate -s 0 "$OUTPUT_LOG"
-        
-        # Attempt 2: Resync (Auto-Healing)
-        if run_rclone "--resync"; then
-             cat "$OUTPUT_LOG" >> "$LOG_FILE"
-             log "RECOVERY SUCCESSFUL: Database repaired and synced."
-             send_notification "Recovery Success" "CDSync database repaired." "normal"
+        RECOVERED=false
+
+        # Attempt 2: Incremental bisync from the last good state snapshot.
+        # Changes since then are synced as usual; deleted files stay deleted.
+        RECOVERY_STARTED=$(date +%s)
+        SNAPSHOT=$(restore_bisync_state)
+        if [ -n "$SNAPSHOT" ]; then
+            log "INITIATING RECOVERY FROM STATE SNAPSHOT $SNAPSHOT..."
+            truncate -s 0 "$OUTPUT_LOG"
+            if run_rclone ""; then
+                update_manifest clean
+                save_bisync_state
+                RECOVERED=true
+                log "RECOVERY SUCCESSFUL: Restored state snapshot $SNAPSHOT and synced incrementally ($(( $(date +%s) - RECOVERY_STARTED ))s)."
+                send_notification "Recovery Success" "CDSync database restored from snapshot." "normal"
+            else
+                log "WARNING: Bisync from state snapshot $SNAPSHOT failed ($(( $(date +%s) - RECOVERY_STARTED ))s)."
+            fi
         else
-             cat "$OUTPUT_LOG" >> "$LOG_FILE"
-             log "RECOVERY FAILED: Manual intervention required."
-             send_notification "Recovery Failed" "Check logs manually." "critical"
+            log "INFO: No intact bisync state snapshot to restore."
+        fi
+
+        # Attempt 3: Resync (Auto-Healing), the last resort
+        if [ "$RECOVERED" = "false" ]; then
+            log "INITIATING AUTO-HEALING (--resync)..."
+
+            # Clear the temp log for the retry
+            truncate -s 0 "$OUTPUT_LOG"
+
+            RECOVERY_STARTED=$(date +%s)
+            publish_status start --mode resync
+            if run_rclone "--resync"; then
+                 update_manifest baseline
+                 save_bisync_state
+                 log "RECOVERY SUCCESSFUL: Database repaired and synced ($(( $(date +%s) - RECOVERY_STARTED ))s)."
+                 send_notification "Recovery Success" "CDSync database repaired." "normal"
+            else
+                 log "RECOVERY FAILED: Manual intervention required ($(( $(date +%s) - RECOVERY_STARTED ))s)."
+                 send_notification "Recovery Failed" "Check logs manually." "critical"
+            fi
         fi
     else
         # It was some other error (network, permissions, etc)
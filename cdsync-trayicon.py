@@ -5,14 +5,37 @@ import subprocess
 import fcntl
 import gi
 import hashlib
+import json
 import re
+import socket
+import threading
+import time
+from collections import deque
 
 # GTK and AppIndicator setup
 gi.require_version('Gtk', '3.0')
 gi.require_version('AppIndicator3', '0.1')
-from gi.repository import Gtk, AppIndicator3, GLib
+from gi.repository import Gtk, AppIndicator3, GLib, Gio
+
+from cdsync.config import Config, atomic_write
+from cdsync.logparse import format_event, is_error_line
+from cdsync.logtail import LogTailer, read_lines_after, read_lines_before, search_backwards
+from cdsync import metrics, rclonelog
+from cdsync.logarchive import default_log_path
+from cdsync.pairs import load_pairs
+from cdsync.schedule import OVERRIDE_MINUTES, UNLIMITED, load_schedule
+from cdsync.status import DEFAULT_PAIR, default_socket_path, publish
+from cdsync.systemd import SystemctlUnits, connect_units
+
+# While no event will report a change (see CDSyncIndicator.schedule_recheck)
+RECHECK_SECONDS = 2
 
 class LogWindow(Gtk.Window):
+    # Log is loaded lazily in chunks; the buffer never holds more than MAX_LINES
+    CHUNK_SIZE = 256 * 1024
+    MAX_LINES = 20000
+    MAX_MATCHES = 5000
+
     def __init__(self, log_path):
         super().__init__(title="CDSync Logs")
         self.set_default_size(600, 400)
@@ -21,21 +44,52 @@ class LogWindow(Gtk.Window):
         self.set_position(Gtk.WindowPosition.MOUSE)
         self.log_path = log_path
 
+        # Loaded window into the file: start offset of every buffered line,
+        # plus the offset just past the last one
+        self.line_offsets = deque()
+        self.end_offset = 0
+        self.inode = None
+        self.closed = False
+
+        # Search state
+        self.filter_active = False
+        self.search_cancel = None
+        self.search_timeout_id = None
+
         vbox = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=6)
         self.add(vbox)
 
+        # Search / Filter Bar
+        hbox = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=6)
+        vbox.pack_start(hbox, False, False, 0)
+
+        self.search_entry = Gtk.SearchEntry()
+        self.search_entry.set_placeholder_text("Filter (text or path)...")
+        self.search_entry.connect("search-changed", self.on_search_changed)
+        hbox.pack_start(self.search_entry, True, True, 0)
+
+        self.chk_errors = Gtk.CheckButton(label="Errors only")
+        self.chk_errors.connect("toggled", self.on_search_changed)
+        hbox.pack_start(self.chk_errors, False, False, 0)
+
         # Scrolled Window
-        scrolled = Gtk.ScrolledWindow()
-        scrolled.set_vexpand(True)
-        scrolled.set_hexpand(True)
-        vbox.pack_start(scrolled, True, True, 0)
+        self.scrolled = Gtk.ScrolledWindow()
+        self.scrolled.set_vexpand(True)
+        self.scrolled.set_hexpand(True)
+        self.scrolled.connect("edge-reached", self.on_edge_reached)
+        vbox.pack_start(self.scrolled, True, True, 0)
 
         # Text View
         self.textview = Gtk.TextView()
         self.textview.set_editable(False)
         self.textview.set_monospace(True)
         self.textview.set_wrap_mode(Gtk.WrapMode.NONE) # No wrap for logs usually better
-        scrolled.add(self.textview)
+        self.scrolled.add(self.textview)
+
+        # Status line (what part of the file is shown)
+        self.status_label = Gtk.Label(label="")
+        self.status_label.set_xalign(0)
+        vbox.pack_start(self.status_label, False, False, 0)
 
         # Button Box
         bbox = Gtk.ButtonBox(orientation=Gtk.Orientation.HORIZONTAL)
@@ -50,44 +104,255 @@ class LogWindow(Gtk.Window):
         btn_close.connect("clicked", self.on_close)
         bbox.add(btn_close)
 
+        self.connect("destroy", self.on_destroy)
+
         self.load_logs()
         self.show_all()
 
+        # Follow new lines while the window is open
+        GLib.timeout_add_seconds(1, self.poll_appended)
+
     def load_logs(self, widget=None):
+        """(Re)loads the last chunk of the log, or re-runs the active search."""
+        if self.filter_active:
+            self.start_search()
+            return
+
         buffer = self.textview.get_buffer()
+        buffer.set_text("")
+        self.line_offsets.clear()
+        self.end_offset = 0
+        self.inode = None
+
         if not os.path.exists(self.log_path):
             buffer.set_text("Log file not found.")
+            self.status_label.set_text("")
             return
 
         try:
-            file_size = os.path.getsize(self.log_path)
-            limit = 1024 * 1024 # 1MB
-
-            with open(self.log_path, "r", errors='replace') as f:
-                if file_size > limit:
-                    f.seek(file_size - limit)
-                    content = f.read()
-                    # Discard the first partial line to avoid garbage
-                    if '\n' in content:
-                        content = content.split('\n', 1)[1]
-                    
-                    header = f"[WARNING: Log file is huge ({file_size / (1024*1024):.2f} MB). Showing last 1MB only...]\n"
-                    buffer.set_text(header + content)
-                else:
-                    content = f.read()
-                    buffer.set_text(content)
-                
+            st = os.stat(self.log_path)
+            self.inode = st.st_ino
+            start, lines = read_lines_before(self.log_path, st.st_size, self.CHUNK_SIZE)
+            self.end_offset = st.st_size
+            self.insert_lines(lines, at_end=True)
+            self.update_status_label()
+
             # Scroll to end (must be queued to run after UI update)
             GLib.idle_add(self.scroll_to_end)
         except Exception as e:
             buffer.set_text(f"Error reading log: {e}")
 
+    def insert_lines(self, lines, at_end):
+        if not lines:
+            return
+        buffer = self.textview.get_buffer()
+        text = "".join(line + "\n" for _, line in lines)
+        if at_end:
+            buffer.insert(buffer.get_end_iter(), text)
+            self.line_offsets.extend(offset for offset, _ in lines)
+        else:
+            buffer.insert(buffer.get_start_iter(), text)
+            self.line_offsets.extendleft(offset for offset, _ in reversed(lines))
+
+    def trim_lines(self, from_top):
+        """Keeps memory bounded by dropping lines on the side away from the reader."""
+        excess = len(self.line_offsets) - self.MAX_LINES
+        if excess <= 0:
+            return
+        buffer = self.textview.get_buffer()
+        if from_top:
+            buffer.delete(buffer.get_start_iter(), buffer.get_iter_at_line(excess))
+            for _ in range(excess):
+                self.line_offsets.popleft()
+        else:
+            keep = len(self.line_offsets) - excess
+            buffer.delete(buffer.get_iter_at_line(keep), buffer.get_end_iter())
+            for _ in range(excess):
+                self.end_offset = self.line_offsets.pop()
+
+    def load_older(self):
+        if not self.line_offsets or self.line_offsets[0] == 0:
+            return
+        start, lines = read_lines_before(self.log_path, self.line_offsets[0], self.CHUNK_SIZE)
+        if not lines:
+            return
+
+        # Keep the current first line in view after prepending
+        buffer = self.textview.get_buffer()
+        mark = buffer.create_mark(None, buffer.get_start_iter(), False)
+        self.insert_lines(lines, at_end=False)
+        self.trim_lines(from_top=False)
+        GLib.idle_add(self.scroll_to_mark, mark)
+        self.update_status_label()
+
+    def load_newer(self):
+        """Reads appended (or previously trimmed) lines after end_offset."""
+        start, lines = read_lines_after(self.log_path, self.end_offset, self.CHUNK_SIZE)
+        if not lines:
+            return False
+        self.end_offset = start
+        self.insert_lines(lines, at_end=True)
+        self.trim_lines(from_top=True)
+        self.update_status_label()
+        return True
+
+    def on_edge_reached(self, scrolled, pos):
+        if self.filter_active:
+            return
+        try:
+            if pos == Gtk.PositionType.TOP:
+                self.load_older()
+            elif pos == Gtk.PositionType.BOTTOM:
+                self.load_newer()
+        except OSError:
+            pass
+
+    def poll_appended(self):
+        if self.closed:
+            return False
+        if self.filter_active:
+            return True
+
+        try:
+            st = os.stat(self.log_path)
+        except OSError:
+            return True
+
+        if st.st_ino != self.inode or st.st_size < self.end_offset:
+            # Rotated or truncated: start over from the new tail
+            self.load_logs()
+            return True
+
+        if st.st_size > self.end_offset:
+            # Only auto-append when the reader is already at the bottom;
+            # otherwise edge-reached picks the new lines up on scroll
+            adj = self.scrolled.get_vadjustment()
+            at_bottom = adj.get_value() >= adj.get_upper() - adj.get_page_size() - 1
+            if at_bottom:
+                try:
+                    if self.load_newer():
+                        GLib.idle_add(self.scroll_to_end)
+                except OSError:
+                    pass
+        return True
+
+    def update_status_label(self):
+        try:
+            size = os.path.getsize(self.log_path)
+        except OSError:
+            return
+        if not self.line_offsets:
+            self.status_label.set_text("")
+            return
+        mb = 1024 * 1024
+        self.status_label.set_text(
+            f"Showing {self.line_offsets[0] / mb:.2f}-{self.end_offset / mb:.2f} MB of {size / mb:.2f} MB "
+            "(scroll up for older entries)"
+        )
+
+    # --- Search / Filter ---
+
+    def on_search_changed(self, widget):
+        # Debounce typing
+        if self.search_timeout_id:
+            GLib.source_remove(self.search_timeout_id)
+        self.search_timeout_id = GLib.timeout_add(300, self.on_search_timeout)
+
+    def on_search_timeout(self):
+        self.search_timeout_id = None
+        self.start_search()
+        return False
+
+    def start_search(self):
+        if self.search_cancel:
+            self.search_cancel.set()
+            self.search_cancel = None
+
+        query = self.search_entry.get_text().strip().lower()
+        errors_only = self.chk_errors.get_active()
+
+        if not query and not errors_only:
+            # Back to the normal (tail-following) view
+            self.filter_active = False
+            self.load_logs()
+            return
+
+        self.filter_active = True
+        self.textview.get_buffer().set_text("")
+        self.status_label.set_text("Searching...")
+
+        cancel = threading.Event()
+        self.search_cancel = cancel
+        worker = threading.Thread(
+            target=self.search_worker, args=(query, errors_only, cancel), daemon=True
+        )
+        worker.start()
+
+    def search_worker(self, query, errors_only, cancel):
+        """Runs off the GTK main thread; results are handed back via idle_add."""
+        def match(line):
+            if errors_only and not is_error_line(line):
+                return False
+            return not query or query in line.lower()
+
+        batch = []
+        count = 0
+        try:
+            for _, line in search_backwards(self.log_path, match, cancel):
+                batch.append(line)
+                count += 1
+                if len(batch) >= 500:
+                    GLib.idle_add(self.on_search_batch, cancel, batch)
+                    batch = []
+                if count >= self.MAX_MATCHES:
+                    break
+        except OSError as e:
+            GLib.idle_add(self.on_search_done, cancel, count, f"Error reading log: {e}")
+            return
+        if batch:
+            GLib.idle_add(self.on_search_batch, cancel, batch)
+        GLib.idle_add(self.on_search_done, cancel, count, None)
+
+    def on_search_batch(self, cancel, batch):
+        if cancel.is_set() or self.closed:
+            return False
+        # Matches arrive newest first; keep the log's chronological order
+        buffer = self.textview.get_buffer()
+        buffer.insert(buffer.get_start_iter(), "".join(line + "\n" for line in reversed(batch)))
+        return False
+
+    def on_search_done(self, cancel, count, error):
+        if cancel.is_set() or self.closed:
+            return False
+        if error:
+            self.status_label.set_text(error)
+        elif count >= self.MAX_MATCHES:
+            self.status_label.set_text(f"Showing the newest {count} matches (refine the filter for more)")
+        else:
+            self.status_label.set_text(f"{count} matching lines")
+        self.scroll_to_end()
+        return False
+
     def scroll_to_end(self):
         buffer = self.textview.get_buffer()
-        mark = buffer.create_mark("end", buffer.get_end_iter(), False)
+        mark = buffer.get_mark("end")
+        if mark is None:
+            mark = buffer.create_mark("end", buffer.get_end_iter(), False)
+        else:
+            buffer.move_mark(mark, buffer.get_end_iter())
         self.textview.scroll_to_mark(mark, 0.0, True, 0.0, 1.0)
         return False
 
+    def scroll_to_mark(self, mark):
+        self.textview.scroll_to_mark(mark, 0.0, True, 0.0, 0.0)
+        self.textview.get_buffer().delete_mark(mark)
+        return False
+
+    def on_destroy(self, widget):
+        self.closed = True
+        if self.search_cancel:
+            self.search_cancel.set()
+
     def on_close(self, widget):
         self.destroy()
 
@@ -101,10 +366,31 @@ class CDSyncIndicator:
         # Service Names
         self.service_name = f"cdsync-{folder_name}-{dir_hash}-watcher.service"
         self.timer_name = f"cdsync-{folder_name}-{dir_hash}-poll.timer"
+        self.poll_service_name = f"cdsync-{folder_name}-{dir_hash}-poll.service"
         
         # App ID
         self.APPINDICATOR_ID = f"cdsync_indicator_{folder_name}"
 
+        # Live sync state from the watcher's status socket (None = use lock file)
+        self.status_socket_path = default_socket_path(self.base_dir)
+        self.status_sock = None
+        self.status_buf = b""
+        self.sync_state = None
+
+        # Recent run metrics (cdsync/metrics.py), re-read only when the file changes
+        self.metrics_path = metrics.default_paths(self.base_dir)[0]
+        self.metrics_stamp = None
+        self.metrics_text = None
+
+        # Unit state over the systemd user bus (falls back to systemctl)
+        # (the poll service too: its runs show up without the watcher)
+        self.units = connect_units(
+            [self.service_name, self.timer_name, self.poll_service_name], self.on_unit_changed)
+        self.recheck_pending = False
+
+        # Shared, cached config.env model (re-parsed only when it changes)
+        self.config = Config(os.path.join(self.base_dir, "config.env"))
+
         # 2. Resolve Lock File & Log File
         self.lock_file_path = self.get_lock_file_path()
         self.log_file_path = self.get_log_file_path()
@@ -155,6 +441,16 @@ class CDSyncIndicator:
         self.activity_label.set_sensitive(False)
         self.menu.append(self.activity_label)
 
+        # Periodic check schedule (adaptive interval, from the watcher)
+        self.poll_label = Gtk.MenuItem(label="")
+        self.poll_label.set_sensitive(False)
+        self.menu.append(self.poll_label)
+
+        # Recent throughput and failure rate (from the metrics file)
+        self.metrics_label = Gtk.MenuItem(label="")
+        self.metrics_label.set_sensitive(False)
+        self.menu.append(self.metrics_label)
+
         self.menu.append(Gtk.SeparatorMenuItem())
 
         # Activity Submenu
@@ -165,6 +461,13 @@ class CDSyncIndicator:
         
         self.last_log_lines = []
         self.pending_action = None # None, 'disable', 'quit'
+
+        # Activity events the core records after each run (cdsync/rclonelog.py);
+        # only newly appended lines are parsed
+        self.activity_path = rclonelog.default_activity_path(self.base_dir)
+        self.log_tailer = LogTailer(self.activity_path, self.parse_log_line)
+        self.log_monitor = None
+        self.activity_refresh_pending = False
         
         # Link to full log window (added dynamically in update/rebuild or just once here? 
         # Actually proper place is inside the submenu or main menu? 
@@ -173,11 +476,64 @@ class CDSyncIndicator:
 
         self.menu.append(Gtk.SeparatorMenuItem())
         
-        # Manual Sync Button
+        # Manual Sync Button (every sync pair)
         self.item_sync = Gtk.MenuItem(label="Sync Now")
         self.item_sync.connect("activate", self.manual_sync)
         self.menu.append(self.item_sync)
 
+        # Sync Pairs Submenu (only with several pairs, see cdsync/pairs.py):
+        # per-pair status, Sync Now, Resync and log
+        self.pair_items = {}
+        sync_pairs = load_pairs(self.config)
+        if len(sync_pairs) > 1:
+            item_pairs = Gtk.MenuItem(label="🗂️ Sync Pairs")
+            pairs_menu = Gtk.Menu()
+            item_pairs.set_submenu(pairs_menu)
+            self.menu.append(item_pairs)
+            for pair in sync_pairs:
+                item_pair = Gtk.MenuItem(label=pair.name)
+                pair_menu = Gtk.Menu()
+                item_pair.set_submenu(pair_menu)
+                pairs_menu.append(item_pair)
+
+                label = Gtk.MenuItem(label=f"{pair.remote} ↔ {pair.local_dir}")
+                label.set_sensitive(False)
+                pair_menu.append(label)
+                self.pair_items[pair.name] = item_pair
+                pair_menu.append(Gtk.SeparatorMenuItem())
+
+                item = Gtk.MenuItem(label="Sync Now")
+                item.connect("activate", self.manual_sync, pair.name)
+                pair_menu.append(item)
+                item = Gtk.MenuItem(label="🔧 Force Resync (Repair)")
+                item.connect("activate", self.force_resync, pair.name)
+                pair_menu.append(item)
+                item = Gtk.MenuItem(label="📂 Open Log...")
+                item.connect("activate", self.open_log_window, pair.name)
+                pair_menu.append(item)
+
+        # Bandwidth Submenu: the schedule window in force (cdsync/schedule.py)
+        # and a temporary override of it
+        item_limits = Gtk.MenuItem(label="🚦 Bandwidth")
+        limits_menu = Gtk.Menu()
+        item_limits.set_submenu(limits_menu)
+        self.menu.append(item_limits)
+        self.limits_label = Gtk.MenuItem(label="Schedule: unknown")
+        self.limits_label.set_sensitive(False)
+        limits_menu.append(self.limits_label)
+        limits_menu.append(Gtk.SeparatorMenuItem())
+        hours = OVERRIDE_MINUTES // 60
+        schedule = load_schedule(self.config)
+        for window in [None] + schedule.windows + [schedule.default]:
+            name = window.name if window else UNLIMITED
+            text = f"{window.describe()}" if window else "Unlimited"
+            item = Gtk.MenuItem(label=f"{text} for {hours} h")
+            item.connect("activate", self.override_limits, name)
+            limits_menu.append(item)
+        limits_menu.append(Gtk.SeparatorMenuItem())
+        item = Gtk.MenuItem(label="Resume Schedule")
+        item.connect("activate", self.override_limits, None)
+        limits_menu.append(item)
 
 
         self.menu.append(Gtk.SeparatorMenuItem())
@@ -275,33 +631,19 @@ class CDSyncIndicator:
         
         self.indicator.set_menu(self.menu)
 
-        # 5. Start Check Loop (every 2 seconds)
+        # 5. Watch the activity file (inotify via Gio) so the activity feed
+        # only wakes up when something was actually written
+        self.start_log_monitor()
+        self.update_activity_menu()
+
+        # 6. Status follows events: unit signals, the status socket and the
+        # lock file (syncs started without the watcher)
+        self.start_lock_monitor()
         self.update_status()
-        GLib.timeout_add_seconds(2, self.update_status)
 
     def get_config_value(self, var_name, default=None):
         """Reads config.env safely using Python (No shell injection)"""
-        config_path = os.path.join(self.base_dir, "config.env")
-        if not os.path.exists(config_path):
-            return default
-
-        try:
-            with open(config_path, "r") as f:
-                for line in f:
-                    line = line.strip()
-                    # Match VAR=VALUE, ignoring comments #
-                    if line.startswith(f"{var_name}="):
-                        # Extract value part
-                        val = line.split("=", 1)[1]
-                        # Remove quotes if present
-                        val = val.strip('"').strip("'")
-                        # Remove inline comments if any (simple approach)
-                        if " # " in val:
-                            val = val.split(" # ", 1)[0]
-                        return val.strip()
-            return default
-        except Exception:
-            return default
+        return self.config.get(var_name, default)
 
     def get_lock_file_path(self):
         return self.get_config_value("LOCK_FILE", "/tmp/cdsync_default.lock")
@@ -313,123 +655,54 @@ class CDSyncIndicator:
         return os.path.join(self.base_dir, "cdsync.log")
 
     def parse_log_line(self, line):
-        """Parses a raw log line and returns a formatted string or None."""
-        # Capture Timestamp: YYYY/MM/DD HH:MM:SS or YYYY-MM-DD HH:MM:SS
-        # Rclone uses /, shell script uses -
-        
-        # Ex: "2025/12/09 15:00:00" OR "15:00:00"
-        ts_match = re.search(r"(?:(\d{4}[/-]\d{2}[/-]\d{2})\s+)?(\d{2}:\d{2}:\d{2})", line)
-        
-        timestamp = ""
-        if ts_match:
-            try:
-                date_part = ts_match.group(1)
-                time_part = ts_match.group(2)
-                
-                if date_part:
-                    # We have a date, format to [YYYY-MM-DD HH:MM]
-                    full_date = date_part.replace('/', '-')
-                    timestamp = f"[{full_date} {time_part[:5]}] "
-                else:
-                    # We only have time. Show [HH:MM]
-                    timestamp = f"[{time_part[:5]}] "
-            except:
-                pass # Timestamp stays empty if parsing fails
-
-        # Regex 1: Standard Action (Copied, Updated, Deleted, Moved)
-        # Ex: "INFO  : folder/file.txt: Copied (new)"
-        match_std = re.search(r"INFO\s+:\s+(.*?):\s+(Copied|Updated|Deleted|Moved)", line)
-        if match_std:
-            filename = os.path.basename(match_std.group(1).strip())
-            action = match_std.group(2)
-            
-            icon = "✅" 
-            
-            # Refinement: "Copied (replaced existing)" is actually an UPDATE
-            if action == "Copied" and "(replaced existing)" in line:
-                 icon = "🔄"
-            elif action == "Updated": icon = "🔄"
-            elif action == "Deleted": icon = "🗑️"
-            elif action == "Moved": icon = "➡️"
-            
-            return f"{timestamp}{icon} {filename}"
-
-        # Regex 2: Bisync File logic (Newer, New, etc)
-        # Ex: "INFO  : - Path2    File is newer       - ..."
-        # Ex: "INFO  : - Path2    File is new         - ..."
-        match_bisync_file = re.search(r"INFO\s+:\s+-\s+Path[12]\s+(File is newer|File is new)\s+-\s+(.*)", line)
-        if match_bisync_file:
-            filename = os.path.basename(match_bisync_file.group(2).strip())
-            return f"{timestamp}🆕 {filename}"
-            
-        # Regex 3: Directory Operations (Bisync)
-        # Ex: "INFO  : - Path1             Directory is new                            - aaaab"
-        # Broaden regex to catch variations in whitespace or phrasing
-        # Regex 3: Directory Operations (Bisync)
-        # Ex: "INFO  : - Path1             Directory is new                            - aaaab"
-        # Broaden regex to catch variations in whitespace or phrasing
-        match_dir = re.search(r"INFO\s+:.*?(Directory\s+(?:is new|was deleted|is newer|is older)).*?-\s+(.*)", line)
-        if match_dir:
-            action = match_dir.group(1)
-            dirname = os.path.basename(match_dir.group(2).strip())
-            
-            icon = "✅📂"
-            if "deleted" in action: 
-                icon = "🗑️📂"
-            elif "newer" in action or "older" in action:
-                icon = "🔄📂"
-            
-            return f"{timestamp}{icon} {dirname}"
-
-        # Regex 4: Low-level Directory Operations (Rclone Standard)
-        match_std_dir = re.search(r"INFO\s+:\s+(.*?):\s+(Made directory|Making directory|Removed directory|Removing directory)", line)
-        if match_std_dir:
-             dirname = os.path.basename(match_std_dir.group(1).strip())
-             action = match_std_dir.group(2)
-             
-             icon = "✅📂"
-             if "Removed" in action or "Removing" in action: 
-                 icon = "🗑️📂"
-             
-             return f"{timestamp}{icon} {dirname}"
-        # Regex 3 (Removed at user request): Smart/Shallow Sync Trigger
-        # match_smart = re.search(r"INFO:\s+🚀\s+(Shallow|Surgical|Smart) Sync.*?(?:on|for):\s+(.*)", line)
-        # if match_smart:
-        #    path = match_smart.group(2).strip()
-        #    if path == "Root Directory" or path == ".": path = "/"
-        #    return f"{timestamp}🚀 Syncing {path}..."
-            
-        return None
+        """Parses an activity record and returns a formatted string or None."""
+        event = rclonelog.parse_event(line)
+        if event is None:
+            return None
+        return format_event(event)
 
     def get_recent_activity(self):
-        if not os.path.exists(self.log_file_path):
-            return []
+        self.log_tailer.poll()
+        return self.log_tailer.recent()
+
+    def start_log_monitor(self):
         try:
-            # Read last 50KB to find enough relevant lines
-            # Using python read instead of tail for better control
-            file_size = os.path.getsize(self.log_file_path)
-            limit = 50 * 1024 # 50KB
-            
-            content = ""
-            with open(self.log_file_path, "r", errors='replace') as f:
-                if file_size > limit:
-                    f.seek(file_size - limit)
-                content = f.read()
-            
-            lines = content.splitlines()
-            found_items = []
-            
-            # Iterate backwards
-            for line in reversed(lines):
-                parsed = self.parse_log_line(line)
-                if parsed and parsed not in found_items:
-                    found_items.append(parsed)
-                    if len(found_items) >= 10:
-                        break
-            
-            return found_items
+            gfile = Gio.File.new_for_path(self.activity_path)
+            self.log_monitor = gfile.monitor_file(Gio.FileMonitorFlags.WATCH_MOVES, None)
+            self.log_monitor.connect("changed", self.on_log_changed)
+        except Exception:
+            # No inotify available: poll the tailer instead
+            self.log_monitor = None
+            GLib.timeout_add_seconds(RECHECK_SECONDS, self.poll_activity)
+
+    def poll_activity(self):
+        self.update_activity_menu()
+        return True
+
+    def start_lock_monitor(self):
+        # The core opens (creates) the lock file when a run starts
+        try:
+            gfile = Gio.File.new_for_path(self.lock_file_path)
+            self.lock_monitor = gfile.monitor_file(Gio.FileMonitorFlags.NONE, None)
+            self.lock_monitor.connect("changed", self.on_lock_changed)
         except Exception:
-            return []
+            self.lock_monitor = None
+
+    def on_lock_changed(self, monitor, gfile, other_file, event_type):
+        if event_type in (Gio.FileMonitorEvent.CREATED, Gio.FileMonitorEvent.CHANGED,
+                          Gio.FileMonitorEvent.DELETED):
+            self.update_status()
+
+    def on_log_changed(self, monitor, gfile, other_file, event_type):
+        # Rclone writes in bursts; coalesce them into one refresh
+        if not self.activity_refresh_pending:
+            self.activity_refresh_pending = True
+            GLib.timeout_add(250, self.refresh_activity)
+
+    def refresh_activity(self):
+        self.activity_refresh_pending = False
+        self.update_activity_menu()
+        return False
 
     def update_activity_menu(self):
         logs = self.get_recent_activity()
@@ -467,12 +740,59 @@ class CDSyncIndicator:
         
         self.activity_menu.show_all()
 
-    def open_log_window(self, source):
-        win = LogWindow(self.log_file_path)
+    def open_log_window(self, source, pair=None):
+        if pair is None or pair == DEFAULT_PAIR:
+            win = LogWindow(self.log_file_path)
+        else:
+            win = LogWindow(default_log_path(self.config, self.base_dir, pair))
         win.show()
 
+    def connect_status(self):
+        """Subscribes to the watcher's status socket. Returns False if unavailable."""
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(self.status_socket_path)
+            sock.sendall(b'{"op": "subscribe"}\n')
+        except OSError:
+            sock.close()
+            return False
+        sock.setblocking(False)
+        self.status_sock = sock
+        self.status_buf = b""
+        GLib.io_add_watch(sock.fileno(), GLib.PRIORITY_DEFAULT,
+                          GLib.IO_IN | GLib.IO_HUP | GLib.IO_ERR, self.on_status_data)
+        return True
+
+    def on_status_data(self, fd, condition):
+        try:
+            data = self.status_sock.recv(65536)
+        except BlockingIOError:
+            return True
+        except OSError:
+            data = b""
+        if not data:
+            # Hub went away (watcher stopped): fall back to the lock file
+            self.status_sock.close()
+            self.status_sock = None
+            self.sync_state = None
+            self.update_status()
+            return False
+
+        self.status_buf += data
+        *lines, self.status_buf = self.status_buf.split(b"\n")
+        for line in lines:
+            try:
+                self.sync_state = json.loads(line)["state"]
+            except (ValueError, KeyError):
+                continue
+        self.update_status()
+        return True
+
     def is_sync_running(self):
         """Checks if the lock file is currently held by another process"""
+        if self.sync_state is not None:
+            return self.sync_state["running"]
+
         if not os.path.exists(self.lock_file_path):
             return False
             
@@ -509,18 +829,120 @@ class CDSyncIndicator:
         subprocess.Popen(cmd)
 
     def check_service_active(self):
+        # Cached from systemd PropertiesChanged signals (no fork)
+        return self.units.is_active(self.service_name)
+
+    def on_unit_changed(self, unit, state):
+        # Signal-driven refresh: icon/label follow the watcher immediately
+        # (and the status socket is reconnected when it starts)
+        self.update_status()
+
+    def schedule_recheck(self, is_active, is_running):
+        """Runs update_status again shortly, while no event would report a change.
+
+        That is while the watcher is active but its status socket is not up
+        yet, while a sync is only known from its lock file (its end is not
+        signalled), and always with the systemctl fallback (no unit signals).
+        """
+        if self.recheck_pending:
+            return
+        no_signals = isinstance(self.units, SystemctlUnits)
+        if self.status_sock is None and (is_active or is_running or no_signals):
+            self.recheck_pending = True
+            GLib.timeout_add_seconds(RECHECK_SECONDS, self.on_recheck)
+
+    def on_recheck(self):
+        self.recheck_pending = False
+        self.update_status()
+        return False
+
+    def describe_running_sync(self):
+        state = self.sync_state
+        if not state:
+            return "⚡ Sync in progress..."
+        label = f"⚡ Syncing ({state['mode']})"
+        if state.get("pair") and state["pair"] != DEFAULT_PAIR:
+            label = f"⚡ Syncing {state['pair']} ({state['mode']})"
+        if state["files_total"]:
+            label += f": {state['files_transferred']}/{state['files_total']} files"
+        if state["bytes_total"]:
+            pct = 100 * state["bytes_transferred"] // state["bytes_total"]
+            label += f", {pct}%"
+        if state["queue_depth"]:
+            label += f" (+{state['queue_depth']} queued)"
+        others = len(state.get("running_pairs", ())) - 1
+        if others > 0:
+            label += f" (+{others} more pair{'s' if others != 1 else ''})"
+        return label
+
+    def update_pair_labels(self):
+        pairs = (self.sync_state or {}).get("pairs", {})
+        for name, item_pair in self.pair_items.items():
+            state = pairs.get(name)
+            if state is None:
+                item_pair.set_label(name)
+            elif state["running"]:
+                item_pair.set_label(f"⚡ {name} ({state['mode']})")
+            elif state["last_result"] and state["last_result"]["exit_code"] != 0:
+                item_pair.set_label(f"❌ {name}")
+            else:
+                item_pair.set_label(f"✅ {name}" if state["last_result"] else name)
+
+    def describe_limits(self):
+        limits = (self.sync_state or {}).get("limits")
+        if not limits:
+            return "Schedule: watcher not running"
+        label = f"Now: {limits['window']} ({limits['bwlimit'] or 'unlimited'}"
+        if limits["transfers"]:
+            label += f", {limits['transfers']} transfers"
+        label += ")"
+        if limits.get("override_until"):
+            label += f", until {time.strftime('%H:%M', time.localtime(limits['override_until']))}"
+        return label
+
+    def override_limits(self, source, window):
+        # The watcher applies it to running syncs too (cdsync/watcher.py)
+        msg = {"op": "limits", "window": window, "minutes": OVERRIDE_MINUTES}
+        if not publish(msg, self.status_socket_path):
+            self.send_notification("Error", "The watcher is not running.")
+            return
+        self.update_status()
+
+    def describe_poll(self):
+        state = self.sync_state
+        if not state or not state.get("poll_interval"):
+            return None
+        minutes = max(1, round(state["poll_interval"] / 60))
+        label = f"⏱️ Every {minutes} min ({state['poll_reason']})"
+        if state.get("next_poll_at"):
+            remaining = max(0, round((state["next_poll_at"] - time.time()) / 60))
+            label += f", next in {remaining} min"
+        return label
+
+    def describe_metrics(self, count=20):
         try:
-            result = subprocess.run(
-                ["systemctl", "--user", "is-active", self.service_name],
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True
-            )
-            return result.returncode == 0
-        except Exception:
-            return False
+            st = os.stat(self.metrics_path)
+        except OSError:
+            return None
+        stamp = (st.st_mtime_ns, st.st_size)
+        if stamp != self.metrics_stamp:
+            self.metrics_stamp = stamp
+            summary = metrics.summarize(metrics.read_records(self.metrics_path, count))
+            if summary["runs"]:
+                rate = summary["throughput"] / (1024 * 1024)
+                self.metrics_text = (
+                    f"📊 Last {summary['runs']} runs: {rate:.1f} MiB/s, "
+                    f"{summary['failure_rate']:.0%} failed"
+                )
+            else:
+                self.metrics_text = None
+        return self.metrics_text
 
     def update_status(self):
+        # Reconnect to the status hub when the watcher (re)starts
+        if self.status_sock is None:
+            self.connect_status()
+
         is_active = self.check_service_active()
         is_running = self.is_sync_running()
 
@@ -552,7 +974,7 @@ class CDSyncIndicator:
                 # We enable the label so user can click it to cancel? 
                 # Actually toggle_service is connected to item_label ("CDSync: ...")
             else:
-                self.activity_label.set_label("⚡ Sync in progress...")
+                self.activity_label.set_label(self.describe_running_sync())
                 
             self.activity_label.show()
             
@@ -569,10 +991,7 @@ class CDSyncIndicator:
                 # We need to force is_active to True so the toggle logic effectively stops it
                 # calling toggle_service directly is safer but we need to mock the state
                 # Actually, simply calling logic to stop:
-                subprocess.run(["systemctl", "--user", "stop", self.service_name])
-                subprocess.run(["systemctl", "--user", "stop", self.timer_name])
-                subprocess.run(["systemctl", "--user", "disable", self.service_name])
-                subprocess.run(["systemctl", "--user", "disable", self.timer_name])
+                self.units.stop_and_disable([self.service_name, self.timer_name])
                 # Refresh status immediately
                 self.update_status()
                 return True
@@ -586,7 +1005,24 @@ class CDSyncIndicator:
             self.item_sync.set_sensitive(True)
             self.item_resync.set_sensitive(True)
 
-        self.update_activity_menu()
+        poll_text = self.describe_poll()
+        if poll_text and is_active:
+            self.poll_label.set_label(poll_text)
+            self.poll_label.show()
+        else:
+            self.poll_label.hide()
+
+        self.update_pair_labels()
+        self.limits_label.set_label(self.describe_limits())
+
+        metrics_text = self.describe_metrics()
+        if metrics_text:
+            self.metrics_label.set_label(metrics_text)
+            self.metrics_label.show()
+        else:
+            self.metrics_label.hide()
+
+        self.schedule_recheck(is_active, is_running)
         return True
 
     def toggle_service(self, source):
@@ -637,47 +1073,51 @@ class CDSyncIndicator:
         
         if is_active:
             # STOP
-            subprocess.run(["systemctl", "--user", "stop", self.service_name])
-            subprocess.run(["systemctl", "--user", "stop", self.timer_name])
-            subprocess.run(["systemctl", "--user", "disable", self.service_name])
-            subprocess.run(["systemctl", "--user", "disable", self.timer_name])
+            self.units.stop_and_disable([self.service_name, self.timer_name])
         else:
             # START
-            subprocess.run(["systemctl", "--user", "enable", self.service_name])
-            subprocess.run(["systemctl", "--user", "enable", self.timer_name])
-            subprocess.run(["systemctl", "--user", "start", self.service_name])
-            subprocess.run(["systemctl", "--user", "start", self.timer_name])
+            self.units.enable_and_start([self.service_name, self.timer_name])
         
         self.update_status()
 
-    def manual_sync(self, source):
+    def can_queue_sync(self):
+        """True if a run can start now or be queued by the watcher's scheduler."""
+        if self.sync_state is not None:
+            return True
         if self.is_sync_running():
              self.send_notification("Ignored", "Sync is already running.")
+             return False
+        return True
+
+    def manual_sync(self, source, pair=None):
+        if not self.can_queue_sync():
              return
 
-        # Run core script
+        # Run core script (queued ahead of automatic runs by the watcher);
+        # without a pair, every pair is synced
         core_script = os.path.join(self.base_dir, "cdsync-core.sh")
-        subprocess.Popen(["/bin/bash", core_script])
+        subprocess.Popen(["/bin/bash", core_script, "--sync-now"] + (["--pair", pair] if pair else []))
         
-        self.send_notification("Manual Sync", "Synchronization started...")
+        if self.is_sync_running():
+            self.send_notification("Manual Sync", "Queued after the current sync.")
+        else:
+            self.send_notification("Manual Sync", "Synchronization started...")
         # Immediate update to show "Sync in progress" in the menu
         self.update_status()
 
-    def force_resync(self, source):
-        if self.is_sync_running():
-             self.send_notification("Ignored", "Sync is already running.")
+    def force_resync(self, source, pair=None):
+        if not self.can_queue_sync():
              return
 
-        # Run core script with forced flag
+        # Run core script with forced flag (default pair unless one is given)
         core_script = os.path.join(self.base_dir, "cdsync-core.sh")
-        subprocess.Popen(["/bin/bash", core_script, "--force-resync"])
+        subprocess.Popen(["/bin/bash", core_script, "--force-resync"] + (["--pair", pair] if pair else []))
         
         self.send_notification("Repair Started", "Forced resync initiated...\nThis may take a while.")
         self.update_status()
 
     def run_dedupe(self, source, mode):
-        if self.is_sync_running():
-             self.send_notification("Ignored", "Sync is already running.")
+        if not self.can_queue_sync():
              return
 
         # Confirmation Dialog for Deletion
@@ -755,18 +1195,8 @@ class CDSyncIndicator:
         new_state = not current_state
         state_str = "true" if new_state else "false"
         
-        config_path = os.path.join(self.base_dir, "config.env")
         try:
-             with open(config_path, 'r') as f:
-                 content = f.read()
-             
-             if "FORCE_SYNC_NEWER=" in content:
-                 content = re.sub(r'FORCE_SYNC_NEWER=.*', f'FORCE_SYNC_NEWER={state_str}', content)
-             else:
-                 content += f"\nFORCE_SYNC_NEWER={state_str}\n"
-                 
-             with open(config_path, 'w') as f:
-                 f.write(content)
+             self.config.set("FORCE_SYNC_NEWER", state_str)
              
              self.update_force_sync_ui(new_state)
              
@@ -783,23 +1213,8 @@ class CDSyncIndicator:
         self.notify_level = level
         
         # Update config.env
-        config_path = os.path.join(self.base_dir, "config.env")
         try:
-             with open(config_path, 'r') as f:
-                 content = f.read()
-             
-             # Remove legacy ENABLE_NOTIFICATIONS if checked
-             # But here just strictly updating NOTIFY_LEVEL
-             
-             if "NOTIFY_LEVEL=" in content:
-                 content = re.sub(r'NOTIFY_LEVEL=.*', f'NOTIFY_LEVEL={level}', content)
-                 # Also ensure ENABLE_NOTIFICATIONS is removed or updated to match logic?
-                 # Safest is just to create/update NOTIFY_LEVEL
-             else:
-                 content += f"\nNOTIFY_LEVEL={level}\n"
-             
-             with open(config_path, 'w') as f:
-                 f.write(content)
+             self.config.set("NOTIFY_LEVEL", level)
              
              # self.send_notification("Config Updated", f"Notification Level set to {level}") 
              # (Self-notification might be silenced by the level itself, which is fine)
@@ -810,19 +1225,8 @@ class CDSyncIndicator:
 
     def apply_new_interval(self, minutes):
         # 1. Update config.env
-        config_path = os.path.join(self.base_dir, "config.env")
         try:
-            with open(config_path, 'r') as f:
-                content = f.read()
-            
-            # Regex replace or append
-            if "POLL_INTERVAL=" in content:
-                content = re.sub(r'POLL_INTERVAL=.*', f'POLL_INTERVAL={minutes}', content)
-            else:
-                content += f"\nPOLL_INTERVAL={minutes}\n"
-            
-            with open(config_path, 'w') as f:
-                f.write(content)
+            self.config.set("POLL_INTERVAL", minutes)
                 
         except Exception as e:
             self.send_notification("Error", f"Could not update config.env: {e}")
@@ -840,12 +1244,13 @@ class CDSyncIndicator:
                 # Replace OnUnitActiveSec=...min
                 t_content = re.sub(r'OnUnitActiveSec=.*', f'OnUnitActiveSec={minutes}min', t_content)
                 
-                with open(timer_path, 'w') as f:
-                    f.write(t_content)
+                atomic_write(timer_path, t_content)
                     
                 # 3. Reload Systemd
-                subprocess.run(["systemctl", "--user", "daemon-reload"])
-                subprocess.run(["systemctl", "--user", "restart", self.timer_name])
+                self.units.reload()
+                self.units.restart([self.timer_name])
+                # The watcher schedules periodic runs itself (adaptive)
+                publish({"op": "poll", "interval": int(minutes) * 60}, self.status_socket_path)
                 
                 self.send_notification("Success", f"Sync interval set to {minutes} minutes.\nTimer restarted.")
                 
@@ -867,10 +1272,7 @@ class CDSyncIndicator:
                 pass
                 
         # 3. Stop Services
-        subprocess.run(["systemctl", "--user", "stop", self.service_name])
-        subprocess.run(["systemctl", "--user", "stop", self.timer_name])
-        subprocess.run(["systemctl", "--user", "disable", self.service_name])
-        subprocess.run(["systemctl", "--user", "disable", self.timer_name])
+        self.units.stop_and_disable([self.service_name, self.timer_name])
 
         self.send_notification("Force Stopped", "Sync process killed and services disabled.")
         self.update_status()
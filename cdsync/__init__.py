@@ -0,0 +1 @@
+"""Shared Python helpers for the CDSync tray icon and services."""
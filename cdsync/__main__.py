@@ -0,0 +1,5 @@
+import sys
+
+from cdsync.cli import main
+
+sys.exit(main())
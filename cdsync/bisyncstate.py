@@ -0,0 +1,254 @@
+"""Snapshots of rclone bisync's listings, for recovery without a full resync.
+
+bisync keeps the state of the last successful run as two listing files in
+its working directory (~/.cache/rclone/bisync/<session>.path1.lst and
+.path2.lst). When a run is interrupted or hits a critical error it renames
+them away and refuses to continue ("Must run --resync"). A --resync lists
+and compares both sides in full, which takes long on a large drive, and it
+brings back files deleted on one side since the last run.
+
+After every successful bisync cdsync-core.sh calls `save`, which copies the
+listings into $XDG_STATE_HOME/cdsync/<instance>-bisync/<YYYYmmdd-HHMMSS>/
+with their SHA-256 sums; the last BISYNC_SNAPSHOTS are kept, and listings
+identical to the newest snapshot are not saved again. On "Must run --resync"
+the core calls `restore`, which puts back the newest snapshot whose sums
+still match, and retries a normal bisync from it: changes made since then
+show up as ordinary changes on either side, deletions included. Only if
+that fails does the core fall back to --resync.
+"""
+import argparse
+import glob
+import hashlib
+import json
+import os
+import re
+import shutil
+import sys
+import time
+
+from cdsync.config import Config, atomic_write
+from cdsync.status import BASE_DIR, state_path
+
+DEFAULT_KEEP = 5
+
+LISTINGS = (".path1.lst", ".path2.lst")
+# Left by bisync after a critical error or an interrupted run
+_STALE = (".path1.lst-err", ".path2.lst-err", ".path1.lst-new", ".path2.lst-new")
+_SUMS = "SHA256SUMS.json"
+_HEADER = b"# bisync listing"
+_NAME_RE = re.compile(r"^\d{8}-\d{6}(-\d+)?$")
+
+
+def default_snapshot_dir(base_dir=BASE_DIR, pair=None):
+    return state_path("-bisync", base_dir, pair)
+
+
+def default_workdir():
+    """bisync's default working directory (rclone's cache directory + /bisync)."""
+    cache_dir = os.environ.get("RCLONE_CACHE_DIR")
+    if not cache_dir:
+        cache_dir = os.path.join(os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"), "rclone")
+    return os.path.join(cache_dir, "bisync")
+
+
+def _key(text):
+    # rclone names sessions after both paths with separators replaced by "_";
+    # comparing only letters and digits does not depend on the exact rules.
+    return re.sub(r"[^0-9A-Za-z]", "", text)
+
+
+def session_key(remote, local):
+    """Key of the bisync session between `remote` (path1) and `local` (path2)."""
+    return _key(remote) + _key(os.path.abspath(os.path.expanduser(local)))
+
+
+def find_session(workdir, key):
+    """Name of the session whose listing files match `key`, or None."""
+    found = {}
+    for path in glob.glob(os.path.join(glob.escape(workdir), "*.path1.lst*")):
+        name = os.path.basename(path)
+        session = name[:name.rindex(".path1.lst")]
+        if _key(session) == key:
+            found[session] = max(found.get(session, 0), os.path.getmtime(path))
+    return max(found, key=found.get) if found else None
+
+
+def file_sum(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _is_listing(path):
+    try:
+        with open(path, "rb") as f:
+            return f.read(len(_HEADER)) == _HEADER
+    except OSError:
+        return False
+
+
+class BisyncSnapshots:
+    def __init__(self, directory=None, keep=DEFAULT_KEEP, pair=None):
+        self.directory = directory or default_snapshot_dir(pair=pair)
+        self.keep = keep
+
+    def names(self):
+        """Snapshot names, newest first."""
+        try:
+            entries = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        return sorted((e for e in entries if _NAME_RE.match(e)), reverse=True)
+
+    def info(self, name):
+        """{"session", "created", "sums"} of a snapshot, or None if unreadable."""
+        try:
+            with open(os.path.join(self.directory, name, _SUMS)) as f:
+                info = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return info if isinstance(info, dict) and isinstance(info.get("sums"), dict) else None
+
+    def verify(self, name):
+        """The snapshot's info if all its files still match their sums, else None."""
+        info = self.info(name)
+        if info is None or set(info["sums"]) != {info["session"] + s for s in LISTINGS}:
+            return None
+        for filename, expected in info["sums"].items():
+            try:
+                if file_sum(os.path.join(self.directory, name, filename)) != expected:
+                    return None
+            except OSError:
+                return None
+        return info
+
+    def save(self, workdir, key, now=None):
+        """Snapshots the session's listings. Returns the snapshot name, or None.
+
+        None when there is no complete session to save; the newest snapshot's
+        name when the listings have not changed since it was taken.
+        """
+        session = find_session(workdir, key)
+        if session is None:
+            return None
+        sources = [os.path.join(workdir, session + s) for s in LISTINGS]
+        if not all(_is_listing(p) for p in sources):
+            return None
+        sums = {os.path.basename(p): file_sum(p) for p in sources}
+
+        names = self.names()
+        if names:
+            latest = self.info(names[0])
+            if latest is not None and latest["sums"] == sums:
+                return names[0]
+
+        now = time.time() if now is None else now
+        name = time.strftime("%Y%m%d-%H%M%S", time.localtime(now))
+        n = 1
+        while os.path.exists(os.path.join(self.directory, name)):
+            name = time.strftime("%Y%m%d-%H%M%S", time.localtime(now)) + f"-{n}"
+            n += 1
+        # Copied under a temporary name first: a snapshot dir is always complete
+        tmp_dir = os.path.join(self.directory, f".{name}.tmp")
+        os.makedirs(tmp_dir, exist_ok=True)
+        try:
+            for path in sources:
+                shutil.copyfile(path, os.path.join(tmp_dir, os.path.basename(path)))
+            atomic_write(os.path.join(tmp_dir, _SUMS), json.dumps(
+                {"session": session, "created": now, "sums": sums}, indent=1) + "\n")
+            os.rename(tmp_dir, os.path.join(self.directory, name))
+        except BaseException:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+        # The listings may have been copied while bisync rewrote them
+        if self.verify(name) is None or sums != {os.path.basename(p): file_sum(p) for p in sources}:
+            shutil.rmtree(os.path.join(self.directory, name), ignore_errors=True)
+            return None
+        self.prune()
+        return name
+
+    def prune(self):
+        for name in self.names()[max(self.keep, 1):]:
+            shutil.rmtree(os.path.join(self.directory, name), ignore_errors=True)
+
+    def restore(self, workdir, key):
+        """Puts back the newest intact snapshot of the session. Returns its name, or None.
+
+        Snapshots that fail their checksums are skipped (and reported).
+        """
+        for name in self.names():
+            info = self.info(name)
+            if info is None or _key(info.get("session", "")) != key:
+                continue
+            if self.verify(name) is None:
+                print(f"WARNING: Bisync snapshot {name} is damaged. Skipped.", file=sys.stderr)
+                continue
+            session = info["session"]
+            os.makedirs(workdir, exist_ok=True)
+            for suffix in LISTINGS:
+                with open(os.path.join(self.directory, name, session + suffix), "rb") as f:
+                    data = f.read()
+                tmp_path = os.path.join(workdir, f".{session}{suffix}.restore")
+                with open(tmp_path, "wb") as f:
+                    f.write(data)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, os.path.join(workdir, session + suffix))
+            for suffix in _STALE:
+                try:
+                    os.remove(os.path.join(workdir, session + suffix))
+                except FileNotFoundError:
+                    pass
+            return name
+        return None
+
+
+def load_keep(config):
+    try:
+        return max(0, int(config.get("BISYNC_SNAPSHOTS", DEFAULT_KEEP)))
+    except ValueError:
+        return DEFAULT_KEEP
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python3 -m cdsync.bisyncstate")
+    parser.add_argument("--snapshots", help="Snapshot directory (default: per checkout state dir)")
+    parser.add_argument("--workdir", help="bisync working directory (default: rclone's)")
+    sub = parser.add_subparsers(dest="command", required=True)
+    for command, help_text in (
+        ("save", "Snapshot the listings after a successful bisync"),
+        ("restore", "Put back the newest intact snapshot; prints its name"),
+    ):
+        p = sub.add_parser(command, help=help_text)
+        p.add_argument("remote")
+        p.add_argument("local")
+    sub.add_parser("list", help="Print the snapshots and whether they are intact")
+    args = parser.parse_args(argv)
+
+    keep = load_keep(Config(os.path.join(BASE_DIR, "config.env")))
+    snapshots = BisyncSnapshots(args.snapshots, keep)
+    workdir = args.workdir or default_workdir()
+    if args.command in ("save", "restore") and keep == 0:
+        return 1  # BISYNC_SNAPSHOTS=0: disabled
+    if args.command == "save":
+        name = snapshots.save(workdir, session_key(args.remote, args.local))
+        if name is None:
+            return 1
+        print(name)
+    elif args.command == "restore":
+        name = snapshots.restore(workdir, session_key(args.remote, args.local))
+        if name is None:
+            return 1
+        print(name)
+    elif args.command == "list":
+        for name in snapshots.names():
+            info = snapshots.info(name) or {}
+            state = "ok" if snapshots.verify(name) is not None else "DAMAGED"
+            print(f"{name}\t{state}\t{info.get('session', '?')}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
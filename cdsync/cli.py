@@ -0,0 +1,205 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+from cdsync import logarchive, pairs, schedule, status
+from cdsync.config import Config
+
+
+def human_size(num):
+    for unit in ("B", "KiB", "MiB", "GiB", "TiB"):
+        if abs(num) < 1024 or unit == "TiB":
+            return f"{num:.1f} {unit}" if unit != "B" else f"{num} B"
+        num /= 1024
+
+
+def format_pair(name, state):
+    if state["running"]:
+        files = f"{state['files_transferred']}/{state['files_total']} files" if state["files_total"] else \
+            f"{state['files_transferred']} files"
+        text = f"⚡ {state['mode']}, {files}"
+    else:
+        text = "💤 idle"
+    if state["queue_depth"]:
+        text += f", {state['queue_depth']} queued"
+    last = state.get("last_result")
+    if last:
+        when = time.strftime("%H:%M:%S", time.localtime(last["finished_at"]))
+        text += f", last {'✅' if last['exit_code'] == 0 else '❌'} {last['mode']} at {when}"
+    return f"   [{name}] {text}"
+
+
+def format_limits(limits):
+    text = f"{limits['bwlimit'] or 'unlimited'}"
+    if limits["transfers"]:
+        text += f", {limits['transfers']} transfers"
+    text += f" ({limits['window']} window"
+    if limits.get("override_until"):
+        text += f", until {time.strftime('%H:%M', time.localtime(limits['override_until']))}"
+    return text + ")"
+
+
+def format_status(state):
+    lines = []
+    if state["running"]:
+        elapsed = int(time.time() - state["started_at"]) if state["started_at"] else 0
+        target = f" ({state['target']})" if state["target"] else ""
+        lines.append(f"⚡ Running: {state['mode']}{target}, {elapsed}s")
+        files = f"{state['files_transferred']}/{state['files_total']} files" if state["files_total"] else \
+            f"{state['files_transferred']} files"
+        bytes_part = human_size(state["bytes_transferred"])
+        if state["bytes_total"]:
+            bytes_part += f" / {human_size(state['bytes_total'])}"
+        lines.append(f"   Transferred: {files}, {bytes_part}")
+    else:
+        lines.append("💤 Idle")
+    lines.append(f"   Queued: {state['queue_depth']}")
+
+    last = state.get("last_result")
+    if last:
+        ok = "✅" if last["exit_code"] == 0 else "❌"
+        when = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(last["finished_at"]))
+        duration = f", {last['duration']}s" if last.get("duration") is not None else ""
+        lines.append(f"   Last: {ok} {last['mode']} at {when} (exit {last['exit_code']}{duration})")
+
+    limits = state.get("limits")
+    if limits:
+        lines.append(f"   Limits: {format_limits(limits)}")
+
+    # Several sync pairs: one line each
+    by_pair = state.get("pairs", {})
+    if len(by_pair) > 1:
+        lines.append("   Pairs:")
+        lines.extend(format_pair(name, by_pair[name]) for name in sorted(by_pair))
+    return "\n".join(lines)
+
+
+def cmd_status(args):
+    if args.watch:
+        try:
+            for state in status.subscribe(args.socket):
+                if args.json:
+                    print(json.dumps(state), flush=True)
+                else:
+                    print(format_status(state) + "\n", flush=True)
+        except OSError:
+            print("CDSync watcher is not running (no status socket).", file=sys.stderr)
+            return 1
+        except KeyboardInterrupt:
+            pass
+        return 0
+
+    state = status.get_status(args.socket)
+    if state is None:
+        print("CDSync watcher is not running (no status socket).", file=sys.stderr)
+        return 1
+    print(json.dumps(state, indent=2) if args.json else format_status(state))
+    return 0
+
+
+def cmd_schedule(args):
+    loaded = schedule.load_schedule(_config())
+    if args.window and loaded.window(args.window) is None:
+        print(f"Unknown schedule window: {args.window}", file=sys.stderr)
+        return 2
+    if args.resume or args.window:
+        msg = {"op": "limits", "window": None if args.resume else args.window, "minutes": args.minutes}
+        if not status.publish(msg, args.socket):
+            print("CDSync watcher is not running (no status socket).", file=sys.stderr)
+            return 1
+        return 0
+    state = status.get_status(args.socket)
+    limits = state.get("limits") if state else None
+    active = limits["window"] if limits else loaded.active().name
+    for window in loaded.windows + [loaded.default]:
+        mark = "*" if window.name == active else " "
+        print(f"{mark} {window.describe()}  [{window.spec or 'otherwise'}]")
+    if limits and limits["window"] == schedule.UNLIMITED:
+        print(f"* {schedule.UNLIMITED}")
+    if limits and limits.get("override_until"):
+        print(f"Override until {time.strftime('%H:%M', time.localtime(limits['override_until']))}")
+    return 0
+
+
+def _config():
+    return Config(os.path.join(status.BASE_DIR, "config.env"))
+
+
+def cmd_history(args):
+    config = _config()
+    rel = args.path
+    pair = args.pair
+    if os.path.isabs(rel):
+        # The pair is the one whose directory holds the file
+        found = pairs.pair_for_path(pairs.load_pairs(config), os.path.abspath(rel))
+        if found is not None:
+            pair = pair or found.name
+            rel = os.path.relpath(os.path.abspath(rel), found.local_dir)
+    log_file = logarchive.default_log_path(config, pair=pair)
+    archive = logarchive.LogArchive(pair=pair)
+    try:
+        found = logarchive.last_synced(rel, log_file, archive)
+    finally:
+        archive.close()
+    if found is None:
+        print(f"No sync of {rel} in the log or its archive.", file=sys.stderr)
+        return 1
+    event, line = found
+    if args.json:
+        print(json.dumps({"path": event.path, "action": event.action, "timestamp": event.timestamp, "line": line}))
+    else:
+        print(f"{event.timestamp or '?'}  {event.action}  {event.path}")
+    return 0
+
+
+def cmd_errors(args):
+    try:
+        since = logarchive.parse_when(args.since)
+        until = logarchive.parse_when(args.until)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 2
+    log_file = logarchive.default_log_path(_config(), pair=args.pair)
+    archive = logarchive.LogArchive(pair=args.pair)
+    try:
+        for line in logarchive.errors(since, until, log_file, archive):
+            print(line.rstrip("\n"))
+    finally:
+        archive.close()
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="cdsync", description="CDSync command line")
+    parser.add_argument("--socket", help="Status socket path (default: per checkout)")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_status = sub.add_parser("status", help="Show live sync status")
+    p_status.add_argument("--watch", action="store_true", help="Follow status changes")
+    p_status.add_argument("--json", action="store_true", help="Raw JSON output")
+    p_status.set_defaults(func=cmd_status)
+
+    p_history = sub.add_parser("history", help="Show when a file was last synced")
+    p_history.add_argument("path", help="File in the sync directory (absolute or relative to it)")
+    p_history.add_argument("--json", action="store_true", help="Raw JSON output")
+    p_history.add_argument("--pair", help="Sync pair (default: the one holding the path, else the default pair)")
+    p_history.set_defaults(func=cmd_history)
+
+    p_errors = sub.add_parser("errors", help="Show logged errors, including rotated logs")
+    p_errors.add_argument("--since", default="today",
+                          help='"today", "yesterday", "2h", "3d" or "YYYY-MM-DD[ HH:MM]" (default: today)')
+    p_errors.add_argument("--until", default="now", help="Same formats (default: now)")
+    p_errors.add_argument("--pair", help="Sync pair (default: the default pair)")
+    p_errors.set_defaults(func=cmd_errors)
+
+    p_schedule = sub.add_parser("schedule", help="Show the bandwidth schedule or override it for a while")
+    p_schedule.add_argument("window", nargs="?", help='Window to force ("unlimited", "default" or a configured one)')
+    p_schedule.add_argument("--minutes", type=float, default=schedule.OVERRIDE_MINUTES,
+                            help=f"Override length (default: {schedule.OVERRIDE_MINUTES})")
+    p_schedule.add_argument("--resume", action="store_true", help="End the override, follow the schedule again")
+    p_schedule.set_defaults(func=cmd_schedule)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
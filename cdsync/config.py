@@ -0,0 +1,124 @@
+import os
+import tempfile
+
+
+def atomic_write(path, content):
+    """Writes `content` to `path` via temp file + rename.
+
+    Readers (e.g. `source config.env` in the shell scripts) see either the old
+    or the new file, never a half-written one. Permissions are preserved.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(path)}.")
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+        try:
+            os.chmod(tmp_path, os.stat(path).st_mode & 0o7777)
+        except FileNotFoundError:
+            pass
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def _parse_value(raw):
+    # Remove quotes if present
+    val = raw.strip('"').strip("'")
+    # Remove inline comments if any (simple approach)
+    if " # " in val:
+        val = val.split(" # ", 1)[0]
+    return val.strip()
+
+
+class Config:
+    """Cached view of config.env, shared by all tray code paths.
+
+    The file is parsed once and only re-read when its mtime/size/inode
+    changes. Updates are written atomically; update() applies several
+    changes in a single write.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lines = []
+        self.values = {}
+        self.stamp = None
+
+    def _current_stamp(self):
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+    def refresh(self):
+        """Re-parses the file if it changed on disk (one stat otherwise)."""
+        stamp = self._current_stamp()
+        if stamp == self.stamp:
+            return
+        self.stamp = stamp
+        self.lines = []
+        self.values = {}
+        if stamp is None:
+            return
+        try:
+            with open(self.path, "r") as f:
+                self.lines = f.read().splitlines()
+        except OSError:
+            self.stamp = None
+            return
+        for line in self.lines:
+            line = line.strip()
+            # Match VAR=VALUE, ignoring comments #
+            if not line or line.startswith("#") or "=" not in line:
+                continue
+            name, raw = line.split("=", 1)
+            # Later assignments win, like `source config.env`
+            self.values[name.strip()] = _parse_value(raw)
+
+    def invalidate(self):
+        self.stamp = None
+
+    def get(self, name, default=None):
+        self.refresh()
+        return self.values.get(name, default)
+
+    def set(self, name, value):
+        self.update({name: value})
+
+    def update(self, changes):
+        """Applies {NAME: value} changes in one atomic write."""
+        self._write(changes)
+
+    def _write(self, changes):
+        self.refresh()
+        # Skip the write entirely when nothing actually changes
+        values = {name: str(value) for name, value in changes.items()
+                  if self.values.get(name) != str(value)}
+        if not values:
+            return
+        lines = list(self.lines)
+        remaining = dict(values)
+        for i, line in enumerate(lines):
+            stripped = line.strip()
+            if stripped.startswith("#") or "=" not in stripped:
+                continue
+            name = stripped.split("=", 1)[0].strip()
+            if name in values:
+                # Every active assignment is updated, so the last one
+                # (the one the shell scripts honour) matches too
+                lines[i] = f"{name}={values[name]}"
+                remaining.pop(name, None)
+        for name, value in remaining.items():
+            lines.append(f"{name}={value}")
+
+        atomic_write(self.path, "\n".join(lines) + "\n")
+        self.invalidate()
+        self.refresh()
@@ -0,0 +1,87 @@
+"""Scoped directory sync planning for the watcher.
+
+Directory events used to trigger a full-drive bisync. Instead, the affected
+directories are reduced to the smallest set of subtrees that covers them:
+created/moved-in directories are uploaded with `rclone copy` of that
+subtree, deleted/moved-out ones are purged remotely. When the changes are
+spread over too many subtrees, they are grouped under their lowest common
+ancestor. Only changes at the sync root itself fall back to a full bisync.
+"""
+import os
+
+# More subtrees than this are grouped under their lowest common ancestor
+MAX_SCOPES = 8
+
+COPY = "+"
+PURGE = "-"
+
+
+def is_under(path, root):
+    return path == root or path.startswith(root.rstrip("/") + "/")
+
+
+def covering_roots(paths):
+    """Drops every path that lies below another path of the set."""
+    roots = []
+    for path in sorted(set(paths)):
+        if roots and is_under(path, roots[-1]):
+            continue
+        roots.append(path)
+    return roots
+
+
+def common_ancestor(paths):
+    return os.path.commonpath(list(paths))
+
+
+class DirSyncPlan:
+    """Subtrees to upload (COPY) and to delete remotely (PURGE), as absolute paths."""
+
+    def __init__(self, copy_roots, purge_roots):
+        self.copy_roots = copy_roots
+        self.purge_roots = purge_roots
+
+    def covers(self, path):
+        return any(is_under(path, root) for root in self.copy_roots + self.purge_roots)
+
+    def lines(self, local_dir):
+        """Stdin lines for `cdsync-core.sh --dir-sync`: "+ rel" / "- rel"."""
+        prefix = local_dir.rstrip("/") + "/"
+        out = [f"{COPY} {p[len(prefix):]}" for p in self.copy_roots]
+        out += [f"{PURGE} {p[len(prefix):]}" for p in self.purge_roots]
+        return out
+
+    def __len__(self):
+        return len(self.copy_roots) + len(self.purge_roots)
+
+
+def plan_directory_sync(dir_events, local_dir, max_scopes=MAX_SCOPES):
+    """Builds a DirSyncPlan from {dir path: event names}, or None for a full bisync.
+
+    The decision uses the directory's state now: a directory that exists is
+    (re)uploaded, one that is gone is purged. This also covers create+delete
+    or delete+recreate sequences within one batch.
+    """
+    local_dir = local_dir.rstrip("/")
+    present = []
+    gone = []
+    for path in dir_events:
+        if path == local_dir or not is_under(path, local_dir) or "\n" in path:
+            return None  # The sync root itself changed (or unlisted name)
+        (present if os.path.isdir(path) else gone).append(path)
+
+    copy_roots = covering_roots(present)
+    purge_roots = covering_roots(gone)
+
+    # Purges nested in an uploaded subtree are kept: `rclone copy` never deletes
+    if len(copy_roots) > max_scopes:
+        lca = common_ancestor(copy_roots)
+        if lca == local_dir:
+            return None  # Spread over the whole drive: a full bisync is cheaper
+        copy_roots = [lca]
+    if len(purge_roots) > max_scopes:
+        # Purging an ancestor could delete unrelated remote data; a full
+        # bisync handles wide-spread deletions safely
+        return None
+
+    return DirSyncPlan(copy_roots, purge_roots)
@@ -0,0 +1,143 @@
+"""Self-echo suppression ("Smart Ignore") for local changes made by rclone.
+
+After a run, the single pass over its rclone log (cdsync/rclonelog.py)
+sends every path rclone wrote or deleted locally together with its
+resulting size and mtime. The watcher keeps those entries in memory and
+skips inotify events whose file still matches, so downloads are not
+uploaded straight back.
+"""
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from cdsync import status
+
+DEFAULT_TTL = 300          # seconds an entry waits for its inotify events
+MATCH_GRACE = 15           # keep matched entries briefly for trailing events
+DEFAULT_MAX_ENTRIES = 100000
+
+
+class SmartIgnore:
+    """Bounded, TTL-expiring set of expected local changes.
+
+    Keyed by path; each entry carries the expected size and mtime (None for
+    an expected deletion). Lookups are O(1), and entries survive across
+    batches until they expire.
+    """
+
+    def __init__(self, ttl=DEFAULT_TTL, max_entries=DEFAULT_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries = OrderedDict()  # path -> (size, mtime_ns, expires_at)
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def add(self, path, size=None, mtime_ns=None, now=None):
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            self.entries[path] = (size, mtime_ns, now + self.ttl)
+            self.entries.move_to_end(path)
+            # Bounded: drop the oldest expectations first
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def expire(self, now=None):
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            # Entries are (mostly) in expiry order; stop at the first live one
+            while self.entries:
+                path, (_, _, expires) = next(iter(self.entries.items()))
+                if expires > now:
+                    break
+                self.entries.popitem(last=False)
+
+    def match(self, path, now=None):
+        """True if the current state of `path` is the one rclone left behind."""
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            entry = self.entries.get(path)
+            if entry is None:
+                return False
+            size, mtime_ns, expires = entry
+            if expires <= now:
+                del self.entries[path]
+                return False
+
+            try:
+                st = os.stat(path)
+            except OSError:
+                st = None
+
+            if size is None:
+                matched = st is None  # Expected deletion
+            else:
+                matched = st is not None and st.st_size == size and \
+                    (mtime_ns is None or st.st_mtime_ns == mtime_ns)
+
+            if not matched:
+                # The user changed it since: that change must be synced
+                del self.entries[path]
+                return False
+
+            # Downloads emit several events (create, close_write, moved_to)
+            # that may land in different batches
+            self.entries[path] = (size, mtime_ns, min(expires, now + MATCH_GRACE))
+            return True
+
+    def handle_message(self, msg):
+        """Status hub handler for {"op": "ignore", "entries": [[path, size, mtime_ns], ...]}."""
+        for path, size, mtime_ns in msg.get("entries", []):
+            self.add(path, size, mtime_ns)
+
+
+# Lines where rclone changed something on the LOCAL side (Path2):
+#   bisync download:   "- Path1    Queue copy to Path2          - path/to/file"
+#   bisync delete:     "- Path2    Deleted                      - path/to/file"
+#   plain operations:  "INFO  : path/to/file: Copied (new)" / "...: Deleted"
+_LOCAL_CHANGE_RE = re.compile(
+    r"Queue copy to Path2\s+-\s+(?P<queued>.*)"
+    r"|Path2\s+Deleted\s+-\s+(?P<deleted>.*)"
+    r"|INFO\s*:\s*(?P<op_path>.*?):\s*(?:Copied|Deleted)"
+)
+
+
+def local_change(line):
+    """Relative path a text log line says rclone wrote or deleted locally, or None."""
+    m = _LOCAL_CHANGE_RE.search(line)
+    if m:
+        path = (m.group("queued") or m.group("deleted") or m.group("op_path")).strip()
+        if path:
+            return path
+    return None
+
+
+def fingerprint(path):
+    """(size, mtime_ns) of a local file, or (None, None) if it is gone."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None, None
+    return st.st_size, st.st_mtime_ns
+
+
+def send(paths, local_dir, socket_path=None, chunk=5000):
+    """Sends ignore entries for relative `paths` (with their current size/mtime)."""
+    seen = set()
+    entries = []
+    for rel in paths:
+        full = os.path.join(local_dir, rel)
+        if full in seen:
+            continue
+        seen.add(full)
+        size, mtime_ns = fingerprint(full)
+        entries.append([full, size, mtime_ns])
+
+    for i in range(0, len(entries), chunk):
+        if not status.publish({"op": "ignore", "entries": entries[i:i + chunk]}, socket_path):
+            break  # Watcher not running: nothing to suppress
+    return len(entries)
+
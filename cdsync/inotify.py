@@ -0,0 +1,183 @@
+"""Minimal recursive inotify binding (ctypes, Linux only)."""
+import ctypes
+import ctypes.util
+import errno
+import os
+import re
+import struct
+
+IN_ACCESS = 0x00000001
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_DONT_FOLLOW = 0x02000000
+IN_EXCL_UNLINK = 0x04000000
+IN_ISDIR = 0x40000000
+
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = os.O_CLOEXEC
+
+# Same event classes the old `inotifywait -e` call listened to
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_MOVED_FROM
+
+EVENT_NAMES = (
+    (IN_CLOSE_WRITE, "close_write"),
+    (IN_MOVED_TO, "moved_to"),
+    (IN_CREATE, "create"),
+    (IN_DELETE, "delete"),
+    (IN_MOVED_FROM, "moved_from"),
+)
+
+# Same exclusions as the old `inotifywait --exclude`
+DEFAULT_EXCLUDE = re.compile(
+    r"(\.git/|\.lock|cdsync\.log|\.swp|\.tmp|\.part|\.~tmp~|\.goutputstream|\.\.path)"
+)
+
+_EVENT_HEADER = struct.Struct("iIII")
+
+_libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+_libc.inotify_init1.argtypes = [ctypes.c_int]
+_libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+_libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+
+
+class InotifyEvent:
+    __slots__ = ("mask", "cookie", "path", "is_dir")
+
+    def __init__(self, mask, cookie, path):
+        self.mask = mask
+        self.cookie = cookie
+        self.path = path
+        self.is_dir = bool(mask & IN_ISDIR)
+
+    @property
+    def name(self):
+        for flag, name in EVENT_NAMES:
+            if self.mask & flag:
+                return name
+        return "overflow" if self.mask & IN_Q_OVERFLOW else "other"
+
+    def __repr__(self):
+        return f"InotifyEvent({self.name}{',ISDIR' if self.is_dir else ''}, {self.path!r})"
+
+
+class RecursiveWatch:
+    """Watches a directory tree like `inotifywait -m -r`.
+
+    New directories (created or moved in) are watched as they appear, and
+    directories moved out or deleted are dropped. Several trees (one per
+    sync pair) can share the instance: pass a list of roots.
+    """
+
+    def __init__(self, root, mask=WATCH_MASK, exclude=DEFAULT_EXCLUDE):
+        roots = [root] if isinstance(root, str) else list(root)
+        self.roots = [os.path.abspath(r) for r in roots]
+        self.root = self.roots[0]
+        self.mask = mask | IN_ONLYDIR | IN_DONT_FOLLOW | IN_EXCL_UNLINK
+        self.exclude = exclude
+        self.fd = _libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+        self.paths = {}  # wd -> directory path
+        self.wds = {}    # directory path -> wd
+        for top in self.roots:
+            self.add_tree(top)
+
+    def fileno(self):
+        return self.fd
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+    def _excluded(self, path):
+        return self.exclude is not None and self.exclude.search(path + "/") is not None
+
+    def add_watch(self, path):
+        if path in self.wds or self._excluded(path):
+            return
+        wd = _libc.inotify_add_watch(self.fd, os.fsencode(path), self.mask)
+        if wd < 0:
+            err = ctypes.get_errno()
+            if err in (errno.ENOENT, errno.ENOTDIR, errno.EACCES):
+                return  # Vanished or unreadable meanwhile
+            raise OSError(err, f"inotify_add_watch({path}): {os.strerror(err)}")
+        self.paths[wd] = path
+        self.wds[path] = wd
+
+    def add_tree(self, top):
+        """Watches `top` and every directory below it. Returns files found.
+
+        Files that appeared before the watch was in place would otherwise go
+        unnoticed: read_events reports them as created after the directory.
+        """
+        found = []
+        for dirpath, dirnames, filenames in os.walk(top, onerror=lambda e: None):
+            if self._excluded(dirpath):
+                dirnames[:] = []
+                continue
+            self.add_watch(dirpath)
+            found.extend(os.path.join(dirpath, f) for f in filenames)
+        return found
+
+    def remove_tree(self, top):
+        prefix = top + "/"
+        for path in [p for p in self.wds if p == top or p.startswith(prefix)]:
+            wd = self.wds.pop(path)
+            self.paths.pop(wd, None)
+            _libc.inotify_rm_watch(self.fd, wd)
+
+    def read_events(self):
+        """Returns the pending events (empty list if none are ready)."""
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+
+        events = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, cookie, length = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b"\0")
+            offset += length
+
+            if mask & IN_Q_OVERFLOW:
+                # Lost events may belong to any tree
+                events.extend(InotifyEvent(mask, 0, top) for top in self.roots)
+                continue
+            if mask & IN_IGNORED:
+                path = self.paths.pop(wd, None)
+                if path is not None:
+                    self.wds.pop(path, None)
+                continue
+
+            directory = self.paths.get(wd)
+            if directory is None:
+                continue
+            path = os.path.join(directory, os.fsdecode(name)) if name else directory
+            if self._excluded(path):
+                continue
+
+            found = ()
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    found = self.add_tree(path)
+                elif mask & (IN_MOVED_FROM | IN_DELETE):
+                    self.remove_tree(path)
+
+            events.append(InotifyEvent(mask, cookie, path))
+            # Files already in the new directory before its watch existed
+            events.extend(InotifyEvent(IN_CREATE, 0, f) for f in found if not self._excluded(f))
+        return events
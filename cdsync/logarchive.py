@@ -0,0 +1,393 @@
+"""Rotation of the CDSync log into compressed, indexed segments.
+
+cdsync-core.sh calls `rotate` when a run ends (it still holds the lock, so
+nothing else is writing the log). Once the log is larger than LOG_MAX_MB or
+its first line is older than LOG_MAX_AGE_DAYS, it is renamed away and
+compressed into $XDG_STATE_HOME/cdsync/<instance>-logs/<YYYYmmdd-HHMMSS>.log.gz.
+Segments older than LOG_KEEP_DAYS are deleted.
+
+A segment is a series of gzip members of about BLOCK_SIZE bytes of log
+each: `zcat` reads it as one file, and a single block can be decompressed
+on its own. The SQLite index next to the segments records, for every
+block, its offset in the segment file, its time range and its error count,
+and for every path an rclone operation touched, the block and time of the
+last operation on it in each segment. "When was this file last synced?"
+and "errors since yesterday" read one or a few blocks instead of the whole
+history.
+"""
+import argparse
+import glob
+import gzip
+import os
+import re
+import sqlite3
+import sys
+import time
+
+from cdsync.config import Config
+from cdsync.logparse import RCLONE, classify_line, is_error_line
+from cdsync.logtail import search_backwards
+from cdsync.status import BASE_DIR, DEFAULT_PAIR, current_pair, state_path
+
+MiB = 1024 * 1024
+DAY = 86400
+
+DEFAULT_MAX_MB = 20
+DEFAULT_MAX_AGE_DAYS = 7
+DEFAULT_KEEP_DAYS = 180
+
+# Uncompressed log bytes per gzip member
+BLOCK_SIZE = 256 * 1024
+
+# Suffix of a log renamed away but not archived yet (picked up again after a crash)
+_PENDING = ".rotating-"
+
+# "2024-01-31 12:00:00 - ..." (cdsync) or "2024/01/31 12:00:00 INFO : ..." (rclone)
+_LINE_TS_RE = re.compile(r"(\d{4})[/-](\d{2})[/-](\d{2}) (\d{2}):(\d{2}):(\d{2})")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS segments (
+    name     TEXT PRIMARY KEY,
+    start_ts REAL,
+    end_ts   REAL,
+    lines    INTEGER,
+    size     INTEGER
+);
+CREATE TABLE IF NOT EXISTS blocks (
+    segment  TEXT NOT NULL,
+    offset   INTEGER NOT NULL,
+    length   INTEGER NOT NULL,
+    start_ts REAL,
+    end_ts   REAL,
+    errors   INTEGER NOT NULL,
+    PRIMARY KEY (segment, offset)
+);
+CREATE INDEX IF NOT EXISTS blocks_end ON blocks(end_ts);
+CREATE TABLE IF NOT EXISTS paths (
+    path     TEXT NOT NULL,
+    segment  TEXT NOT NULL,
+    offset   INTEGER NOT NULL,
+    ts       REAL,
+    action   TEXT,
+    PRIMARY KEY (path, segment)
+);
+"""
+
+
+def default_archive_dir(base_dir=BASE_DIR, pair=None):
+    return state_path("-logs", base_dir, pair)
+
+
+def default_log_path(config, base_dir=BASE_DIR, pair=None):
+    """The CDSync log of a sync pair, as cdsync-core.sh resolves it."""
+    pair = pair or current_pair()
+    if pair != DEFAULT_PAIR:
+        return config.get(f"PAIR_{pair}_LOG_FILE", "") or os.path.join(base_dir, f"cdsync-{pair}.log")
+    return config.get("CUSTOM_LOG_FILE", "") or os.path.join(base_dir, "cdsync.log")
+
+
+class _Clock:
+    """Epoch seconds of log timestamps (local time), one mktime per hour seen."""
+
+    def __init__(self):
+        self.hours = {}
+
+    def parse(self, line):
+        m = _LINE_TS_RE.match(line)
+        if m is None:
+            return None
+        y, mo, d, h, mi, s = (int(v) for v in m.groups())
+        key = (y, mo, d, h)
+        hour = self.hours.get(key)
+        if hour is None:
+            try:
+                hour = time.mktime((y, mo, d, h, 0, 0, 0, 0, -1))
+            except (OverflowError, ValueError):
+                return None
+            self.hours[key] = hour
+        return hour + mi * 60 + s
+
+
+def first_timestamp(path, limit=64 * 1024):
+    """Time of the first timestamped line in the first `limit` bytes, or None."""
+    clock = _Clock()
+    try:
+        with open(path, "r", errors="replace") as f:
+            for line in f.read(limit).splitlines():
+                ts = clock.parse(line)
+                if ts is not None:
+                    return ts
+    except OSError:
+        pass
+    return None
+
+
+class LogArchive:
+    def __init__(self, directory=None, pair=None):
+        self.directory = directory or default_archive_dir(pair=pair)
+        os.makedirs(self.directory, exist_ok=True)
+        self.db = sqlite3.connect(os.path.join(self.directory, "index.db"), timeout=30)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.executescript(_SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    # --- Rotation ---
+
+    def rotate(self, log_file, max_bytes, max_age=None, keep=None, now=None):
+        """Archives the log if it is too large or too old. Returns new segment names."""
+        now = time.time() if now is None else now
+        try:
+            size = os.path.getsize(log_file)
+        except OSError:
+            size = 0
+        if size and (size >= max_bytes or (max_age and (first_timestamp(log_file) or now) < now - max_age)):
+            pending = f"{log_file}{_PENDING}{time.strftime('%Y%m%d-%H%M%S', time.localtime(now))}"
+            # Writers open the log by path: the next line starts a new file
+            os.rename(log_file, pending)
+
+        archived = []
+        # Includes logs left behind by an interrupted rotation
+        for pending in sorted(glob.glob(glob.escape(log_file) + _PENDING + "*")):
+            archived.append(self.archive(pending, pending.rsplit(_PENDING, 1)[1] + ".log.gz"))
+            os.remove(pending)
+        if keep:
+            self.expire(now - keep)
+        return archived
+
+    def archive(self, source, name):
+        """Compresses `source` into segment `name` and indexes it."""
+        clock = _Clock()
+        blocks = []         # (offset, length, start_ts, end_ts, errors)
+        paths = {}          # path -> (block number, ts, action)
+        chunk = []
+        chunk_size = 0
+        start_ts = end_ts = last_ts = None
+        block_errors = 0
+        lines = 0
+        raw_size = 0
+        target = os.path.join(self.directory, name)
+        tmp = target + ".part"
+
+        with open(source, "rb") as src, open(tmp, "wb") as out:
+            def flush():
+                offset = out.tell()
+                out.write(gzip.compress(b"".join(chunk), mtime=0))
+                blocks.append((offset, out.tell() - offset, start_ts, end_ts, block_errors))
+
+            for raw in src:
+                text = raw.decode("utf-8", errors="replace")
+                ts = clock.parse(text)
+                if ts is None:
+                    ts = last_ts  # Continuation lines belong to the last timestamp
+                last_ts = ts
+                if ts is not None:
+                    start_ts = ts if start_ts is None else start_ts
+                    end_ts = ts
+                if is_error_line(text):
+                    block_errors += 1
+                event = classify_line(text)
+                if event is not None and event.source == RCLONE:
+                    paths[event.path] = (len(blocks), ts, event.action)
+                chunk.append(raw)
+                chunk_size += len(raw)
+                lines += 1
+                raw_size += len(raw)
+                if chunk_size >= BLOCK_SIZE:
+                    flush()
+                    chunk, chunk_size, block_errors = [], 0, 0
+                    start_ts = end_ts = None
+            if chunk:
+                flush()
+            out.flush()
+            os.fsync(out.fileno())
+        os.replace(tmp, target)
+
+        seg_start = next((b[2] for b in blocks if b[2] is not None), None)
+        seg_end = next((b[3] for b in reversed(blocks) if b[3] is not None), None)
+        with self.db:
+            self._forget(name)
+            self.db.execute("INSERT INTO segments VALUES (?, ?, ?, ?, ?)",
+                            (name, seg_start, seg_end, lines, raw_size))
+            self.db.executemany("INSERT INTO blocks VALUES (?, ?, ?, ?, ?, ?)",
+                                ((name,) + block for block in blocks))
+            self.db.executemany(
+                "INSERT INTO paths VALUES (?, ?, ?, ?, ?)",
+                ((path, name, blocks[n][0], ts, action) for path, (n, ts, action) in paths.items()),
+            )
+        return name
+
+    def expire(self, before):
+        """Deletes segments whose last line is older than `before`."""
+        old = [r[0] for r in self.db.execute("SELECT name FROM segments WHERE end_ts < ?", (before,))]
+        with self.db:
+            for name in old:
+                self._forget(name)
+        for name in old:
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                pass
+        return old
+
+    def _forget(self, name):
+        for table in ("segments", "blocks", "paths"):
+            column = "name" if table == "segments" else "segment"
+            self.db.execute(f"DELETE FROM {table} WHERE {column} = ?", (name,))
+
+    # --- Lookups ---
+
+    def read_block(self, segment, offset, length):
+        """Lines of one block, decoded."""
+        with open(os.path.join(self.directory, segment), "rb") as f:
+            f.seek(offset)
+            data = gzip.decompress(f.read(length))
+        return data.decode("utf-8", errors="replace").splitlines()
+
+    def last_synced(self, rel):
+        """(ActivityEvent, line) of the newest archived operation on `rel`, or None."""
+        row = self.db.execute(
+            "SELECT segment, offset, length FROM paths JOIN blocks USING (segment, offset) "
+            "WHERE path = ? ORDER BY ts DESC LIMIT 1", (rel,)
+        ).fetchone()
+        if row is None:
+            return None
+        try:
+            lines = self.read_block(*row)
+        except OSError:
+            return None
+        for line in reversed(lines):
+            found = _operation_on(line, rel)
+            if found is not None:
+                return found, line
+        return None
+
+    def errors(self, since, until):
+        """Yields archived error lines logged between `since` and `until`, oldest first."""
+        rows = self.db.execute(
+            "SELECT segment, offset, length FROM blocks JOIN segments ON segments.name = blocks.segment "
+            "WHERE errors > 0 AND blocks.end_ts >= ? AND blocks.start_ts <= ? "
+            "ORDER BY segments.start_ts, offset", (since, until)
+        ).fetchall()
+        for row in rows:
+            try:
+                lines = self.read_block(*row)
+            except OSError:
+                continue
+            yield from _errors_in(lines, since, until)
+
+
+def _operation_on(line, rel):
+    if rel not in line:
+        return None
+    event = classify_line(line)
+    if event is not None and event.source == RCLONE and event.path == rel:
+        return event
+    return None
+
+
+def _errors_in(lines, since, until):
+    clock = _Clock()
+    ts = None
+    for line in lines:
+        ts = clock.parse(line) or ts
+        if ts is not None and since <= ts <= until and is_error_line(line):
+            yield line
+
+
+def last_synced(rel, log_file, archive):
+    """(ActivityEvent, line) of the newest operation on `rel`: live log first, then the archive."""
+    try:
+        for _, line in search_backwards(log_file, lambda text: _operation_on(text, rel) is not None):
+            return _operation_on(line, rel), line
+    except OSError:
+        pass
+    return archive.last_synced(rel)
+
+
+def errors(since, until, log_file, archive):
+    """Yields error lines between `since` and `until` from the archive and the live log."""
+    yield from archive.errors(since, until)
+    start = first_timestamp(log_file)
+    if start is not None and start > until:
+        return
+    try:
+        with open(log_file, "r", errors="replace") as f:
+            yield from _errors_in(f, since, until)
+    except OSError:
+        pass
+
+
+def parse_when(text, now=None):
+    """Epoch seconds for "now", "today", "yesterday", "2h", "3d", "YYYY-MM-DD[ HH:MM[:SS]]"."""
+    now = time.time() if now is None else now
+    text = text.strip().lower()
+    midnight = time.mktime(time.localtime(now)[:3] + (0, 0, 0, 0, 0, -1))
+    if text == "now":
+        return now
+    if text == "today":
+        return midnight
+    if text == "yesterday":
+        return time.mktime(time.localtime(midnight - DAY / 2)[:3] + (0, 0, 0, 0, 0, -1))
+    m = re.fullmatch(r"(\d+)([mhd])", text)
+    if m:
+        return now - int(m.group(1)) * {"m": 60, "h": 3600, "d": DAY}[m.group(2)]
+    for fmt in ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%d"):
+        try:
+            return time.mktime(time.strptime(text, fmt))
+        except ValueError:
+            continue
+    raise ValueError(f"unrecognized time: {text!r}")
+
+
+def load_limits(config):
+    """(max bytes, max age, keep) in bytes and seconds, from config.env."""
+    values = []
+    for name, default, scale in (
+        ("LOG_MAX_MB", DEFAULT_MAX_MB, MiB),
+        ("LOG_MAX_AGE_DAYS", DEFAULT_MAX_AGE_DAYS, DAY),
+        ("LOG_KEEP_DAYS", DEFAULT_KEEP_DAYS, DAY),
+    ):
+        try:
+            values.append(float(config.get(name, default)) * scale)
+        except (TypeError, ValueError):
+            values.append(default * scale)
+    return tuple(values)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python3 -m cdsync.logarchive")
+    parser.add_argument("--archive", help="Archive directory (default: per checkout state dir)")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_rot = sub.add_parser("rotate", help="Archive the log if it is over LOG_MAX_MB or LOG_MAX_AGE_DAYS")
+    p_rot.add_argument("log_file")
+    p_last = sub.add_parser("last", help="Print the last operation on a path")
+    p_last.add_argument("path", help="Path relative to the sync directory")
+    p_err = sub.add_parser("errors", help="Print error lines in a time range")
+    p_err.add_argument("--since", default="today")
+    p_err.add_argument("--until", default="now")
+    args = parser.parse_args(argv)
+
+    config = Config(os.path.join(BASE_DIR, "config.env"))
+    archive = LogArchive(args.archive)
+    try:
+        if args.command == "rotate":
+            max_bytes, max_age, keep = load_limits(config)
+            for name in archive.rotate(args.log_file, max_bytes, max_age, keep):
+                print(name)
+        elif args.command == "last":
+            found = last_synced(args.path, default_log_path(config), archive)
+            if found is None:
+                return 1
+            print(found[1])
+        elif args.command == "errors":
+            for line in errors(parse_when(args.since), parse_when(args.until), default_log_path(config), archive):
+                print(line.rstrip("\n"))
+    finally:
+        archive.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,151 @@
+import os
+import re
+
+# Actions emitted by classify_line()
+COPIED = "copied"
+UPDATED = "updated"
+DELETED = "deleted"
+MOVED = "moved"
+NEW = "new"            # Bisync: "File is new" / "File is newer"
+DIR_NEW = "dir_new"
+DIR_DELETED = "dir_deleted"
+DIR_UPDATED = "dir_updated"
+
+# Sources
+RCLONE = "rclone"      # Plain rclone operation lines ("path: Copied (new)")
+BISYNC = "bisync"      # Bisync delta lines ("- Path1  File is new  - path")
+
+# One alternation covering every line shape we display. The alternatives are
+# tried in the same order as the old per-pattern searches, so precedence is
+# unchanged: plain file/dir operations, bisync file deltas, bisync dir deltas.
+_EVENT_RE = re.compile(
+    r"INFO\s+:\s+(?:"
+    r"(?P<op_path>.*?):\s+(?P<op>Copied|Updated|Deleted|Moved"
+    r"|Made directory|Making directory|Removed directory|Removing directory)"
+    r"|-\s+Path[12]\s+(?P<bi>File is newer|File is new)\s+-\s+(?P<bi_path>.*)"
+    r"|.*?(?P<dir>Directory\s+(?:is new|was deleted|is newer|is older)).*?-\s+(?P<dir_path>.*)"
+    r")"
+)
+
+# Rclone uses YYYY/MM/DD, the shell scripts use YYYY-MM-DD
+_TIMESTAMP_RE = re.compile(r"(?:(\d{4}[/-]\d{2}[/-]\d{2})\s+)?(\d{2}:\d{2}:\d{2})")
+
+_OP_ACTIONS = {
+    "Copied": COPIED,
+    "Updated": UPDATED,
+    "Deleted": DELETED,
+    "Moved": MOVED,
+    "Made directory": DIR_NEW,
+    "Making directory": DIR_NEW,
+    "Removed directory": DIR_DELETED,
+    "Removing directory": DIR_DELETED,
+}
+
+_ICONS = {
+    COPIED: "✅",
+    UPDATED: "🔄",
+    DELETED: "🗑️",
+    MOVED: "➡️",
+    NEW: "🆕",
+    DIR_NEW: "✅📂",
+    DIR_DELETED: "🗑️📂",
+    DIR_UPDATED: "🔄📂",
+}
+
+
+class ActivityEvent:
+    """A single sync action recognized in the log."""
+
+    __slots__ = ("timestamp", "action", "path", "source")
+
+    def __init__(self, timestamp, action, path, source):
+        self.timestamp = timestamp  # "YYYY-MM-DD HH:MM:SS", "HH:MM:SS" or ""
+        self.action = action
+        self.path = path
+        self.source = source
+
+    def __eq__(self, other):
+        if not isinstance(other, ActivityEvent):
+            return NotImplemented
+        return (self.timestamp, self.action, self.path, self.source) == \
+            (other.timestamp, other.action, other.path, other.source)
+
+    def __hash__(self):
+        return hash((self.timestamp, self.action, self.path, self.source))
+
+    def __repr__(self):
+        return f"ActivityEvent({self.timestamp!r}, {self.action!r}, {self.path!r}, {self.source!r})"
+
+
+def classify_line(line):
+    """Returns an ActivityEvent for a displayable log line, or None."""
+    m = _EVENT_RE.search(line)
+    if m is None:
+        return None
+
+    op = m.group("op")
+    if op is not None:
+        action = _OP_ACTIONS[op]
+        # "Copied (replaced existing)" is actually an UPDATE
+        if action == COPIED and "(replaced existing)" in line:
+            action = UPDATED
+        path = m.group("op_path").strip()
+        source = RCLONE
+    elif m.group("bi") is not None:
+        action = NEW
+        path = m.group("bi_path").strip()
+        source = BISYNC
+    else:
+        words = m.group("dir")
+        if "deleted" in words:
+            action = DIR_DELETED
+        elif "newer" in words or "older" in words:
+            action = DIR_UPDATED
+        else:
+            action = DIR_NEW
+        path = m.group("dir_path").strip()
+        source = BISYNC
+
+    # Timestamps are only extracted for the (rare) matching lines
+    timestamp = ""
+    ts = _TIMESTAMP_RE.search(line)
+    if ts:
+        date_part, time_part = ts.groups()
+        if date_part:
+            timestamp = f"{date_part.replace('/', '-')} {time_part}"
+        else:
+            timestamp = time_part
+
+    return ActivityEvent(timestamp, action, path, source)
+
+
+def classify_operation(timestamp, path, msg):
+    """Returns an ActivityEvent for a structured rclone record (JSON log), or None.
+
+    `path` is the record's "object" and `msg` its message without the path,
+    e.g. ("dir/file.txt", "Copied (new)").
+    """
+    for op, action in _OP_ACTIONS.items():
+        if msg.startswith(op):
+            if action == COPIED and "(replaced existing)" in msg:
+                action = UPDATED
+            return ActivityEvent(timestamp, action, path, RCLONE)
+    return None
+
+
+def format_event(event):
+    """Formats an event for the tray: "[YYYY-MM-DD HH:MM] ICON name"."""
+    if event.timestamp:
+        # Drop the seconds: [YYYY-MM-DD HH:MM] or [HH:MM]
+        prefix = f"[{event.timestamp[:-3]}] "
+    else:
+        prefix = ""
+    return f"{prefix}{_ICONS[event.action]} {os.path.basename(event.path)}"
+
+
+_ERROR_MARKERS = ("ERROR", "CRITICAL", "FAILED", "❌")
+
+
+def is_error_line(line):
+    """True for rclone errors and cdsync failure messages."""
+    return any(marker in line for marker in _ERROR_MARKERS)
@@ -0,0 +1,198 @@
+import os
+from collections import deque
+
+
+class LogTailer:
+    """Follows a log file incrementally and keeps the newest parsed entries.
+
+    Only bytes appended since the last poll are read and parsed. The file's
+    inode and size are remembered so rotation (new inode) and truncation
+    (size shrank) restart reading from the top of the new file.
+    """
+
+    def __init__(self, path, parse, maxlen=10, backfill=50 * 1024):
+        self.path = path
+        self.parse = parse
+        self.maxlen = maxlen
+        # Never read more than this many bytes per poll. Older bytes cannot
+        # contribute to the newest `maxlen` entries in practice.
+        self.backfill = backfill
+
+        self.entries = deque(maxlen=maxlen)  # Oldest -> Newest, unique
+        self.inode = None
+        self.offset = 0
+        self.partial = b""  # Trailing bytes of an unterminated line
+
+    def reset(self):
+        self.entries.clear()
+        self.inode = None
+        self.offset = 0
+        self.partial = b""
+
+    def recent(self):
+        """Returns parsed entries, newest first (same order as the old scan)."""
+        return list(reversed(self.entries))
+
+    def poll(self):
+        """Reads newly appended bytes. Returns True if the entries changed."""
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            # Log vanished (deleted/rotated away). Keep what we have and
+            # re-attach from the beginning once it reappears.
+            self.inode = None
+            self.offset = 0
+            self.partial = b""
+            return False
+
+        if self.inode is None:
+            # First attach: only backfill the tail of the file
+            self.inode = st.st_ino
+            self.offset = max(0, st.st_size - self.backfill)
+            self.partial = b""
+            skip_first = self.offset > 0
+        elif st.st_ino != self.inode or st.st_size < self.offset:
+            # Rotated or truncated: the new content starts at byte 0
+            self.inode = st.st_ino
+            self.offset = 0
+            self.partial = b""
+            skip_first = False
+        else:
+            skip_first = False
+
+        if st.st_size == self.offset:
+            return False
+
+        start = self.offset
+        if st.st_size - start > self.backfill:
+            # Huge burst since last poll: jump to the tail
+            start = st.st_size - self.backfill
+            self.partial = b""
+            skip_first = True
+
+        try:
+            with open(self.path, "rb") as f:
+                f.seek(start)
+                data = f.read(st.st_size - start)
+        except OSError:
+            return False
+
+        self.offset = start + len(data)
+        data = self.partial + data
+
+        # Keep an unterminated last line for the next poll
+        last_nl = data.rfind(b"\n")
+        if last_nl == -1:
+            self.partial = data
+            return False
+        self.partial = data[last_nl + 1:]
+        data = data[:last_nl]
+
+        lines = data.decode("utf-8", errors="replace").split("\n")
+        if skip_first and lines:
+            # Discard the first partial line to avoid garbage
+            lines = lines[1:]
+
+        # Walk backwards and stop as soon as we have enough fresh entries
+        fresh = []
+        seen = set()
+        for line in reversed(lines):
+            parsed = self.parse(line)
+            if parsed and parsed not in seen:
+                seen.add(parsed)
+                fresh.append(parsed)
+                if len(fresh) >= self.maxlen:
+                    break
+
+        if not fresh:
+            return False
+
+        for parsed in reversed(fresh):
+            if parsed in self.entries:
+                self.entries.remove(parsed)
+            self.entries.append(parsed)
+        return True
+
+
+def _split_lines(data, base):
+    """Splits complete lines out of `data`, returning [(offset, text), ...]."""
+    lines = []
+    pos = 0
+    while pos < len(data):
+        nl = data.find(b"\n", pos)
+        if nl == -1:
+            nl = len(data)
+        lines.append((base + pos, data[pos:nl].decode("utf-8", errors="replace")))
+        pos = nl + 1
+    return lines
+
+
+def read_lines_before(path, end, size):
+    """Reads whole lines ending at byte `end`, going back at most ~`size` bytes.
+
+    Returns (start, lines) where `start` is the offset of the first returned
+    line and lines is [(offset, text), ...].
+    """
+    start = max(0, end - size)
+    with open(path, "rb") as f:
+        f.seek(start)
+        data = f.read(end - start)
+    if start > 0:
+        # Drop the leading partial line (it belongs to the previous chunk).
+        # A single line longer than the chunk is returned as is.
+        nl = data.find(b"\n")
+        if nl != -1 and nl + 1 < len(data):
+            start += nl + 1
+            data = data[nl + 1:]
+    if data.endswith(b"\n"):
+        data = data[:-1]
+    return start, _split_lines(data, start)
+
+
+def read_lines_after(path, start, size):
+    """Reads whole lines from byte `start`, at most ~`size` bytes.
+
+    Returns (end, lines) where `end` is the offset just past the last complete
+    line. A trailing unterminated line is left for the next read.
+    """
+    with open(path, "rb") as f:
+        f.seek(start)
+        data = f.read(size)
+    nl = data.rfind(b"\n")
+    if nl == -1:
+        return start, []
+    data = data[:nl]
+    return start + nl + 1, _split_lines(data, start)
+
+
+def search_backwards(path, match, cancelled=None, chunk_size=1024 * 1024):
+    """Yields (offset, text) of lines for which match(text) is true, newest first.
+
+    Reads the file in fixed-size chunks from the end, so memory stays bounded
+    regardless of the log size. `cancelled` is an optional threading.Event.
+    """
+    with open(path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        pos = f.tell()
+        carry = b""  # Partial first line of the chunk read previously
+        while pos > 0:
+            if cancelled is not None and cancelled.is_set():
+                return
+            start = max(0, pos - chunk_size)
+            f.seek(start)
+            data = f.read(pos - start) + carry
+            pos = start
+            if start > 0:
+                nl = data.find(b"\n")
+                if nl == -1:
+                    carry = data
+                    continue
+                carry = data[:nl]
+                base = start + nl + 1
+                data = data[nl + 1:]
+            else:
+                carry = b""
+                base = 0
+            for offset, text in reversed(_split_lines(data.rstrip(b"\n"), base)):
+                if match(text):
+                    yield offset, text
@@ -0,0 +1,391 @@
+"""Persistent manifest of the local tree (SQLite).
+
+Records, for every file under the sync directory, the size and mtime it had
+when it was last synced (plus the hash of the content last uploaded), and
+for every directory its mtime when it was last listed. The watcher marks paths dirty
+as it dispatches them; cdsync-core.sh records them as synced after a
+successful run. On startup the watcher scans only directories that are
+dirty or whose mtime changed to find changes made while it was not running.
+
+Content-hash cache: editors, build and backup tools often rewrite files
+with identical bytes or only touch them. Before a batch upload the core asks
+`unchanged` which files still hold the content they were last uploaded with
+and skips them. Hashes are computed in chunks and cached per (inode, size,
+mtime), so a file is only read again once it changed on disk.
+
+Paths are stored relative to the sync directory, like rclone reports them.
+"""
+import argparse
+import hashlib
+import os
+import sqlite3
+import sys
+
+from cdsync.inotify import DEFAULT_EXCLUDE
+from cdsync.status import BASE_DIR, state_path
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path     TEXT PRIMARY KEY,
+    dir      TEXT NOT NULL,
+    size     INTEGER,
+    mtime_ns INTEGER,
+    hash     TEXT,
+    dirty    INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS files_dir ON files(dir);
+CREATE TABLE IF NOT EXISTS dirs (
+    path     TEXT PRIMARY KEY,
+    parent   TEXT,
+    mtime_ns INTEGER,
+    dirty    INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS dirs_parent ON dirs(parent);
+CREATE TABLE IF NOT EXISTS hashes (
+    path     TEXT PRIMARY KEY,
+    inode    INTEGER,
+    size     INTEGER,
+    mtime_ns INTEGER,
+    hash     TEXT
+);
+"""
+
+# Files are hashed this much at a time
+HASH_CHUNK = 1024 * 1024
+
+
+def default_manifest_path(base_dir=BASE_DIR, pair=None):
+    """Per-checkout (and per sync pair) database under $XDG_STATE_HOME/cdsync/."""
+    return state_path(".db", base_dir, pair)
+
+
+def file_hash(path):
+    """MD5 (Google Drive's checksum) of a file, read in HASH_CHUNK pieces."""
+    digest = hashlib.md5(usedforsecurity=False)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _parent(rel):
+    return os.path.dirname(rel)
+
+
+def _under(column):
+    # Matches a path and everything below it; "/" sorts right before "0"
+    return f"({column} = ? OR ({column} >= ? AND {column} < ?))"
+
+
+def _under_args(rel):
+    return (rel, rel + "/", rel + "0")
+
+
+class Manifest:
+    def __init__(self, local_dir, path=None, exclude=DEFAULT_EXCLUDE, pair=None):
+        self.local_dir = os.path.abspath(local_dir)
+        self.path = path or os.environ.get("MANIFEST_DB") or default_manifest_path(pair=pair)
+        self.exclude = exclude
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        # The watcher and the core's helper processes share the database
+        self.db = sqlite3.connect(self.path, timeout=30)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(_SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def rel(self, path):
+        """Relative form of an absolute path (relative paths pass through)."""
+        if os.path.isabs(path):
+            return os.path.relpath(path, self.local_dir)
+        return path
+
+    def _excluded(self, rel):
+        return self.exclude is not None and self.exclude.search(rel + "/") is not None
+
+    def is_empty(self):
+        return self.db.execute("SELECT 1 FROM dirs LIMIT 1").fetchone() is None
+
+    # --- Incremental updates ---
+
+    def mark_dirty(self, paths):
+        """Flags paths (and their directories) as changed but not yet synced."""
+        with self.db:
+            for path in paths:
+                rel = self.rel(path)
+                parent = _parent(rel)
+                self.db.execute("UPDATE files SET dirty = 1 WHERE path = ?", (rel,))
+                self.db.execute("UPDATE dirs SET dirty = 1 WHERE path = ?", (rel,))
+                self.db.execute(
+                    "INSERT INTO dirs (path, parent, mtime_ns, dirty) VALUES (?, ?, NULL, 1) "
+                    "ON CONFLICT(path) DO UPDATE SET dirty = 1",
+                    (parent, _parent(parent) if parent else None),
+                )
+
+    def record_synced(self, paths):
+        """Stores the current local state of paths the last run synced.
+
+        A directory records its whole subtree; a path that is gone locally
+        drops its entries.
+        """
+        with self.db:
+            for path in paths:
+                rel = self.rel(path)
+                full = os.path.join(self.local_dir, rel)
+                if os.path.isdir(full):
+                    self._record_tree(rel)
+                elif os.path.isfile(full):
+                    st = os.stat(full)
+                    try:
+                        # Hashed here, after the upload, rather than in unchanged()
+                        digest = self.content_hash(rel)
+                    except OSError:
+                        digest = None
+                    self._record_file(rel, st, digest)
+                else:
+                    self._forget(rel)
+
+    # --- Content-hash cache ---
+
+    def _cached_hash(self, rel, st):
+        row = self.db.execute(
+            "SELECT hash FROM hashes WHERE path = ? AND inode = ? AND size = ? AND mtime_ns = ?",
+            (rel, st.st_ino, st.st_size, st.st_mtime_ns),
+        ).fetchone()
+        return row[0] if row else None
+
+    def content_hash(self, rel):
+        """Hash of the file's current content, from the cache while its stat is unchanged."""
+        full = os.path.join(self.local_dir, rel)
+        st = os.stat(full)
+        digest = self._cached_hash(rel, st)
+        if digest is None:
+            digest = file_hash(full)
+            if os.stat(full).st_mtime_ns != st.st_mtime_ns:
+                return None  # Written to while it was read
+            with self.db:
+                self.db.execute(
+                    "INSERT OR REPLACE INTO hashes (path, inode, size, mtime_ns, hash) VALUES (?, ?, ?, ?, ?)",
+                    (rel, st.st_ino, st.st_size, st.st_mtime_ns, digest),
+                )
+        return digest
+
+    def unchanged(self, paths):
+        """Paths whose content is what was last uploaded; they are recorded as synced.
+
+        Only files with a recorded hash and the same size are read: new or
+        resized files cannot match, and are hashed by record_synced once
+        their upload succeeds.
+        """
+        same = []
+        for path in paths:
+            rel = self.rel(path)
+            row = self.db.execute("SELECT size, hash FROM files WHERE path = ?", (rel,)).fetchone()
+            if row is None or row[1] is None:
+                continue
+            try:
+                if os.stat(os.path.join(self.local_dir, rel)).st_size != row[0]:
+                    continue
+                digest = self.content_hash(rel)
+            except OSError:
+                continue
+            if digest is not None and digest == row[1]:
+                same.append(rel)
+        self.record_synced(same)
+        return same
+
+    def clean(self):
+        """After a successful full bisync: every dirty entry is in sync now."""
+        dirty_files = [r[0] for r in self.db.execute("SELECT path FROM files WHERE dirty = 1")]
+        dirty_dirs = [r[0] for r in self.db.execute("SELECT path FROM dirs WHERE dirty = 1")]
+        with self.db:
+            for rel in dirty_files:
+                try:
+                    st = os.stat(os.path.join(self.local_dir, rel))
+                    self._record_file(rel, st, self._cached_hash(rel, st))
+                except OSError:
+                    self._forget(rel)
+            for rel in dirty_dirs:
+                self._record_tree(rel, recursive=False)
+        return len(dirty_files) + len(dirty_dirs)
+
+    def _record_file(self, rel, st, digest=None):
+        self.db.execute(
+            "INSERT INTO files (path, dir, size, mtime_ns, hash, dirty) VALUES (?, ?, ?, ?, ?, 0) "
+            "ON CONFLICT(path) DO UPDATE SET size = excluded.size, mtime_ns = excluded.mtime_ns, "
+            "hash = COALESCE(excluded.hash, CASE WHEN files.size = excluded.size AND "
+            "files.mtime_ns = excluded.mtime_ns THEN files.hash END), dirty = 0",
+            (rel, _parent(rel), st.st_size, st.st_mtime_ns, digest),
+        )
+
+    def _record_dir(self, rel, st):
+        self.db.execute(
+            "INSERT INTO dirs (path, parent, mtime_ns, dirty) VALUES (?, ?, ?, 0) "
+            "ON CONFLICT(path) DO UPDATE SET mtime_ns = excluded.mtime_ns, dirty = 0",
+            (rel, _parent(rel) if rel else None, st.st_mtime_ns),
+        )
+
+    def _record_tree(self, top, recursive=True):
+        """Lists `top` and stores its entries (and, if recursive, its subtree)."""
+        stack = [top]
+        while stack:
+            rel = stack.pop()
+            full = os.path.join(self.local_dir, rel)
+            try:
+                st = os.stat(full)
+                entries = list(os.scandir(full))
+            except OSError:
+                self._forget(rel)
+                continue
+            seen = set()
+            for entry in entries:
+                child = os.path.join(rel, entry.name) if rel else entry.name
+                if self._excluded(child):
+                    continue
+                seen.add(child)
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        if recursive:
+                            stack.append(child)
+                    elif entry.is_file(follow_symlinks=False):
+                        self._record_file(child, entry.stat(follow_symlinks=False))
+                except OSError:
+                    continue
+            for (gone,) in self.db.execute("SELECT path FROM files WHERE dir = ?", (rel,)).fetchall():
+                if gone not in seen:
+                    self._forget(gone)
+            for (gone,) in self.db.execute("SELECT path FROM dirs WHERE parent = ?", (rel,)).fetchall():
+                if gone not in seen:
+                    self._forget(gone)
+            self._record_dir(rel, st)
+
+    def _forget(self, rel):
+        if not rel:
+            return
+        self.db.execute(f"DELETE FROM files WHERE {_under('path')}", _under_args(rel))
+        self.db.execute(f"DELETE FROM dirs WHERE {_under('path')}", _under_args(rel))
+        self.db.execute(f"DELETE FROM hashes WHERE {_under('path')}", _under_args(rel))
+
+    # --- Scans ---
+
+    def baseline(self):
+        """Records the whole tree as synced (first start, or after a resync)."""
+        with self.db:
+            self._record_tree("")
+
+    def scan(self, full=False):
+        """Returns relative paths that changed since they were last synced.
+
+        Directories whose mtime is unchanged and that are not dirty are not
+        listed: creations, deletions and renames always change the parent's
+        mtime. In-place edits made while the watcher was not running only
+        show up with `full=True` (or in the next periodic bisync).
+        """
+        changed = []
+        pending_dirs = []
+        stack = [""]
+        while stack:
+            rel = stack.pop()
+            full_path = os.path.join(self.local_dir, rel)
+            row = self.db.execute("SELECT mtime_ns, dirty FROM dirs WHERE path = ?", (rel,)).fetchone()
+            try:
+                st = os.stat(full_path)
+            except OSError:
+                changed.extend(self._known_files_under(rel))
+                continue
+
+            if not full and row is not None and row[0] == st.st_mtime_ns and not row[1]:
+                stack.extend(r[0] for r in self.db.execute("SELECT path FROM dirs WHERE parent = ?", (rel,)))
+                continue
+
+            known = dict(
+                (r[0], (r[1], r[2], r[3]))
+                for r in self.db.execute("SELECT path, size, mtime_ns, dirty FROM files WHERE dir = ?", (rel,))
+            )
+            known_dirs = set(r[0] for r in self.db.execute("SELECT path FROM dirs WHERE parent = ?", (rel,)))
+            dir_changed = False
+            try:
+                entries = list(os.scandir(full_path))
+            except OSError:
+                continue
+            for entry in entries:
+                child = os.path.join(rel, entry.name) if rel else entry.name
+                if self._excluded(child):
+                    continue
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        known_dirs.discard(child)
+                        stack.append(child)
+                        continue
+                    if not entry.is_file(follow_symlinks=False):
+                        continue
+                    est = entry.stat(follow_symlinks=False)
+                except OSError:
+                    continue
+                entry_known = known.pop(child, None)
+                if entry_known is None or entry_known[2] or entry_known[:2] != (est.st_size, est.st_mtime_ns):
+                    changed.append(child)
+                    dir_changed = True
+            # Files and directories that disappeared
+            if known:
+                changed.extend(known)
+                dir_changed = True
+            for gone in known_dirs:
+                changed.extend(self._known_files_under(gone))
+                dir_changed = True
+            if not dir_changed:
+                pending_dirs.append((rel, st))
+
+        # Only fully-in-sync directories may be skipped next time
+        with self.db:
+            for rel, st in pending_dirs:
+                self._record_dir(rel, st)
+        return changed
+
+    def _known_files_under(self, rel):
+        if not rel:
+            return [r[0] for r in self.db.execute("SELECT path FROM files")]
+        return [r[0] for r in self.db.execute(f"SELECT path FROM files WHERE {_under('path')}", _under_args(rel))]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python3 -m cdsync.manifest")
+    parser.add_argument("--db", help="Database path (default: per checkout)")
+    sub = parser.add_subparsers(dest="command", required=True)
+    for name, text in (
+        ("clean", "Record every dirty entry as synced (after a full bisync)"),
+        ("baseline", "Record the whole tree as synced (after a resync)"),
+    ):
+        sub.add_parser(name, help=text).add_argument("local_dir")
+    p_syn = sub.add_parser("synced", help="Record paths as synced; relative paths on stdin")
+    p_syn.add_argument("local_dir")
+    p_unch = sub.add_parser("unchanged", help="Print the paths on stdin whose content was already uploaded")
+    p_unch.add_argument("local_dir")
+    p_scan = sub.add_parser("scan", help="Print paths changed since they were last synced")
+    p_scan.add_argument("local_dir")
+    p_scan.add_argument("--full", action="store_true", help="List every directory")
+    args = parser.parse_args(argv)
+
+    manifest = Manifest(args.local_dir, args.db)
+    try:
+        if args.command == "clean":
+            manifest.clean()
+        elif args.command == "baseline":
+            manifest.baseline()
+        elif args.command == "synced":
+            manifest.record_synced(line.rstrip("\n") for line in sys.stdin if line.strip())
+        elif args.command == "unchanged":
+            for rel in manifest.unchanged(line.rstrip("\n") for line in sys.stdin if line.strip()):
+                print(rel)
+        elif args.command == "scan":
+            for rel in manifest.scan(full=args.full):
+                print(rel)
+    finally:
+        manifest.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
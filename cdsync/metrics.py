@@ -0,0 +1,232 @@
+"""Structured per-run metrics.
+
+cdsync-core.sh records every run (and every run it skipped) on exit. Each
+record is appended to a JSON-lines file and the totals are rewritten as a
+Prometheus textfile for node-exporter's textfile collector:
+
+    {"mode": "periodic", "result": "success", "started_at": ..., "finished_at": ...,
+     "duration": 12.3, "exit_code": 0, "files": 4, "bytes": 1048576,
+     "resync": false}
+
+Files, bytes and whether a resync ran come from the run's record, which
+the digest of each of its rclone logs adds to (cdsync/rclonelog.py). The
+tray reads the JSON-lines file for recent throughput and failure rate.
+"""
+import argparse
+import fcntl
+import json
+import os
+import sys
+import time
+
+from cdsync.config import atomic_write
+from cdsync.logtail import read_lines_before
+from cdsync.status import BASE_DIR, MODES, current_pair, instance_name, state_path
+
+SUCCESS = "success"
+FAILURE = "failure"
+SKIPPED = "skipped"
+RESULTS = (SUCCESS, FAILURE, SKIPPED)
+
+# The JSON-lines file is cut back to this many records when it doubles
+MAX_RECORDS = 5000
+
+
+def default_paths(base_dir=BASE_DIR):
+    return state_path("-metrics.jsonl", base_dir), state_path("-metrics.prom", base_dir)
+
+
+def read_run_record(path):
+    """(files, bytes, resync) from the run's record; zeros if it has none."""
+    try:
+        with open(path) as f:
+            run = json.load(f)
+    except (OSError, ValueError):
+        return 0, 0, False
+    return run.get("files", 0), run.get("bytes", 0), bool(run.get("resync"))
+
+
+def make_record(mode, started_at, exit_code, result=None, files=0, nbytes=0, resync=False, finished_at=None):
+    finished_at = time.time() if finished_at is None else finished_at
+    if result is None:
+        result = SUCCESS if exit_code == 0 else FAILURE
+    return {
+        "mode": mode,
+        "result": result,
+        "started_at": started_at,
+        "finished_at": round(finished_at, 3),
+        "duration": round(max(0.0, finished_at - started_at), 1) if started_at else 0.0,
+        "exit_code": exit_code,
+        "files": files,
+        "bytes": nbytes,
+        "resync": resync,
+    }
+
+
+def append_record(record, jsonl_path):
+    os.makedirs(os.path.dirname(jsonl_path), exist_ok=True)
+    with open(jsonl_path, "a") as f:
+        f.write(json.dumps(record) + "\n")
+    # Bounded: keep the newest MAX_RECORDS once the file holds twice that
+    if os.path.getsize(jsonl_path) > MAX_RECORDS * 2 * 250:
+        records = read_records(jsonl_path, MAX_RECORDS * 2)
+        if len(records) > MAX_RECORDS:
+            atomic_write(jsonl_path, "".join(json.dumps(r) + "\n" for r in records[-MAX_RECORDS:]))
+
+
+def read_records(jsonl_path, count):
+    """The last `count` records, oldest first."""
+    try:
+        end = os.path.getsize(jsonl_path)
+    except OSError:
+        return []
+    records = []
+    size = 64 * 1024
+    while True:
+        start, lines = read_lines_before(jsonl_path, end, size)
+        if start == 0 or len(lines) > count:
+            break
+        size *= 4
+    for _, text in lines[-count:]:
+        try:
+            records.append(json.loads(text))
+        except ValueError:
+            continue
+    return records
+
+
+def summarize(records):
+    """Recent throughput (bytes/s over runs that moved data) and failure rate."""
+    runs = [r for r in records if r.get("result") != SKIPPED]
+    failures = sum(1 for r in runs if r.get("result") == FAILURE)
+    moved = [r for r in runs if r.get("bytes")]
+    duration = sum(r.get("duration", 0) for r in moved)
+    return {
+        "runs": len(runs),
+        "failures": failures,
+        "failure_rate": failures / len(runs) if runs else 0.0,
+        "throughput": (sum(r["bytes"] for r in moved) / duration) if duration else 0.0,
+        "skipped": len(records) - len(runs),
+    }
+
+
+class Totals:
+    """Counters behind the Prometheus textfile, persisted next to it."""
+
+    def __init__(self, path):
+        self.path = path
+        try:
+            with open(path) as f:
+                self.data = json.load(f)
+        except (OSError, ValueError):
+            self.data = {"runs": {}, "files": {}, "bytes": {}, "duration": {}, "resyncs": 0, "last": {}}
+
+    def add(self, record):
+        mode = record["mode"]
+        key = f"{mode}/{record['result']}"
+        self.data["runs"][key] = self.data["runs"].get(key, 0) + 1
+        for field, source in (("files", "files"), ("bytes", "bytes"), ("duration", "duration")):
+            self.data[field][mode] = self.data[field].get(mode, 0) + record[source]
+        if record["resync"]:
+            self.data["resyncs"] += 1
+        if record["result"] != SKIPPED:
+            self.data["last"][mode] = record
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        atomic_write(self.path, json.dumps(self.data))
+
+    def prometheus(self, labels=None):
+        """Textfile contents; `labels` are added to every sample.
+
+        Each checkout and sync pair writes its own textfile with the same
+        series, so they must carry labels that tell them apart (node-exporter
+        rejects duplicate series across files).
+        """
+        out = []
+        common = labels or {}
+
+        def metric(name, kind, help_text, samples):
+            out.append(f"# HELP {name} {help_text}")
+            out.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                labels = {**common, **labels}
+                label_text = ",".join(f'{k}="{v}"' for k, v in labels.items())
+                out.append(f"{name}{{{label_text}}} {value}" if label_text else f"{name} {value}")
+
+        runs = []
+        for key, count in sorted(self.data["runs"].items()):
+            mode, result = key.split("/", 1)
+            runs.append(({"mode": mode, "result": result}, count))
+        metric("cdsync_runs_total", "counter", "Core runs by mode and result.", runs)
+        for field, name, help_text in (
+            ("files", "cdsync_files_transferred_total", "Files transferred or deleted."),
+            ("bytes", "cdsync_bytes_transferred_total", "Bytes transferred."),
+            ("duration", "cdsync_run_duration_seconds_total", "Time spent in runs."),
+        ):
+            metric(name, "counter", help_text, [({"mode": m}, v) for m, v in sorted(self.data[field].items())])
+        metric("cdsync_resyncs_total", "counter", "Runs that ended in a resync (manual or auto-heal).",
+               [({}, self.data["resyncs"])])
+        last = sorted(self.data["last"].items())
+        metric("cdsync_last_run_timestamp_seconds", "gauge", "End of the last run.",
+               [({"mode": m}, r["finished_at"]) for m, r in last])
+        metric("cdsync_last_run_duration_seconds", "gauge", "Duration of the last run.",
+               [({"mode": m}, r["duration"]) for m, r in last])
+        metric("cdsync_last_run_exit_code", "gauge", "Exit code of the last run.",
+               [({"mode": m}, r["exit_code"]) for m, r in last])
+        return "\n".join(out) + "\n"
+
+
+def record(mode, started_at, exit_code, result=None, run_record=None,
+           jsonl_path=None, textfile_path=None):
+    files = nbytes = 0
+    resync = False
+    if run_record and result != SKIPPED:
+        files, nbytes, resync = read_run_record(run_record)
+    rec = make_record(mode, started_at, exit_code, result, files, nbytes, resync=(mode == "resync" or resync))
+
+    default_jsonl, default_textfile = default_paths()
+    jsonl_path = jsonl_path or default_jsonl
+    textfile_path = textfile_path or default_textfile
+    totals_path = state_path("-metrics-totals.json")
+    os.makedirs(os.path.dirname(totals_path), exist_ok=True)
+    # Skipped runs are recorded without the sync lock, while the run holding
+    # it may record its own: serialize the read-modify-write of the totals
+    # (and the textfile), or an update is lost and counters go backwards.
+    with open(totals_path + ".lock", "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        append_record(rec, jsonl_path)
+        totals = Totals(totals_path)
+        totals.add(rec)
+        # Written atomically: node-exporter must never read a partial file
+        os.makedirs(os.path.dirname(os.path.abspath(textfile_path)), exist_ok=True)
+        atomic_write(textfile_path, totals.prometheus({"instance": instance_name(), "pair": current_pair()}))
+        # node-exporter usually runs as another user
+        os.chmod(textfile_path, 0o644)
+    return rec
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python3 -m cdsync.metrics")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_rec = sub.add_parser("record", help="Record one core run")
+    p_rec.add_argument("--mode", choices=MODES, required=True)
+    p_rec.add_argument("--started", type=float, default=0)
+    p_rec.add_argument("--exit-code", type=int, default=0)
+    p_rec.add_argument("--result", choices=RESULTS)
+    p_rec.add_argument("--run-record", help="The run's record, written by its log digests")
+    p_rec.add_argument("--jsonl", help="JSON-lines file (default: per checkout state dir)")
+    p_rec.add_argument("--textfile", help="Prometheus textfile (default: per checkout state dir)")
+    p_sum = sub.add_parser("summary", help="Print recent throughput and failure rate")
+    p_sum.add_argument("--jsonl")
+    p_sum.add_argument("--count", type=int, default=20)
+    args = parser.parse_args(argv)
+
+    if args.command == "record":
+        record(args.mode, args.started, args.exit_code, args.result, args.run_record,
+               args.jsonl or None, args.textfile or None)
+    elif args.command == "summary":
+        print(json.dumps(summarize(read_records(args.jsonl or default_paths()[0], args.count))))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,112 @@
+"""Sync pairs: several remote/local directory pairs in one installation.
+
+config.env defines the default pair (RCLONE_REMOTE, LOCAL_SYNC_DIR) and may
+list more in SYNC_PAIRS, each configured by PAIR_<name>_* variables:
+
+    SYNC_PAIRS="photos work"
+    PAIR_photos_REMOTE="gdrive:Photos"
+    PAIR_photos_LOCAL="$HOME/Photos"
+    PAIR_photos_PRIORITY=5          # lower runs first (default pair: PRIORITY, 0)
+    PAIR_photos_POLL_INTERVAL=30    # minutes (default: POLL_INTERVAL)
+
+One watcher serves every pair: a single inotify instance, one scheduler and
+one rclone rcd, with MAX_CONCURRENT_SYNCS runs at once sharing the
+MAX_TRANSFERS and BWLIMIT budgets. cdsync-core.sh syncs one pair per run,
+selected with --pair NAME (exported as CDSYNC_PAIR); the lock, log and state
+files of a named pair carry its name (see cdsync.status.state_path).
+"""
+import argparse
+import os
+import re
+import sys
+
+from cdsync.config import Config
+from cdsync.status import BASE_DIR, DEFAULT_PAIR
+
+# Pair names end up in shell variable names (PAIR_<name>_REMOTE)
+_NAME_RE = re.compile(r"^[A-Za-z0-9_]+$")
+
+
+class SyncPair:
+    def __init__(self, name, remote, local_dir, priority=0, poll_interval=None):
+        self.name = name
+        self.remote = remote
+        self.local_dir = os.path.abspath(local_dir)
+        self.priority = priority
+        self.poll_interval = poll_interval  # minutes, None: POLL_INTERVAL
+
+    def contains(self, path):
+        return path == self.local_dir or path.startswith(self.local_dir + "/")
+
+    def __repr__(self):
+        return f"SyncPair({self.name}: {self.remote} <-> {self.local_dir})"
+
+
+def _expand(value):
+    # Config (the tray, the CLI) does not expand "$HOME" like `source` does
+    return os.path.expanduser(os.path.expandvars(value)) if value else value
+
+
+def _number(value, default, kind=int):
+    try:
+        return kind(value)
+    except (TypeError, ValueError):
+        return default
+
+
+def load_pairs(config):
+    """The configured pairs, default pair first.
+
+    `config` is anything with get(name, default): os.environ in the watcher
+    (config.env exported), a cdsync.config.Config elsewhere. Pairs without a
+    remote or directory, with an invalid name, or whose directory overlaps an
+    earlier pair's are skipped with a warning.
+    """
+    pairs = []
+    if config.get("RCLONE_REMOTE") and config.get("LOCAL_SYNC_DIR"):
+        pairs.append(SyncPair(DEFAULT_PAIR, config.get("RCLONE_REMOTE"), _expand(config.get("LOCAL_SYNC_DIR")),
+                              _number(config.get("PRIORITY"), 0)))
+    for name in (config.get("SYNC_PAIRS") or "").split():
+        remote = config.get(f"PAIR_{name}_REMOTE")
+        local_dir = _expand(config.get(f"PAIR_{name}_LOCAL"))
+        if not _NAME_RE.match(name) or name == DEFAULT_PAIR:
+            print(f"WARNING: Invalid sync pair name {name!r}. Skipped.", file=sys.stderr)
+            continue
+        if not remote or not local_dir:
+            print(f"WARNING: Sync pair {name} needs PAIR_{name}_REMOTE and PAIR_{name}_LOCAL. Skipped.",
+                  file=sys.stderr)
+            continue
+        pair = SyncPair(name, remote, local_dir, _number(config.get(f"PAIR_{name}_PRIORITY"), 0),
+                        _number(config.get(f"PAIR_{name}_POLL_INTERVAL"), None, float))
+        # One inotify event must map to exactly one pair
+        overlap = next((p for p in pairs if p.contains(pair.local_dir) or pair.contains(p.local_dir)), None)
+        if overlap is not None:
+            print(f"WARNING: Sync pair {name} overlaps {overlap.name} ({overlap.local_dir}). Skipped.",
+                  file=sys.stderr)
+            continue
+        pairs.append(pair)
+    return pairs
+
+
+def pair_for_path(pairs, path):
+    """The pair whose directory holds `path`, or None."""
+    for pair in pairs:
+        if pair.contains(path):
+            return pair
+    return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python3 -m cdsync.pairs")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("list", help="Print the configured pairs (name, remote, directory, priority)")
+    args = parser.parse_args(argv)
+
+    if args.command == "list":
+        for pair in load_pairs(Config(os.path.join(BASE_DIR, "config.env"))):
+            print(f"{pair.name}\t{pair.remote}\t{pair.local_dir}\t{pair.priority}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,65 @@
+"""Adaptive interval for the periodic full bisync.
+
+Most periodic runs find nothing, so the interval backs off toward
+POLL_INTERVAL_MAX while runs come back empty, tightens toward
+POLL_INTERVAL_MIN when a run brings remote changes down, and drops back to
+POLL_INTERVAL as soon as the user is active in the sync directory.
+The watcher submits the periodic job when it is due; the systemd timer only
+takes over while the watcher is not running.
+"""
+import time
+
+BACKOFF = 1.5   # interval growth after a run without remote changes
+TIGHTEN = 0.5   # interval shrink after a run with remote changes
+
+
+class AdaptivePoller:
+    def __init__(self, base, minimum=None, maximum=None, adaptive=True):
+        self.base = base
+        self.minimum = min(minimum or base, base)
+        self.maximum = max(maximum or base, base)
+        self.adaptive = adaptive
+        self.interval = base
+        self.reason = "default interval"
+        self.quiet_runs = 0
+        self.last_run = time.monotonic()
+
+    def next_due(self):
+        return self.last_run + self.interval
+
+    def due(self, now=None):
+        now = time.monotonic() if now is None else now
+        return now >= self.next_due()
+
+    def started(self, now=None):
+        self.last_run = time.monotonic() if now is None else now
+
+    def record_run(self, remote_changes):
+        """Adjusts the interval after a full bisync that brought `remote_changes` down."""
+        if not self.adaptive:
+            return
+        if remote_changes:
+            self.quiet_runs = 0
+            self.interval = max(self.minimum, self.interval * TIGHTEN)
+            self.reason = f"{remote_changes} remote change{'s' if remote_changes != 1 else ''} in the last run"
+        else:
+            self.quiet_runs += 1
+            self.interval = min(self.maximum, self.interval * BACKOFF)
+            self.reason = f"no remote changes in {self.quiet_runs} run{'s' if self.quiet_runs != 1 else ''}"
+
+    def user_activity(self):
+        """The user changed files: check for remote edits at the normal pace."""
+        if not self.adaptive or self.interval <= self.base:
+            return False
+        self.interval = self.base
+        self.quiet_runs = 0
+        self.reason = "local activity"
+        return True
+
+    def describe(self):
+        """Hub state fields ("poll_*"), with wall-clock times for clients."""
+        return {
+            "poll_interval": round(self.interval),
+            "poll_reason": self.reason,
+            "next_poll_at": time.time() + max(0, self.next_due() - time.monotonic()),
+        }
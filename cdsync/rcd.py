@@ -0,0 +1,516 @@
+"""Long-lived `rclone rcd` backend ("SYNC_ENGINE=rcd").
+
+Instead of a fresh rclone process per operation (each re-reading the config,
+re-authenticating and rebuilding its connections), the watcher service keeps
+one `rclone rcd`, shared by every sync pair, listening on a private UNIX socket.
+cdsync-core.sh sends its operations to it through `run`, which accepts the
+subset of rclone command lines the core uses and maps them to async rc jobs:
+
+    rclone copy SRC DST --files-from-raw -   -> operations/copyfile per file
+    rclone copy SRC DST                      -> sync/copy
+    rclone delete FS --files-from-raw -      -> operations/deletefile per file
+    rclone purge FS                          -> operations/purge
+    rclone moveto SRC DST                    -> operations/movefile (file),
+                                                sync/move (directory)
+    rclone bisync PATH1 PATH2                -> sync/bisync
+
+Each run's jobs share a stats group of their own, so its stats lines count
+only its transfers. --drive-chunk-size is a backend option, fixed per Fs:
+it is passed on as a connection string option of the Drive remotes
+(`remote,chunk_size=64M:path`).
+
+While the jobs run, the rcd log written meanwhile is copied to --log-file
+(plus one-line stats), so the per-run log looks like the CLI's and the
+existing parsers (cdsync/rclonelog.py, batch report, progress relay) keep
+working. The rcd logs JSON records; with --use-json-log, the lines `run`
+adds itself are JSON records too.
+`run` exits with 125 when the backend is unavailable or the command line is
+not supported, so the caller can fall back to the rclone CLI.
+"""
+import argparse
+import http.client
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+
+from cdsync.status import BASE_DIR, instance_name
+
+EXIT_UNAVAILABLE = 125
+POLL_INTERVAL = 0.5
+# rclone's exit code for "directory not found"
+EXIT_DIR_NOT_FOUND = 3
+
+
+def default_rcd_dir(base_dir=BASE_DIR):
+    """Private (0700) directory holding the rc socket and the rcd log."""
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR") or "/tmp"
+    return os.path.join(runtime_dir, instance_name(base_dir) + "-rcd")
+
+
+def default_paths(base_dir=BASE_DIR):
+    rcd_dir = default_rcd_dir(base_dir)
+    return os.path.join(rcd_dir, "rc.sock"), os.path.join(rcd_dir, "rcd.log")
+
+
+class RcError(Exception):
+    pass
+
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path, timeout):
+        super().__init__("localhost", timeout=timeout)
+        self.unix_path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.unix_path)
+
+
+class RcClient:
+    """JSON calls to an rcd over its UNIX socket, on one kept-alive connection."""
+
+    def __init__(self, path=None, timeout=30.0):
+        self.path = path or default_paths()[0]
+        self.conn = _UnixHTTPConnection(self.path, timeout)
+
+    def close(self):
+        self.conn.close()
+
+    def call(self, method, params=None):
+        body = json.dumps(params or {})
+        try:
+            self.conn.request("POST", "/" + method, body, {"Content-Type": "application/json"})
+            resp = self.conn.getresponse()
+            data = resp.read()
+        except (OSError, http.client.HTTPException) as e:
+            self.conn.close()
+            raise RcError(f"{method}: {e}") from e
+        try:
+            out = json.loads(data) if data else {}
+        except ValueError:
+            out = {}
+        if resp.status != 200:
+            raise RcError(out.get("error") or f"{method}: HTTP {resp.status}")
+        return out
+
+    def ping(self):
+        try:
+            self.call("rc/noop")
+        except RcError:
+            return False
+        return True
+
+    def start_job(self, method, params):
+        return self.call(method, dict(params, _async=True))["jobid"]
+
+    def job_status(self, jobid):
+        return self.call("job/status", {"jobid": jobid})
+
+
+class RcdServer:
+    """The `rclone rcd` process, owned by the watcher service."""
+
+    def __init__(self, config_path, socket_path=None, log_path=None, bwlimit=None):
+        default_socket, default_log = default_paths()
+        self.config_path = config_path
+        # Global BWLIMIT: the rcd applies it to every run
+        self.bwlimit = bwlimit
+        self.socket_path = socket_path or default_socket
+        self.log_path = log_path or default_log
+        self.proc = None
+
+    def start(self, timeout=15.0):
+        os.makedirs(os.path.dirname(self.socket_path), mode=0o700, exist_ok=True)
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        self.proc = subprocess.Popen([
+            "rclone", "rcd",
+            "--rc-addr", "unix://" + self.socket_path,
+            # Only reachable through the 0700 directory above
+            "--rc-no-auth",
+            "--rc-job-expire-duration", "1h",
+            "--config", self.config_path,
+            "--log-file", self.log_path,
+            "--log-format", "date,time",
+            # Structured records: cdsync/rclonelog.py digests the per-run log
+            "--use-json-log",
+            "--drive-acknowledge-abuse",
+            "--verbose",
+        ] + (["--bwlimit", self.bwlimit] if self.bwlimit else []))
+        client = RcClient(self.socket_path, timeout=2.0)
+        deadline = time.monotonic() + timeout
+        try:
+            while time.monotonic() < deadline:
+                if self.proc.poll() is not None:
+                    break
+                if os.path.exists(self.socket_path) and client.ping():
+                    return True
+                time.sleep(0.2)
+        finally:
+            client.close()
+        self.stop()
+        return False
+
+    def alive(self):
+        return self.proc is not None and self.proc.poll() is None
+
+    def trim_log(self, max_bytes=64 * 1024 * 1024):
+        """Truncates the rcd log between runs; clients copy their segment."""
+        try:
+            if os.path.getsize(self.log_path) > max_bytes:
+                os.truncate(self.log_path, 0)
+        except OSError:
+            pass
+
+    def stop(self):
+        if self.proc is None:
+            return
+        if self.proc.poll() is None:
+            self.proc.terminate()
+            try:
+                self.proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.proc.kill()
+                self.proc.wait()
+        self.proc = None
+
+
+# --- rclone command line -> rc jobs ---
+
+class _CommandParser(argparse.ArgumentParser):
+    def error(self, message):
+        raise ValueError(message)
+
+
+def _parser():
+    parser = _CommandParser(prog="python3 -m cdsync.rcd run", add_help=False)
+    parser.add_argument("command", choices=("copy", "delete", "purge", "moveto", "bisync"))
+    parser.add_argument("paths", nargs="+")
+    parser.add_argument("--config")
+    parser.add_argument("--log-format")
+    parser.add_argument("--log-file")
+    # The rcd's own log format applies; its records are copied as they are
+    parser.add_argument("--use-json-log", action="store_true")
+    parser.add_argument("--stats", default="0")
+    parser.add_argument("--stats-one-line", action="store_true")
+    parser.add_argument("--drive-acknowledge-abuse", action="store_true")
+    parser.add_argument("--fast-list", action="store_true")
+    parser.add_argument("--checkers", type=int)
+    # Set on the rcd itself (RcdServer), for all runs
+    parser.add_argument("--bwlimit")
+    # Backend option: set on the paths (with_chunk_size)
+    parser.add_argument("--drive-chunk-size")
+    parser.add_argument("--transfers", type=int)
+    parser.add_argument("--conflict-resolve")
+    parser.add_argument("--conflict-loser")
+    parser.add_argument("--create-empty-src-dirs", action="store_true")
+    parser.add_argument("--filter-from", action="append", default=[])
+    parser.add_argument("--files-from-raw")
+    parser.add_argument("--no-traverse", action="store_true")
+    parser.add_argument("--resync", action="store_true")
+    parser.add_argument("--verbose", "-v", action="count", default=0)
+    return parser
+
+
+def parse_command(argv):
+    """Returns the parsed rclone command line, or None if it is not supported."""
+    try:
+        args, unknown = _parser().parse_known_args(argv)
+    except ValueError:
+        return None
+    expected = 1 if args.command in ("delete", "purge") else 2
+    if unknown or len(args.paths) != expected:
+        return None
+    return args
+
+
+def _read_list(source):
+    if source == "-":
+        lines = sys.stdin
+    else:
+        lines = open(source, "r", errors="replace")
+    with lines:
+        return [line.rstrip("\n") for line in lines if line.strip()]
+
+
+def split_path(path):
+    """`remote:dir/name` -> ("remote:dir", "name"), the Fs and remote of a file."""
+    head, sep, name = path.rpartition("/")
+    if sep:
+        return head or "/", name
+    fs, sep, name = path.partition(":")
+    return (fs + sep, name) if sep else (".", path)
+
+
+def stat_is_dir(client, path):
+    """True if `path` is a directory, False if a file (or missing), None if unknown."""
+    fs, remote = split_path(path)
+    try:
+        item = client.call("operations/stat", {"fs": fs, "remote": remote}).get("item")
+    except RcError:
+        return None
+    return bool(item and item.get("IsDir"))
+
+
+def with_chunk_size(client, path, size, types):
+    """`path` with `size` as the chunk_size option if it is on a Drive remote.
+
+    `types` caches the remote types (config/get) for the run. Returns None
+    if the remote's type could not be read.
+    """
+    name, sep, rest = path.partition(":")
+    if not sep or not name or os.sep in name:
+        return path  # Local path or on-the-fly backend
+    remote = name.split(",")[0]
+    if remote not in types:
+        try:
+            types[remote] = client.call("config/get", {"name": remote}).get("type")
+        except RcError:
+            return None
+    if types[remote] != "drive":
+        return path  # Like the CLI flag: Drive remotes only
+    return f"{name},chunk_size={size}:{rest}"
+
+
+def plan_jobs(args, is_dir=False, group=None):
+    """Returns [(method, params, label)] for a parsed command line.
+
+    `is_dir` tells whether a moveto source is a directory; every job goes
+    to stats group `group`.
+    """
+    common = {}
+    if group:
+        common["_group"] = group
+    config = {}
+    if args.checkers:
+        config["Checkers"] = args.checkers
+    if args.no_traverse:
+        config["NoTraverse"] = True
+    if args.fast_list:
+        config["UseListR"] = True
+    if args.transfers:
+        config["Transfers"] = args.transfers
+    if config:
+        common["_config"] = config
+    if args.filter_from:
+        common["_filter"] = {"FilterFrom": args.filter_from}
+
+    jobs = []
+    if args.command == "copy":
+        src, dst = args.paths
+        if args.files_from_raw:
+            for rel in _read_list(args.files_from_raw):
+                jobs.append(("operations/copyfile", dict(
+                    common, srcFs=src, srcRemote=rel, dstFs=dst, dstRemote=rel), rel))
+        else:
+            jobs.append(("sync/copy", dict(
+                common, srcFs=src, dstFs=dst, createEmptySrcDirs=args.create_empty_src_dirs), dst))
+    elif args.command == "delete":
+        (fs,) = args.paths
+        if args.files_from_raw:
+            for rel in _read_list(args.files_from_raw):
+                jobs.append(("operations/deletefile", dict(common, fs=fs, remote=rel), rel))
+        else:
+            jobs.append(("operations/delete", dict(common, fs=fs), fs))
+    elif args.command == "purge":
+        (fs,) = args.paths
+        jobs.append(("operations/purge", dict(common, fs=fs, remote=""), fs))
+    elif args.command == "moveto":
+        src, dst = args.paths
+        if is_dir:
+            jobs.append(("sync/move", dict(
+                common, srcFs=src, dstFs=dst, createEmptySrcDirs=args.create_empty_src_dirs), dst))
+        else:
+            src_fs, src_remote = split_path(src)
+            dst_fs, dst_remote = split_path(dst)
+            jobs.append(("operations/movefile", dict(
+                common, srcFs=src_fs, srcRemote=src_remote, dstFs=dst_fs, dstRemote=dst_remote), dst))
+    elif args.command == "bisync":
+        path1, path2 = args.paths
+        params = dict(common, path1=path1, path2=path2, resync=args.resync,
+                      createEmptySrcDirs=args.create_empty_src_dirs)
+        if args.conflict_resolve:
+            params["conflictResolve"] = args.conflict_resolve
+        if args.conflict_loser:
+            params["conflictLoser"] = args.conflict_loser
+        jobs.append(("sync/bisync", params, path2))
+    return jobs
+
+
+class _LogCopier:
+    """Copies what the rcd appends to its log into a per-run log file."""
+
+    def __init__(self, source, dest):
+        self.source = source
+        self.dest = dest
+        try:
+            self.offset = os.path.getsize(source)
+        except OSError:
+            self.offset = 0
+
+    def copy(self):
+        try:
+            size = os.path.getsize(self.source)
+        except OSError:
+            return
+        if size < self.offset:
+            self.offset = 0  # Trimmed by the watcher
+        if size == self.offset or self.dest is None:
+            self.offset = size
+            return
+        with open(self.source, "rb") as src, open(self.dest, "ab") as dst:
+            src.seek(self.offset)
+            data = src.read(size - self.offset)
+            # Never split a line between two copies
+            cut = data.rfind(b"\n") + 1
+            dst.write(data[:cut])
+        self.offset += cut
+
+    def write(self, text):
+        if self.dest is not None:
+            with open(self.dest, "a") as dst:
+                dst.write(text)
+
+
+def _stamp():
+    return time.strftime("%Y/%m/%d %H:%M:%S")
+
+
+def _log_line(json_log, level, msg, obj=None, stats=None):
+    """A line in rclone's text (--log-format date,time) or JSON log format."""
+    if not json_log:
+        label = f"{obj}: " if obj else ""
+        return f"{_stamp()} {level.upper():<6}: {label}{msg}\n"
+    record = {"time": time.strftime("%Y-%m-%dT%H:%M:%S%z"), "level": level, "msg": msg}
+    if obj:
+        record["object"] = obj
+    if stats is not None:
+        record["stats"] = stats
+    return json.dumps(record) + "\n"
+
+
+def _stats_line(stats, json_log=False):
+    done = stats.get("bytes", 0)
+    total = max(stats.get("totalBytes", 0), done)
+    pct = int(done * 100 / total) if total else 0
+    msg = (
+        f"{done} B / {total} B, {pct}%, {int(stats.get('speed', 0))} B/s, ETA - "
+        f"(xfr#{stats.get('transfers', 0)}/{stats.get('totalTransfers', 0)})"
+    )
+    return _log_line(json_log, "info", msg, stats=stats)
+
+
+def _parse_interval(value):
+    try:
+        return float(value.rstrip("s"))
+    except ValueError:
+        return 0
+
+
+def run(argv, socket_path=None, log_path=None):
+    """Runs an rclone command line on the rcd. Returns an rclone-like exit code."""
+    args = parse_command(argv)
+    if args is None:
+        return EXIT_UNAVAILABLE
+    default_socket, default_log = default_paths()
+    client = RcClient(socket_path or default_socket)
+    if not client.ping():
+        client.close()
+        return EXIT_UNAVAILABLE
+
+    # What the plan needs to know from the rcd; if it cannot tell, the CLI runs
+    if args.drive_chunk_size:
+        types = {}
+        paths = [with_chunk_size(client, p, args.drive_chunk_size, types) for p in args.paths]
+        if None in paths:
+            client.close()
+            return EXIT_UNAVAILABLE
+        args.paths = paths
+    is_dir = False
+    if args.command == "moveto":
+        is_dir = stat_is_dir(client, args.paths[0])
+        if is_dir is None:
+            client.close()
+            return EXIT_UNAVAILABLE
+
+    # Only after the checks: the caller falls back to rclone with our stdin
+    # Stats of this run's jobs only: pairs may run at the same time
+    group = f"cdsync-{os.getpid()}"
+    jobs = plan_jobs(args, is_dir, group)
+    log = _LogCopier(log_path or default_log, args.log_file)
+    stats_every = _parse_interval(args.stats)
+
+    exit_code = 0
+    pending = list(jobs)
+    running = {}  # jobid -> (method, label)
+    # Per-file jobs run --transfers at a time, like the CLI's transfers
+    limit = max(1, args.transfers or 4) if args.files_from_raw else 1
+    next_stats = time.monotonic() + stats_every
+    try:
+        while pending or running:
+            while pending and len(running) < limit:
+                method, params, label = pending.pop(0)
+                try:
+                    running[client.start_job(method, params)] = (method, label)
+                except RcError as e:
+                    log.write(_log_line(args.use_json_log, "error", str(e), label))
+                    exit_code = exit_code or 1
+            time.sleep(POLL_INTERVAL)
+            for jobid in list(running):
+                status = client.job_status(jobid)
+                if not status.get("finished"):
+                    continue
+                method, label = running.pop(jobid)
+                if not status.get("success"):
+                    error = status.get("error", "failed")
+                    if "directory not found" in error:
+                        code = EXIT_DIR_NOT_FOUND
+                    else:
+                        code = 1
+                    verb = "Failed to copy" if method == "operations/copyfile" else "Failed"
+                    log.copy()
+                    log.write(_log_line(args.use_json_log, "error", f"{verb}: {error}", label))
+                    exit_code = exit_code or code
+            log.copy()
+            if stats_every and time.monotonic() >= next_stats:
+                next_stats = time.monotonic() + stats_every
+                log.write(_stats_line(client.call("core/stats", {"group": group}), args.use_json_log))
+    except RcError as e:
+        # The rcd went away mid-run; the jobs' outcome is unknown
+        log.write(_log_line(args.use_json_log, "error", str(e), "rcd"))
+        exit_code = exit_code or 1
+    finally:
+        log.copy()
+        try:
+            client.call("core/stats-delete", {"group": group})
+        except RcError:
+            pass
+        client.close()
+    return exit_code
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv[:1] == ["run"]:
+        # Passed through untouched: it is an rclone command line
+        return run(argv[1:])
+    parser = argparse.ArgumentParser(prog="python3 -m cdsync.rcd")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("run", help="Run an rclone command line on the rcd (125: unavailable)")
+    sub.add_parser("ping", help="Exit 0 if the rcd is answering")
+    args = parser.parse_args(argv)
+    if args.command == "ping":
+        client = RcClient()
+        try:
+            return 0 if client.ping() else 1
+        finally:
+            client.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
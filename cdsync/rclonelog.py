@@ -0,0 +1,278 @@
+"""One pass over a finished run's rclone log.
+
+cdsync-core.sh runs rclone with --use-json-log, one JSON record per line:
+
+    {"time": "2024-01-31T12:00:00.123+01:00", "level": "info",
+     "msg": "Copied (new)", "object": "dir/file.txt", ...}
+
+`digest` reads that log once, streaming, and produces:
+
+- the Smart Ignore entries (paths rclone changed locally), sent to the watcher
+- activity events for the tray, appended to <instance>-activity.jsonl as
+  [timestamp, action, path, source] (see cdsync.logparse.ActivityEvent)
+- the run statistics auto-tuning measures (cdsync/tuning.py)
+- the files rclone changed and the bytes it transferred, added to the
+  run's record for metrics (--record, see update_run_record)
+- whether bisync refused to run until a --resync ("Must run --resync"),
+  printed as "resync-required" for cdsync-core.sh's auto-healing
+- with --report, the per-file results of a batched smart sync
+  (cdsync/smartsync.py)
+
+and appends the log to the CDSync log in rclone's text format, so the log
+window, metrics and archive read what they always did. Operations are
+recognized from the record's "object" and message instead of re-parsing
+text. Lines that are not JSON (bisync's own messages carry no object,
+older rclone, rcd engine notes) fall back to the text parsers.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+from cdsync import ignore
+from cdsync.config import atomic_write
+from cdsync.logparse import COPIED, DELETED, RCLONE, UPDATED, ActivityEvent, classify_line, classify_operation
+from cdsync.logtail import read_lines_before
+from cdsync.smartsync import FileResults, record_manifest, write_report
+from cdsync.status import BASE_DIR, parse_stats_line, state_path, stats_from_json
+from cdsync.tuning import DEFAULTS, RunMeter, Tuner, describe
+
+# The activity file is cut back to this many events when it doubles
+MAX_EVENTS = 2000
+
+# rclone's text log level column ("%-6s")
+_LEVELS = {
+    "debug": "DEBUG",
+    "info": "INFO",
+    "notice": "NOTICE",
+    "warning": "NOTICE",
+    "error": "ERROR",
+    "critical": "CRITICAL",
+}
+
+# Operations that change the local side when rclone reports them for a path
+_LOCAL_OPS = ("Copied", "Deleted")
+
+# Bisync's own messages carry no object: "- Path1    File is new    - path"
+_BISYNC_PREFIX = "- Path"
+
+# Bisync's error when its listings are gone (interrupted or failed run)
+_RESYNC_MARKER = "Must run --resync"
+
+
+def default_activity_path(base_dir=BASE_DIR):
+    return state_path("-activity.jsonl", base_dir)
+
+
+class LogRecord:
+    """One line of an rclone log. `text` is set for lines that were not JSON."""
+
+    __slots__ = ("time", "level", "msg", "object", "stats", "text")
+
+    def __init__(self, time, level, msg, object=None, stats=None, text=None):
+        self.time = time      # "YYYY/MM/DD HH:MM:SS" (local, as logged) or None
+        self.level = level
+        self.msg = msg
+        self.object = object
+        self.stats = stats
+        self.text = text
+
+    def render(self):
+        """The line as rclone writes it with --log-format date,time."""
+        if self.text is not None:
+            return self.text
+        prefix = f"{self.time} " if self.time else ""
+        level = _LEVELS.get(self.level, (self.level or "info").upper())
+        path = f"{self.object}: " if self.object else ""
+        return f"{prefix}{level:<6}: {path}{self.msg}"
+
+    def timestamp(self):
+        """"YYYY-MM-DD HH:MM:SS", as ActivityEvent uses."""
+        return self.time.replace("/", "-") if self.time else ""
+
+
+def parse_line(line):
+    line = line.rstrip("\n")
+    if line.startswith("{"):
+        try:
+            data = json.loads(line)
+        except ValueError:
+            data = None
+        if isinstance(data, dict):
+            stamp = str(data.get("time", ""))
+            # ISO 8601 in local time: keep the wall clock, as the text log does
+            when = f"{stamp[:10].replace('-', '/')} {stamp[11:19]}" if len(stamp) >= 19 else None
+            obj = data.get("object")
+            stats = data.get("stats")
+            return LogRecord(when, data.get("level", "info"), str(data.get("msg", "")).rstrip("\n"),
+                             str(obj) if obj else None, stats if isinstance(stats, dict) else None)
+    return LogRecord(None, None, line, text=line)
+
+
+def text_lines(lines):
+    """A JSON (or text) rclone log as text lines, for the text parsers."""
+    for line in lines:
+        yield parse_line(line).render()
+
+
+class RunDigest:
+    def __init__(self, meter=None, track_local=False, report=None):
+        self.meter = meter
+        self.track_local = track_local
+        self.report = report
+        self.local_changes = []
+        self.events = []
+        # Paths rclone copied, updated or deleted
+        self.changed = set()
+        self.resync_required = False
+        self._done_bytes = 0
+        self._process_bytes = 0
+
+    @property
+    def bytes(self):
+        return self._done_bytes + self._process_bytes
+
+    def add(self, record):
+        """Folds one record in and returns its text form."""
+        text = record.render()
+        if record.object is not None:
+            event = classify_operation(record.timestamp(), record.object, record.msg)
+            local = record.object if record.msg.startswith(_LOCAL_OPS) else None
+        elif record.text is not None:
+            event = classify_line(text)
+            local = ignore.local_change(text) if self.track_local else None
+        elif record.msg.startswith(_BISYNC_PREFIX):
+            # Bisync deltas: only their wording tells them apart
+            msg = record.msg
+            event = classify_line(text) if "File is new" in msg or "Directory" in msg else None
+            local = ignore.local_change(text) if self.track_local and ("to Path2" in msg or "Deleted" in msg) \
+                else None
+        else:
+            event = local = None
+        if self.track_local and local:
+            self.local_changes.append(local)
+        if event is not None:
+            self.events.append(event)
+            if event.source == RCLONE and event.action in (COPIED, UPDATED, DELETED):
+                self.changed.add(event.path)
+        if record.stats is not None:
+            stats = stats_from_json(record.stats)
+        else:
+            stats = parse_stats_line(text) if "%" in text else None
+        if stats:
+            # Stats are cumulative per rclone process: a drop means a new one
+            if stats["bytes_transferred"] < self._process_bytes:
+                self._done_bytes += self._process_bytes
+            self._process_bytes = stats["bytes_transferred"]
+        elif _RESYNC_MARKER in record.msg:
+            self.resync_required = True
+        if self.report is not None:
+            self.report.add(text, event)
+        if self.meter is not None:
+            self.meter.add(text, event, stats, check_errors=record.level != "info")
+        return text
+
+
+def append_events(events, path):
+    if not events:
+        return
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "a") as f:
+        f.write("".join(json.dumps([e.timestamp, e.action, e.path, e.source]) + "\n" for e in events))
+    # Bounded: keep the newest MAX_EVENTS once the file holds twice that
+    if os.path.getsize(path) > MAX_EVENTS * 2 * 150:
+        _, lines = read_lines_before(path, os.path.getsize(path), MAX_EVENTS * 150)
+        atomic_write(path, "".join(text + "\n" for _, text in lines[-MAX_EVENTS:]))
+
+
+def update_run_record(path, run, resync=False):
+    """Adds a digested log to the run's record: {"files", "bytes", "resync"}.
+
+    A core run may digest several logs (a failed bisync, then its recovery);
+    cdsync/metrics.py reads the totals when the run ends.
+    """
+    try:
+        with open(path) as f:
+            record = json.load(f)
+    except (OSError, ValueError):
+        record = {}
+    record = {
+        "files": record.get("files", 0) + len(run.changed),
+        "bytes": record.get("bytes", 0) + run.bytes,
+        "resync": record.get("resync", False) or resync,
+    }
+    atomic_write(path, json.dumps(record) + "\n")
+
+
+def parse_event(line):
+    """ActivityEvent of one activity file line, or None."""
+    try:
+        return ActivityEvent(*json.loads(line))
+    except (ValueError, TypeError):
+        return None
+
+
+def digest(rclone_log, log_file, local_dir, profile=None, started_at=None,
+           track_local=False, activity_path=None, socket_path=None, requested=None):
+    """Reads `rclone_log` once; see the module docstring. Returns the RunDigest.
+
+    `requested` are the paths of a batched smart sync to report on.
+    """
+    meter = RunMeter(local_dir) if profile else None
+    report = FileResults(requested) if requested is not None else None
+    run = RunDigest(meter, track_local, report)
+    with open(rclone_log, "r", errors="replace") as src, open(log_file, "a") as out:
+        for line in src:
+            out.write(run.add(parse_line(line)) + "\n")
+
+    if track_local and run.local_changes:
+        ignore.send(run.local_changes, local_dir, socket_path)
+    append_events(run.events, activity_path or default_activity_path())
+    if meter is not None:
+        duration = time.time() - started_at if started_at else 0
+        stats = meter.result(duration)
+        old, new, reason = Tuner().record(profile, stats)
+        with open(log_file, "a") as f:
+            f.write(f"{time.strftime('%Y-%m-%d %H:%M:%S')} - {describe(profile, old, new, reason, stats)}\n")
+    if report is not None:
+        write_report(report.results, log_file)
+        record_manifest(report.results, local_dir)
+    return run
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python3 -m cdsync.rclonelog")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_dig = sub.add_parser("digest", help="Process a finished run's rclone log and append it to the CDSync log")
+    p_dig.add_argument("rclone_log")
+    p_dig.add_argument("log_file")
+    p_dig.add_argument("local_dir")
+    p_dig.add_argument("--tune", choices=DEFAULTS, help="Measure the run for this auto-tuning profile")
+    p_dig.add_argument("--started", type=float, help="Run start (epoch seconds), with --tune")
+    p_dig.add_argument("--ignore", action="store_true", help="Send Smart Ignore entries for local changes")
+    p_dig.add_argument("--record", help="Add the run's files and bytes to this per-run record (JSON)")
+    p_dig.add_argument("--resync", action="store_true", help="The log is a --resync run's, with --record")
+    p_dig.add_argument("--report", action="store_true",
+                       help="Log per-file results of a batched smart sync; requested paths on stdin")
+    p_text = sub.add_parser("text", help="Print an rclone log as text")
+    p_text.add_argument("rclone_log")
+    args = parser.parse_args(argv)
+
+    if args.command == "digest":
+        requested = [line.rstrip("\n") for line in sys.stdin if line.strip()] if args.report else None
+        run = digest(args.rclone_log, args.log_file, args.local_dir, args.tune, args.started, args.ignore,
+                     requested=requested)
+        if args.record:
+            update_run_record(args.record, run, args.resync)
+        if run.resync_required:
+            print("resync-required")
+    elif args.command == "text":
+        with open(args.rclone_log, "r", errors="replace") as f:
+            for text in text_lines(f):
+                print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
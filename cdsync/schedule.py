@@ -0,0 +1,229 @@
+"""Weekly schedule of bandwidth and transfer limits ("windows").
+
+    SCHEDULE_WINDOWS="office night"
+    SCHEDULE_office="Mon-Fri 08:00-18:00"
+    SCHEDULE_office_BWLIMIT=2M
+    SCHEDULE_office_TRANSFERS=4
+    SCHEDULE_night="22:00-06:00"            # every day, across midnight
+    SCHEDULE_night_BWLIMIT=off
+    SCHEDULE_night_TRANSFERS=32
+
+The first listed window containing the current time applies; outside all of
+them BWLIMIT and MAX_TRANSFERS do. The limits are global: the watcher's
+scheduler splits them between the runs it starts (see cdsync.scheduler.Budget).
+
+When the window changes, the watcher applies the new bandwidth to running
+rclone processes through their remote control socket (core/bwlimit), without
+restarting them. Transfers are fixed for the life of an rclone process, so a
+new transfers value applies from the next rclone run on. The tray or
+`cdsync schedule` can override the schedule for a while with another window
+or "unlimited".
+"""
+import argparse
+import os
+import re
+import sys
+import time
+
+from cdsync.config import Config
+from cdsync.rcd import RcClient, RcError
+from cdsync.scheduler import parse_rate
+from cdsync.status import BASE_DIR, instance_name
+
+DAYS = ("Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun")
+DEFAULT_WINDOW = "default"
+UNLIMITED = "unlimited"
+# Default length of a tray/CLI override
+OVERRIDE_MINUTES = 60
+
+_NAME_RE = re.compile(r"^[A-Za-z0-9_]+$")
+_RANGE_RE = re.compile(r"^(\d{1,2}):(\d{2})-(\d{1,2}):(\d{2})$")
+
+
+def default_rc_dir(base_dir=BASE_DIR):
+    """Private (0700) directory with the rc sockets of running rclone processes."""
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR") or "/tmp"
+    return os.path.join(runtime_dir, instance_name(base_dir) + "-rc")
+
+
+def _parse_days(text):
+    days = set()
+    for part in text.split(","):
+        if part == "*":
+            return set(range(7))
+        first, _, last = part.partition("-")
+        try:
+            start = DAYS.index(first.capitalize()[:3])
+            end = DAYS.index(last.capitalize()[:3]) if last else start
+        except ValueError:
+            raise ValueError(f"invalid days: {text}") from None
+        days.add(start)
+        while start != end:
+            start = (start + 1) % 7
+            days.add(start)
+    return days
+
+
+def _parse_range(text):
+    m = _RANGE_RE.match(text)
+    if not m:
+        raise ValueError(f"invalid time range: {text}")
+    h1, m1, h2, m2 = (int(v) for v in m.groups())
+    if h1 > 24 or h2 > 24 or m1 > 59 or m2 > 59:
+        raise ValueError(f"invalid time range: {text}")
+    return h1 * 60 + m1, h2 * 60 + m2
+
+
+class Window:
+    """Limits for a set of days and a time of day. bwlimit None: unlimited."""
+
+    def __init__(self, name, days=None, start=0, end=24 * 60, bwlimit=None, transfers=None, spec=""):
+        self.name = name
+        self.spec = spec
+        self.days = set(range(7)) if days is None else days
+        self.start = start  # minutes after midnight
+        self.end = end      # before start: the window runs past midnight
+        self.bwlimit = bwlimit
+        self.transfers = transfers
+
+    @classmethod
+    def parse(cls, name, spec, bwlimit=None, transfers=None):
+        """"[days] [HH:MM-HH:MM]", e.g. "Mon-Fri 08:00-18:00", "Sat,Sun", "22:00-06:00"."""
+        days, start, end = None, 0, 24 * 60
+        for part in spec.split():
+            if part[0].isdigit():
+                start, end = _parse_range(part)
+            else:
+                days = _parse_days(part)
+        if bwlimit is not None:
+            parse_rate(bwlimit.split(":")[0])  # Raises ValueError if rclone would reject it
+            parse_rate(bwlimit.split(":")[-1])
+            if bwlimit.strip().lower() == "off":
+                bwlimit = None
+        return cls(name, days, start, end, bwlimit, transfers, spec)
+
+    def contains(self, when):
+        """True if the local time `when` (struct_time) is in the window."""
+        minute = when.tm_hour * 60 + when.tm_min
+        day = when.tm_wday
+        if self.start <= self.end:
+            return day in self.days and self.start <= minute < self.end
+        # Overnight: the part after midnight belongs to the previous day
+        return (day in self.days and minute >= self.start) or \
+            ((day - 1) % 7 in self.days and minute < self.end)
+
+    def describe(self):
+        bw = self.bwlimit or "unlimited"
+        transfers = f", {self.transfers} transfers" if self.transfers else ""
+        return f"{self.name}: {bw}{transfers}"
+
+    def __repr__(self):
+        return f"Window({self.describe()})"
+
+
+def _int(value):
+    try:
+        return int(value) or None
+    except (TypeError, ValueError):
+        return None
+
+
+def load_schedule(config):
+    """Schedule from config.env values (anything with get(name, default)).
+
+    A window without its own _BWLIMIT or _TRANSFERS keeps BWLIMIT or
+    MAX_TRANSFERS; invalid windows are skipped with a warning.
+    """
+    transfers = _int(config.get("MAX_TRANSFERS"))
+    try:
+        default = Window.parse(DEFAULT_WINDOW, "", config.get("BWLIMIT") or None, transfers)
+    except ValueError as e:
+        print(f"WARNING: BWLIMIT: {e}. Bandwidth is not limited.", file=sys.stderr)
+        default = Window(DEFAULT_WINDOW, transfers=transfers)
+    windows = []
+    for name in (config.get("SCHEDULE_WINDOWS") or "").split():
+        if not _NAME_RE.match(name) or name in (DEFAULT_WINDOW, UNLIMITED):
+            print(f"WARNING: Invalid schedule window name {name!r}. Skipped.", file=sys.stderr)
+            continue
+        try:
+            windows.append(Window.parse(
+                name, config.get(f"SCHEDULE_{name}") or "",
+                config.get(f"SCHEDULE_{name}_BWLIMIT") or default.bwlimit,
+                _int(config.get(f"SCHEDULE_{name}_TRANSFERS")) or default.transfers,
+            ))
+        except ValueError as e:
+            print(f"WARNING: Schedule window {name}: {e}. Skipped.", file=sys.stderr)
+    return Schedule(windows, default)
+
+
+class Schedule:
+    def __init__(self, windows, default=None):
+        self.windows = windows
+        self.default = default or Window(DEFAULT_WINDOW)
+        self.override = None  # (window, until epoch seconds)
+
+    def window(self, name):
+        if name == UNLIMITED:
+            return Window(UNLIMITED)
+        if name == DEFAULT_WINDOW:
+            return self.default
+        return next((w for w in self.windows if w.name == name), None)
+
+    def active(self, now=None):
+        """The window in force at `now` (epoch seconds), the override first."""
+        now = time.time() if now is None else now
+        if self.override is not None:
+            window, until = self.override
+            if now < until:
+                return window
+            self.override = None
+        when = time.localtime(now)
+        return next((w for w in self.windows if w.contains(when)), self.default)
+
+    def set_override(self, name, minutes=OVERRIDE_MINUTES, now=None):
+        """Forces window `name` for `minutes`; name None resumes the schedule."""
+        if name is None:
+            self.override = None
+            return True
+        window = self.window(name)
+        if window is None:
+            return False
+        now = time.time() if now is None else now
+        self.override = (window, now + minutes * 60)
+        return True
+
+    def override_until(self):
+        return self.override[1] if self.override is not None else None
+
+
+def set_bwlimit(socket_path, rate):
+    """Changes the bandwidth of a running rclone (rc) in flight. False if it is gone."""
+    client = RcClient(socket_path, timeout=2.0)
+    try:
+        client.call("core/bwlimit", {"rate": rate or "off"})
+    except RcError:
+        return False
+    finally:
+        client.close()
+    return True
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python3 -m cdsync.schedule")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("active", help="Print the window in force now: name, bwlimit (or off), transfers (or 0)")
+    sub.add_parser("list", help="Print the configured windows")
+    args = parser.parse_args(argv)
+
+    schedule = load_schedule(Config(os.path.join(BASE_DIR, "config.env")))
+    if args.command == "active":
+        window = schedule.active()
+        print(f"{window.name}\t{window.bwlimit or 'off'}\t{window.transfers or 0}")
+    elif args.command == "list":
+        for window in schedule.windows + [schedule.default]:
+            print(f"{window.describe()}\t{window.spec or 'otherwise'}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,352 @@
+"""Priority job scheduler for cdsync-core.sh runs, hosted by the watcher.
+
+Every run (watcher batches, the poll timer, tray actions) becomes a job in
+one in-memory queue instead of a bash process contending for the flock:
+
+    user (resync, dedupe, Sync Now)  >  directory  >  file batch  >  periodic
+
+Every job belongs to one sync pair (see cdsync.pairs); between jobs of the
+same priority, the pair with the lower PRIORITY goes first.
+
+Pending jobs are merged instead of piling up: file batches merge their
+paths, directory syncs their subtrees, and a pending full bisync absorbs
+every pending file and directory job of its pair (it covers them). Moves
+are never absorbed: a bisync would upload the renamed files again. Bisync
+needs exclusive access to its state, so a pair runs one job at a time;
+across pairs, at most MAX_CONCURRENT_SYNCS jobs run at once and split the
+global MAX_TRANSFERS and BWLIMIT budgets evenly (see Budget). Nothing is
+dropped: a job only disappears when a pending job that covers it runs.
+
+Jobs are submitted in-process (the watcher) or over the status socket:
+    {"op": "submit", "kind": ..., "paths": [...], "lines": [...], "mode": ..., "pair": ...}
+`cdsync-core.sh` forwards itself here with `submit` when the watcher is up.
+"""
+import argparse
+import itertools
+import os
+import re
+import sys
+import threading
+
+from cdsync import status
+from cdsync.status import DEFAULT_PAIR, PAIR_ENV
+
+# Lower runs first
+PRIORITY_USER = 0
+PRIORITY_DIR = 1
+PRIORITY_FILES = 2
+PRIORITY_PERIODIC = 3
+
+# Job kinds and their base priority
+KINDS = {
+    "resync": PRIORITY_USER,
+    "dedupe": PRIORITY_USER,
+    "sync-now": PRIORITY_USER,
+    "bisync": PRIORITY_DIR,      # full bisync for a directory event (overflow, root change)
+    "move": PRIORITY_DIR,        # server-side renames, before the uploads queued with them
+    "dir-sync": PRIORITY_DIR,
+    "files": PRIORITY_FILES,
+    "periodic": PRIORITY_PERIODIC,
+}
+
+# Full bisyncs: each covers any pending file or directory job
+FULL_BISYNC = ("sync-now", "bisync", "periodic")
+# Kinds a pending job of the key kind makes redundant
+ABSORBS = {
+    "resync": ("resync",) + FULL_BISYNC,
+    "sync-now": FULL_BISYNC + ("dir-sync", "files"),
+    "bisync": FULL_BISYNC + ("dir-sync", "files"),
+    "periodic": FULL_BISYNC + ("dir-sync", "files"),
+}
+
+# Runs at once across pairs (a pair never runs two: bisync keeps its
+# listings per path pair)
+MAX_RUNNING = 1
+
+_sequence = itertools.count()
+
+
+# rclone --bwlimit: a rate, or "upload:download" rates (KiB/s without suffix)
+_RATE_RE = re.compile(r"^([\d.]+)([BKMGTP]?)$", re.IGNORECASE)
+_RATE_UNITS = "BKMGTP"
+
+
+def parse_rate(text):
+    """Bytes/s of one rclone --bwlimit rate ("512", "10M", "1.5G"), None for "off"."""
+    if text is None or text.strip().lower() in ("", "off"):
+        return None
+    m = _RATE_RE.match(text.strip())
+    if not m:
+        raise ValueError(f"invalid bandwidth limit: {text}")
+    unit = (m.group(2) or "K").upper()
+    return float(m.group(1)) * 1024 ** _RATE_UNITS.index(unit)
+
+
+def format_rate(rate):
+    return "off" if rate is None else f"{max(1, round(rate / 1024))}K"
+
+
+class Budget:
+    """Global resource limits, split evenly between the runs that may overlap.
+
+    Each of the `slots` concurrent runs gets 1/slots of MAX_TRANSFERS and of
+    BWLIMIT, so the total stays within them however many are running.
+    """
+
+    def __init__(self, slots=1, transfers=None, bwlimit=None):
+        self.slots = max(1, slots)
+        self.set(transfers, bwlimit)
+
+    def set(self, transfers=None, bwlimit=None):
+        """New global limits (see cdsync.schedule); shares already handed out are kept."""
+        rates = (bwlimit or "").split(":")
+        # [upload, download] bytes/s, either None (unlimited)
+        self.rates = [parse_rate(rates[0]), parse_rate(rates[-1])] if bwlimit else [None, None]
+        self.transfers = transfers
+
+    def share(self):
+        """{"transfers": n or None, "bwlimit": rclone --bwlimit value or None} of one run."""
+        transfers = max(1, self.transfers // self.slots) if self.transfers else None
+        up, down = (rate / self.slots if rate else None for rate in self.rates)
+        if up is None and down is None:
+            bwlimit = None
+        elif up == down:
+            bwlimit = format_rate(up)
+        else:
+            bwlimit = f"{format_rate(up)}:{format_rate(down)}"
+        return {"transfers": transfers, "bwlimit": bwlimit}
+
+
+class Job:
+    def __init__(self, kind, paths=(), lines=(), mode=None, pair=DEFAULT_PAIR):
+        if kind not in KINDS:
+            raise ValueError(f"unknown job kind: {kind}")
+        self.kind = kind
+        self.priority = KINDS[kind]
+        self.paths = set(paths)   # files: absolute paths
+        self.lines = list(lines)  # dir-sync: "+ rel" / "- rel"; move: "from\tto"
+        self.mode = mode          # dedupe mode
+        self.pair = pair
+        self.pair_priority = 0    # set by the scheduler
+        self.seq = next(_sequence)
+
+    def core_args(self):
+        if self.kind == "files":
+            return ["--smart-sync-batch"], sorted(self.paths)
+        if self.kind == "dir-sync":
+            return ["--dir-sync"], self.lines
+        if self.kind == "move":
+            return ["--moves"], self.lines
+        if self.kind == "bisync":
+            return ["--dir-event", "Batch Trigger"], None
+        if self.kind == "resync":
+            return ["--force-resync"], None
+        if self.kind == "dedupe":
+            return ["--dedupe", self.mode], None
+        return [], None  # periodic, sync-now
+
+    def merge(self, other):
+        """Folds `other` into this job if one run can do both. Returns True if merged."""
+        if other.pair != self.pair:
+            return False
+        if self.kind == "resync" and (other.paths or other.lines):
+            # A resync may let the remote win differing files: pending
+            # local changes must still be uploaded as their own run
+            return False
+        if other.kind in ABSORBS.get(self.kind, ()):
+            if other.kind in FULL_BISYNC and other.priority < self.priority:
+                self.kind = other.kind  # e.g. Sync Now folds in a pending periodic run
+        elif other.kind != self.kind or (self.kind == "dedupe" and other.mode != self.mode):
+            return False
+        self.paths |= other.paths
+        if self.kind == "move":
+            self.lines += other.lines  # In order: a later move may undo an earlier one
+        else:
+            self.lines += [line for line in other.lines if line not in self.lines]
+        self.priority = min(self.priority, other.priority)
+        self.seq = min(self.seq, other.seq)
+        return True
+
+    def sort_key(self):
+        return self.priority, self.pair_priority, self.seq
+
+    def __repr__(self):
+        size = len(self.paths) or len(self.lines)
+        pair = f"{self.pair}: " if self.pair != DEFAULT_PAIR else ""
+        return f"Job({pair}{self.kind}{f', {size}' if size else ''})"
+
+
+class Scheduler:
+    """Pending queue plus the running jobs; `poll()` is driven by the watcher loop."""
+
+    def __init__(self, start_job, hub=None, max_running=MAX_RUNNING, on_start=None, on_finish=None,
+                 budget=None, priorities=None):
+        # start_job(job, share) -> Popen, e.g. Watcher.start_job; share is Budget.share()
+        self.start_job = start_job
+        # Optional callbacks: on_start(job), on_finish(job, exit_code)
+        self.on_start = on_start
+        self.on_finish = on_finish
+        self.hub = hub
+        self.max_running = max_running
+        self.budget = budget or Budget()
+        self.priorities = priorities or {}  # pair -> PRIORITY
+        self.pending = []
+        self.running = []  # (job, process)
+        self.lock = threading.Lock()
+        # Lets submissions from hub threads wake up the watcher's selector
+        self.wakeup_r, self.wakeup_w = os.pipe()
+        os.set_blocking(self.wakeup_r, False)
+        os.set_blocking(self.wakeup_w, False)
+
+    def fileno(self):
+        return self.wakeup_r
+
+    def close(self):
+        os.close(self.wakeup_r)
+        os.close(self.wakeup_w)
+
+    def submit(self, job):
+        """Queues a job, merging it into a pending one where possible."""
+        job.pair_priority = self.priorities.get(job.pair, 0)
+        with self.lock:
+            for pending in self.pending:
+                if pending.merge(job):
+                    print(f"Scheduler: {job} merged into pending {pending}")
+                    break
+            else:
+                # A new full bisync also covers what is already pending
+                covered = [p for p in self.pending if job.merge(p)]
+                self.pending = [p for p in self.pending if p not in covered]
+                self.pending.append(job)
+                print(f"Scheduler: queued {job}" + (f" (absorbed {covered})" if covered else ""))
+            self._publish_depth()
+        self.wake()
+
+    def wake(self):
+        """Makes the watcher's selector return (from any thread)."""
+        try:
+            os.write(self.wakeup_w, b"\0")
+        except BlockingIOError:
+            pass
+
+    def handle_message(self, msg):
+        """Status hub handler for {"op": "submit", ...}."""
+        try:
+            self.submit(Job(msg.get("kind"), msg.get("paths", ()), msg.get("lines", ()), msg.get("mode"),
+                            msg.get("pair") or DEFAULT_PAIR))
+        except ValueError as e:
+            print(f"Scheduler: rejected submission: {e}")
+
+    def poll(self):
+        """Reaps finished jobs and starts the next ones. Returns True if any is running."""
+        try:
+            while os.read(self.wakeup_r, 4096):
+                pass
+        except BlockingIOError:
+            pass
+        finished = []
+        started = []
+        with self.lock:
+            still_running = []
+            for job, proc in self.running:
+                if proc.poll() is None:
+                    still_running.append((job, proc))
+                else:
+                    finished.append((job, proc.returncode))
+            self.running = still_running
+            self.pending.sort(key=Job.sort_key)
+            busy = {job.pair for job, _ in self.running}
+            for job in list(self.pending):
+                if len(self.running) >= self.max_running:
+                    break
+                if job.pair in busy:
+                    continue  # Its pair's current run must finish first
+                self.pending.remove(job)
+                busy.add(job.pair)
+                print(f"Scheduler: starting {job}")
+                self.running.append((job, self.start_job(job, self.budget.share())))
+                started.append(job)
+            self._publish_depth()
+        # Outside the lock: callbacks may submit jobs
+        for job, code in finished:
+            if self.on_finish:
+                self.on_finish(job, code)
+        for job in started:
+            if self.on_start:
+                self.on_start(job)
+        return bool(self.running)
+
+    def has_pending(self, kinds, pair=None):
+        with self.lock:
+            return any(job.kind in kinds and pair in (None, job.pair) for job in self.pending)
+
+    def is_running(self, pair=None):
+        with self.lock:
+            return any(pair in (None, job.pair) for job, _ in self.running)
+
+    def running_jobs(self):
+        with self.lock:
+            return [job for job, _ in self.running]
+
+    def _publish_depth(self):
+        if self.hub is not None:
+            depths = {}
+            for job in self.pending:
+                depths[job.pair] = depths.get(job.pair, 0) + 1
+            self.hub.set_queue_depths(depths)
+
+
+def core_pair(argv):
+    """The pair a core command line names (--pair NAME or CDSYNC_PAIR), or None."""
+    if "--pair" in argv:
+        i = argv.index("--pair")
+        if i + 1 < len(argv):
+            return argv[i + 1]
+    return os.environ.get(PAIR_ENV) or None
+
+
+def job_from_core_args(argv):
+    """Maps a cdsync-core.sh command line (timer, tray, manual) to a Job."""
+    pair = core_pair(argv) or DEFAULT_PAIR
+    if "--force-resync" in argv:
+        return Job("resync", pair=pair)
+    if "--dedupe" in argv:
+        i = argv.index("--dedupe")
+        return Job("dedupe", mode=argv[i + 1] if i + 1 < len(argv) else "rename", pair=pair)
+    if "--sync-now" in argv:
+        return Job("sync-now", pair=pair)
+    if "--dir-event" in argv:
+        return Job("bisync", pair=pair)
+    if "--smart-sync" in argv:
+        i = argv.index("--smart-sync")
+        if i + 1 < len(argv):
+            return Job("files", paths=[argv[i + 1]], pair=pair)
+    return Job("periodic", pair=pair)
+
+
+def submit(argv, socket_path=None):
+    """Forwards a core command line to the watcher. False if it is not running.
+
+    Without a pair, the watcher picks it: every pair for full syncs, the
+    pair holding the path for a smart sync, the default pair otherwise.
+    """
+    job = job_from_core_args(argv)
+    msg = {"op": "submit", "kind": job.kind, "paths": sorted(job.paths), "mode": job.mode,
+           "pair": core_pair(argv)}
+    return status.publish(msg, socket_path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python3 -m cdsync.scheduler")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_sub = sub.add_parser("submit", help="Queue a cdsync-core.sh run in the watcher (exit 1: not running)")
+    p_sub.add_argument("core_args", nargs=argparse.REMAINDER)
+    args = parser.parse_args(argv)
+
+    if args.command == "submit":
+        return 0 if submit(args.core_args) else 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,126 @@
+"""Per-path write quiescence: large files are uploaded once they stop changing.
+
+A big file copied into the sync directory emits create and close_write
+events over minutes; uploading it at the first batch sends an incomplete
+file, then sends it again after every later event. The watcher holds such
+files back until their size and mtime have not changed for a settle time:
+
+- files below WRITE_SETTLE_MIN_MB that were closed after writing go out
+  with their batch, as before
+- larger files wait WRITE_SETTLE seconds plus 10 s per GiB, at most
+  WRITE_SETTLE_MAX
+- files only created so far (no close_write yet: still open for writing)
+  wait at least WRITE_SETTLE seconds, whatever their size
+
+Every change of size or mtime restarts the wait. Held files do not delay
+the rest of their batch. WRITE_SETTLE=0 turns this off.
+"""
+import os
+import time
+
+GiB = 1024 ** 3
+
+# Seconds a large file must stay unchanged
+SETTLE_TIME = 10
+# Files from this size (bytes) settle before upload
+SETTLE_MIN_SIZE = 16 * 1024 * 1024
+# Extra settle time per GiB, and the cap
+SETTLE_PER_GIB = 10
+SETTLE_MAX = 120
+# How often held files are checked
+CHECK_INTERVAL = 2
+
+# Events after which the writer has closed the file
+_CLOSED = ("close_write", "moved_to")
+
+
+class _Held:
+    __slots__ = ("size", "mtime_ns", "since", "wait")
+
+    def __init__(self, size, mtime_ns, since, wait):
+        self.size = size
+        self.mtime_ns = mtime_ns
+        self.since = since  # monotonic time of the last change seen
+        self.wait = wait
+
+
+class WriteSettle:
+    def __init__(self, base=SETTLE_TIME, min_size=SETTLE_MIN_SIZE, maximum=SETTLE_MAX):
+        self.base = base
+        self.min_size = min_size
+        self.maximum = max(maximum, base)
+        self.held = {}  # path -> _Held
+        self.checked_at = 0
+
+    def settle_time(self, size, closed=True):
+        if self.base <= 0:
+            return 0  # WRITE_SETTLE=0: disabled
+        if size < self.min_size:
+            return 0 if closed else self.base
+        return min(self.maximum, self.base + SETTLE_PER_GIB * size / GiB)
+
+    def check(self, path, names, now=None):
+        """True if `path` (with the event names of its batch) can be uploaded now.
+
+        Otherwise it is held until due() returns it.
+        """
+        now = time.monotonic() if now is None else now
+        try:
+            st = os.stat(path)
+        except OSError:
+            self.held.pop(path, None)
+            return True  # Gone: a deletion
+        held = self.held.get(path)
+        wait = self.settle_time(st.st_size, any(name in _CLOSED for name in names))
+        if held is not None:
+            if wait == 0:
+                # A small file its writer has closed meanwhile
+                del self.held[path]
+                return True
+            held.wait = max(held.wait, wait)
+            return False
+        if wait == 0:
+            return True
+        self.held[path] = _Held(st.st_size, st.st_mtime_ns, now, wait)
+        return False
+
+    def due(self, now=None):
+        """Held paths that have settled (or are gone), removed from the hold."""
+        now = time.monotonic() if now is None else now
+        if not self.held or now - self.checked_at < CHECK_INTERVAL:
+            return []
+        self.checked_at = now
+        ready = []
+        for path, held in list(self.held.items()):
+            try:
+                st = os.stat(path)
+            except OSError:
+                ready.append(path)
+                continue
+            if (st.st_size, st.st_mtime_ns) != (held.size, held.mtime_ns):
+                # Still being written: start over
+                held.size, held.mtime_ns, held.since = st.st_size, st.st_mtime_ns, now
+                held.wait = max(held.wait, self.settle_time(st.st_size))
+            elif now - held.since >= held.wait:
+                ready.append(path)
+        for path in ready:
+            del self.held[path]
+        return ready
+
+    def next_due(self):
+        """Monotonic time of the next due() check, or None when nothing is held."""
+        return self.checked_at + CHECK_INTERVAL if self.held else None
+
+    def __len__(self):
+        return len(self.held)
+
+
+def load_settle(config):
+    """WriteSettle with the WRITE_SETTLE* values of `config` (anything with get)."""
+    try:
+        base = float(config.get("WRITE_SETTLE", SETTLE_TIME))
+        min_size = float(config.get("WRITE_SETTLE_MIN_MB", SETTLE_MIN_SIZE / 1024 / 1024)) * 1024 * 1024
+        maximum = float(config.get("WRITE_SETTLE_MAX", SETTLE_MAX))
+    except ValueError:
+        base, min_size, maximum = SETTLE_TIME, SETTLE_MIN_SIZE, SETTLE_MAX
+    return WriteSettle(base, min_size, maximum)
@@ -0,0 +1,75 @@
+"""Per-file results for a batched smart sync (cdsync-core.sh --smart-sync-batch).
+
+The core script uploads the whole batch in one `rclone copy --files-from-raw`
+run (plus one `rclone delete` for files gone locally). The run's log digest
+(`python3 -m cdsync.rclonelog digest --report`, requested paths on stdin)
+matches each line against the requested paths in its single pass over the
+log, then writes one result line per file, plus a summary, to the CDSync log.
+"""
+import re
+import sqlite3
+import time
+
+from cdsync.logparse import COPIED, DELETED, RCLONE, UPDATED
+from cdsync.manifest import Manifest
+
+UPLOADED = "uploaded"
+REMOVED = "deleted"
+UNCHANGED = "unchanged"
+FAILED = "failed"
+
+_ICONS = {UPLOADED: "✅", REMOVED: "🗑️", UNCHANGED: "⏸️", FAILED: "❌"}
+
+# "ERROR : path/to/file: Failed to copy: ..."
+_ERROR_RE = re.compile(r"ERROR\s*:\s*(.*?):\s+(.*)")
+
+
+class FileResults:
+    """{relative path: (result, detail)} for every requested path, a log line at a time."""
+
+    def __init__(self, requested):
+        self.results = {path: (UNCHANGED, "") for path in requested}
+
+    def add(self, line, event=None):
+        """One text log line, with its ActivityEvent when it has one."""
+        results = self.results
+        if event is not None and event.source == RCLONE and event.path in results:
+            if event.action in (COPIED, UPDATED):
+                results[event.path] = (UPLOADED, "")
+            elif event.action == DELETED:
+                results[event.path] = (REMOVED, "")
+            return
+        if "ERROR" in line:
+            m = _ERROR_RE.search(line)
+            if m and m.group(1).strip() in results:
+                results[m.group(1).strip()] = (FAILED, m.group(2).strip())
+
+
+def write_report(results, log_file):
+    stamp = time.strftime("%Y-%m-%d %H:%M:%S")
+    counts = {UPLOADED: 0, REMOVED: 0, UNCHANGED: 0, FAILED: 0}
+    with open(log_file, "a") as f:
+        for path, (result, detail) in sorted(results.items()):
+            counts[result] += 1
+            suffix = f" ({detail})" if detail else ""
+            f.write(f"{stamp} - INFO: {_ICONS[result]} Batch {result}: {path}{suffix}\n")
+        f.write(
+            f"{stamp} - INFO: 🚀 Batch Sync: {counts[UPLOADED]} uploaded, {counts[REMOVED]} deleted, "
+            f"{counts[UNCHANGED]} unchanged, {counts[FAILED]} failed.\n"
+        )
+    return counts
+
+
+def record_manifest(results, local_dir):
+    """Stores the synced state of every file that did not fail."""
+    try:
+        manifest = Manifest(local_dir)
+    except (OSError, sqlite3.Error):
+        return
+    try:
+        manifest.record_synced(path for path, (result, _) in results.items() if result != FAILED)
+    except sqlite3.Error:
+        pass
+    finally:
+        manifest.close()
+
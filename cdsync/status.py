@@ -0,0 +1,489 @@
+"""Live sync status over a local UNIX socket.
+
+A hub (hosted by the watcher service) keeps the current state and pushes
+every change to subscribers (the tray, `cdsync status --watch`). The core
+script reports run start/finish, queue changes and rclone progress with the
+`publish` and `relay` subcommands below.
+
+Protocol: newline-delimited JSON objects.
+    {"op": "subscribe"}                 -> snapshot now, then one per change
+    {"op": "get"}                       -> one snapshot, then EOF
+    {"op": "start", "mode": ..., "target": ...}
+    {"op": "progress", "files_transferred": ..., "bytes_transferred": ...}
+    {"op": "finish", "exit_code": ..., "message": ...}
+    {"op": "queue", "delta": +1 | -1}
+Run ops carry the sync pair they are about ("pair", see cdsync.pairs); the
+state has one entry per pair under "pairs", and its top-level fields
+summarize them (the most recently started run, total queue depth, ...).
+Plus ops registered by the hosting process in StatusHub.handlers
+(e.g. "ignore", see cdsync.ignore; "submit", see cdsync.scheduler;
+"poll" and "limits", see cdsync.watcher). Snapshots are sent as {"state": {...}}.
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+import socket
+import socketserver
+import sys
+import threading
+import time
+
+# Repository checkout this package lives in (same as BASE_DIR in the scripts)
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODES = ("smart", "dir-event", "periodic", "resync", "dedupe")
+
+# Sync pair of the current process (cdsync-core.sh exports it), see cdsync.pairs
+PAIR_ENV = "CDSYNC_PAIR"
+DEFAULT_PAIR = "default"
+
+
+def instance_name(base_dir=BASE_DIR):
+    """"cdsync-<folder>-<hash>", the prefix of the systemd units (see install.sh)."""
+    folder_name = os.path.basename(base_dir)
+    dir_hash = hashlib.md5(base_dir.encode()).hexdigest()[:6]
+    return f"cdsync-{folder_name}-{dir_hash}"
+
+
+def current_pair():
+    return os.environ.get(PAIR_ENV) or DEFAULT_PAIR
+
+
+def state_path(suffix, base_dir=BASE_DIR, pair=None):
+    """Per-checkout file under $XDG_STATE_HOME/cdsync/, e.g. state_path(".db").
+
+    Pairs other than the default one get their own files
+    ("<instance>@<pair><suffix>"); `pair` defaults to current_pair().
+    """
+    state_dir = os.environ.get("XDG_STATE_HOME") or os.path.expanduser("~/.local/state")
+    pair = pair or current_pair()
+    name = instance_name(base_dir) + (f"@{pair}" if pair != DEFAULT_PAIR else "")
+    return os.path.join(state_dir, "cdsync", name + suffix)
+
+
+def default_socket_path(base_dir=BASE_DIR):
+    """Per-checkout socket, named like the systemd units."""
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR") or "/tmp"
+    return os.path.join(runtime_dir, instance_name(base_dir) + ".sock")
+
+
+def pair_idle_state():
+    """State of one sync pair."""
+    return {
+        "running": False,
+        "mode": None,
+        "target": None,
+        "started_at": None,
+        "files_transferred": 0,
+        "files_total": 0,
+        "bytes_transferred": 0,
+        "bytes_total": 0,
+        "queue_depth": 0,
+        "last_result": None,
+        # Adaptive periodic bisync (see cdsync.poller)
+        "poll_interval": None,
+        "poll_reason": None,
+        "next_poll_at": None,
+    }
+
+
+def idle_state():
+    """Hub state: the pair fields summarize "pairs" (see StatusHub._summarize)."""
+    # "limits": the schedule window in force (see StatusHub.set_limits)
+    return dict(pair_idle_state(), pair=None, running_pairs=[], pairs={}, limits=None)
+
+
+# Fields that describe the daemon rather than the current run
+PERSISTENT_FIELDS = ("queue_depth", "last_result", "poll_interval", "poll_reason", "next_poll_at")
+
+
+class StatusHub:
+    """Holds the current sync state and broadcasts changes to subscribers."""
+
+    def __init__(self, path=None):
+        self.path = path or default_socket_path()
+        self.state = idle_state()
+        self.subscribers = set()
+        self.lock = threading.Lock()
+        self.server = None
+        # Extra ops served by the hosting process, e.g. {"ignore": callback}
+        self.handlers = {}
+
+    # --- State changes (usable in-process or via the socket) ---
+
+    def start_run(self, mode, target=None, pair=DEFAULT_PAIR):
+        self._apply(pair, {
+            "running": True,
+            "mode": mode,
+            "target": target,
+            "started_at": time.time(),
+            "files_transferred": 0,
+            "files_total": 0,
+            "bytes_transferred": 0,
+            "bytes_total": 0,
+        })
+
+    def progress(self, pair=DEFAULT_PAIR, **fields):
+        allowed = ("files_transferred", "files_total", "bytes_transferred", "bytes_total")
+        self._apply(pair, {k: v for k, v in fields.items() if k in allowed})
+
+    def finish_run(self, exit_code, message=None, pair=DEFAULT_PAIR):
+        with self.lock:
+            state = self._pair(pair)
+            started = state["started_at"]
+            now = time.time()
+            result = {
+                "pair": pair,
+                "mode": state["mode"],
+                "target": state["target"],
+                "exit_code": exit_code,
+                "message": message,
+                "finished_at": now,
+                "duration": round(now - started, 1) if started else None,
+                "files_transferred": state["files_transferred"],
+                "bytes_transferred": state["bytes_transferred"],
+            }
+        changes = {k: v for k, v in pair_idle_state().items() if k not in PERSISTENT_FIELDS}
+        changes["last_result"] = result
+        self._apply(pair, changes)
+
+    def adjust_queue(self, delta, pair=DEFAULT_PAIR):
+        with self.lock:
+            depth = max(0, self._pair(pair)["queue_depth"] + delta)
+        self._apply(pair, {"queue_depth": depth})
+
+    def set_poll(self, poll_interval, poll_reason, next_poll_at, pair=DEFAULT_PAIR):
+        self._apply(pair, {"poll_interval": poll_interval, "poll_reason": poll_reason,
+                           "next_poll_at": next_poll_at})
+
+    def set_queue_depths(self, depths):
+        """{pair: pending jobs}; pairs left out have none."""
+        with self.lock:
+            changed = [pair for pair in set(depths) | set(self.state["pairs"])
+                       if self._pair(pair)["queue_depth"] != depths.get(pair, 0)]
+        for pair in changed:
+            self._apply(pair, {"queue_depth": depths.get(pair, 0)})
+
+    def set_limits(self, window, bwlimit, transfers, override_until=None):
+        """Global limits of the active schedule window (see cdsync.schedule)."""
+        with self.lock:
+            self.state["limits"] = {"window": window, "bwlimit": bwlimit, "transfers": transfers,
+                                    "override_until": override_until}
+            self._broadcast()
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.state, pairs={name: dict(s) for name, s in self.state["pairs"].items()})
+
+    def _pair(self, pair):
+        # Callers hold the lock
+        return self.state["pairs"].setdefault(pair, pair_idle_state())
+
+    def _summarize(self):
+        """Top-level fields: the most recently started run, the total queue,
+        the latest result and the soonest periodic check over all pairs."""
+        pairs = self.state["pairs"]
+        running = sorted((name for name, s in pairs.items() if s["running"]),
+                         key=lambda name: pairs[name]["started_at"] or 0)
+        summary = pair_idle_state()
+        if running:
+            summary.update({k: v for k, v in pairs[running[-1]].items() if k not in PERSISTENT_FIELDS})
+        summary["queue_depth"] = sum(s["queue_depth"] for s in pairs.values())
+        results = [s["last_result"] for s in pairs.values() if s["last_result"]]
+        if results:
+            summary["last_result"] = max(results, key=lambda r: r["finished_at"])
+        polls = [s for s in pairs.values() if s["poll_interval"]]
+        if polls:
+            soonest = min(polls, key=lambda s: s["next_poll_at"] or 0)
+            summary.update({k: soonest[k] for k in ("poll_interval", "poll_reason", "next_poll_at")})
+        summary["pair"] = running[-1] if running else None
+        summary["running_pairs"] = running
+        self.state.update(summary)
+
+    def _apply(self, pair, changes):
+        with self.lock:
+            self._pair(pair).update(changes)
+            self._summarize()
+            self._broadcast()
+
+    def _broadcast(self):
+        # Callers hold the lock
+        line = (json.dumps({"state": self.state}) + "\n").encode()
+        dead = []
+        for wfile in self.subscribers:
+            try:
+                wfile.write(line)
+                wfile.flush()
+            except OSError:
+                dead.append(wfile)
+        for wfile in dead:
+            self.subscribers.discard(wfile)
+
+    def handle_message(self, msg):
+        op = msg.get("op")
+        pair = msg.get("pair") or DEFAULT_PAIR
+        if op == "start":
+            mode = msg.get("mode")
+            self.start_run(mode if mode in MODES else "periodic", msg.get("target"), pair)
+        elif op == "progress":
+            self.progress(pair, **{k: v for k, v in msg.items() if k != "pair"})
+        elif op == "finish":
+            self.finish_run(msg.get("exit_code"), msg.get("message"), pair)
+        elif op == "queue":
+            self.adjust_queue(int(msg.get("delta", 0)), pair)
+        elif op in self.handlers:
+            self.handlers[op](msg)
+
+    # --- Socket server ---
+
+    def start(self):
+        """Binds the socket and serves it from a background thread."""
+        hub = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                for raw in self.rfile:
+                    try:
+                        msg = json.loads(raw)
+                    except ValueError:
+                        continue
+                    op = msg.get("op")
+                    if op == "get":
+                        self.wfile.write((json.dumps({"state": hub.snapshot()}) + "\n").encode())
+                        return
+                    if op == "subscribe":
+                        with hub.lock:
+                            self.wfile.write((json.dumps({"state": hub.state}) + "\n").encode())
+                            hub.subscribers.add(self.wfile)
+                        continue
+                    hub.handle_message(msg)
+                with hub.lock:
+                    hub.subscribers.discard(self.wfile)
+
+        # A stale socket from a crashed watcher would make bind() fail
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self.server = socketserver.ThreadingUnixStreamServer(self.path, Handler)
+        self.server.daemon_threads = True
+        os.chmod(self.path, 0o600)
+        thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        thread.start()
+        return thread
+
+    def stop(self):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+
+
+# --- Clients ---
+
+def _connect(path, timeout=2.0):
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(timeout)
+    try:
+        sock.connect(path or default_socket_path())
+    except OSError:
+        sock.close()
+        raise
+    return sock
+
+
+def publish(msg, path=None):
+    """Sends one message to the hub. Returns False if no hub is running.
+
+    Returns only after the hub has processed it (it closes the connection
+    once our side is shut down), so successive publishes keep their order.
+    """
+    try:
+        sock = _connect(path, timeout=30.0)
+    except OSError:
+        return False
+    with sock:
+        try:
+            sock.sendall((json.dumps(msg) + "\n").encode())
+            sock.shutdown(socket.SHUT_WR)
+            while sock.recv(4096):
+                pass
+        except OSError:
+            return False
+    return True
+
+
+def get_status(path=None):
+    """Returns the current state dict, or None if no hub is running."""
+    try:
+        sock = _connect(path)
+    except OSError:
+        return None
+    with sock:
+        sock.sendall(b'{"op": "get"}\n')
+        data = sock.makefile("rb").readline()
+    try:
+        return json.loads(data)["state"]
+    except (ValueError, KeyError):
+        return None
+
+
+def subscribe(path=None):
+    """Yields state dicts as they change. Raises OSError if no hub is running."""
+    sock = _connect(path)
+    sock.settimeout(None)
+    with sock:
+        sock.sendall(b'{"op": "subscribe"}\n')
+        for raw in sock.makefile("rb"):
+            try:
+                yield json.loads(raw)["state"]
+            except (ValueError, KeyError):
+                continue
+
+
+# --- rclone progress relay ---
+
+_UNITS = {
+    "B": 1, "Bytes": 1,
+    "KiB": 1024, "kBytes": 1024, "KBytes": 1024,
+    "MiB": 1024 ** 2, "MBytes": 1024 ** 2,
+    "GiB": 1024 ** 3, "GBytes": 1024 ** 3,
+    "TiB": 1024 ** 4, "TBytes": 1024 ** 4,
+    "PiB": 1024 ** 5, "PBytes": 1024 ** 5,
+}
+
+# --stats-one-line: "  1.234 MiB / 10.000 MiB, 12%, 1.0 MiB/s, ETA 9s (xfr#3/10)"
+_STATS_RE = re.compile(
+    r"([\d.]+)\s*([KMGTP]?i?B|[kKMGTP]?Bytes)\s*/\s*([\d.]+)\s*([KMGTP]?i?B|[kKMGTP]?Bytes),\s*[-\d]+%"
+    r"(?:.*?\(xfr#(\d+)/(\d+)\))?"
+)
+
+
+def parse_size(value, unit):
+    return int(float(value) * _UNITS.get(unit, 1))
+
+
+def parse_stats_line(line):
+    """Returns progress fields from an rclone one-line stats line, or None."""
+    m = _STATS_RE.search(line)
+    if not m:
+        return None
+    fields = {
+        "bytes_transferred": parse_size(m.group(1), m.group(2)),
+        "bytes_total": parse_size(m.group(3), m.group(4)),
+    }
+    if m.group(5) is not None:
+        fields["files_transferred"] = int(m.group(5))
+        fields["files_total"] = int(m.group(6))
+    return fields
+
+
+def stats_from_json(stats):
+    """Progress fields from the "stats" object of an rclone JSON log record."""
+    fields = {
+        "bytes_transferred": int(stats.get("bytes", 0)),
+        "bytes_total": int(stats.get("totalBytes", 0)),
+    }
+    if "totalTransfers" in stats:
+        fields["files_transferred"] = int(stats.get("transfers", 0))
+        fields["files_total"] = int(stats["totalTransfers"])
+    return fields
+
+
+def parse_stats(line):
+    """Progress fields from a stats line of a text or JSON (--use-json-log) rclone log, or None."""
+    if line.startswith("{"):
+        try:
+            record = json.loads(line)
+        except ValueError:
+            record = None
+        if isinstance(record, dict):
+            if isinstance(record.get("stats"), dict):
+                return stats_from_json(record["stats"])
+            line = str(record.get("msg", ""))
+    return parse_stats_line(line)
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def relay(log_path, path=None, interval=0.5, parent=None):
+    """Follows an rclone log from its current end and publishes progress.
+
+    Runs until killed by the core script, or until `parent` (the core's PID,
+    default: our parent now) is gone. Orphans are not necessarily
+    reparented to PID 1: under systemd --user the manager is a subreaper.
+    """
+    parent = os.getppid() if parent is None else parent
+    try:
+        f = open(log_path, "r", errors="replace")
+    except OSError:
+        return
+    with f:
+        f.seek(0, os.SEEK_END)
+        last = None
+        while os.getppid() == parent and _alive(parent):
+            line = f.readline()
+            if not line:
+                time.sleep(interval)
+                continue
+            fields = parse_stats(line)
+            if fields and fields != last:
+                last = fields
+                publish(dict(fields, op="progress", pair=current_pair()), path)
+
+
+def serve(path=None):
+    hub = StatusHub(path)
+    hub.start().join()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python3 -m cdsync.status")
+    parser.add_argument("--socket", help="Socket path (default: per checkout)")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    sub.add_parser("serve", help="Run the status hub")
+
+    p_pub = sub.add_parser("publish", help="Send a state change to the hub")
+    p_pub.add_argument("event", choices=("start", "finish", "queue"))
+    p_pub.add_argument("--mode", choices=MODES)
+    p_pub.add_argument("--target")
+    p_pub.add_argument("--exit-code", type=int)
+    p_pub.add_argument("--message")
+    p_pub.add_argument("--delta", type=int, default=0)
+
+    p_relay = sub.add_parser("relay", help="Publish progress from an rclone log")
+    p_relay.add_argument("log")
+    p_relay.add_argument("--parent", type=int, help="Exit once this process (the core) is gone")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "serve":
+        serve(args.socket)
+    elif args.command == "publish":
+        msg = {"op": args.event, "pair": current_pair()}
+        if args.event == "start":
+            msg.update(mode=args.mode, target=args.target)
+        elif args.event == "finish":
+            msg.update(exit_code=args.exit_code, message=args.message)
+        else:
+            msg.update(delta=args.delta)
+        publish(msg, args.socket)
+    elif args.command == "relay":
+        relay(args.log, args.socket, parent=args.parent)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
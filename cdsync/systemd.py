@@ -0,0 +1,204 @@
+"""State and control of the tray's systemd user units.
+
+The tray follows the watcher service, the poll timer and the poll service.
+SystemdUnits talks to systemd over D-Bus: unit state arrives as
+PropertiesChanged signals (passed on to the `on_change` callback), and
+start/stop/enable/disable are asynchronous bus calls. When the bus is
+unreachable, connect_units returns SystemctlUnits, which runs `systemctl
+--user` instead and sends no change signals, so its caller has to poll.
+"""
+import os
+import subprocess
+
+from gi.repository import Gio, GLib
+
+SYSTEMD_BUS_NAME = "org.freedesktop.systemd1"
+SYSTEMD_PATH = "/org/freedesktop/systemd1"
+MANAGER_IFACE = "org.freedesktop.systemd1.Manager"
+UNIT_IFACE = "org.freedesktop.systemd1.Unit"
+PROPERTIES_IFACE = "org.freedesktop.DBus.Properties"
+
+# Same states `systemctl is-active` reports as success
+ACTIVE_STATES = ("active", "reloading")
+
+
+class SystemdUnits:
+    """Tracks and controls user units over the systemd D-Bus API.
+
+    Unit state comes from PropertiesChanged signals, so checking whether the
+    watcher is active costs nothing. Start/stop/enable/disable are issued as
+    asynchronous bus calls back to back instead of one `systemctl` fork each.
+
+    The bus defaults to the user session bus. Set CDSYNC_SYSTEMD_BUS (or pass
+    bus_address) to point at a stand-in bus that serves mock units under
+    org.freedesktop.systemd1, e.g. a private dbus-daemon for testing
+    (benchmarks/mock_systemd.py runs one with mock units).
+    """
+
+    def __init__(self, units, on_change=None, bus_address=None):
+        self.units = list(units)
+        self.on_change = on_change
+        self.states = {unit: "unknown" for unit in self.units}
+        self.paths = {}
+
+        bus_address = bus_address or os.environ.get("CDSYNC_SYSTEMD_BUS")
+        if bus_address:
+            self.bus = Gio.DBusConnection.new_for_address_sync(
+                bus_address,
+                Gio.DBusConnectionFlags.AUTHENTICATION_CLIENT
+                | Gio.DBusConnectionFlags.MESSAGE_BUS_CONNECTION,
+                None, None,
+            )
+        else:
+            self.bus = Gio.bus_get_sync(Gio.BusType.SESSION, None)
+
+        # systemd only emits unit signals to clients that subscribed
+        self._call_sync(SYSTEMD_PATH, MANAGER_IFACE, "Subscribe", None)
+
+        for unit in self.units:
+            # LoadUnit (unlike GetUnit) also works for units not loaded yet
+            reply = self._call_sync(SYSTEMD_PATH, MANAGER_IFACE, "LoadUnit",
+                                    GLib.Variant("(s)", (unit,)))
+            path = reply.unpack()[0]
+            self.paths[unit] = path
+            self.bus.signal_subscribe(
+                SYSTEMD_BUS_NAME, PROPERTIES_IFACE, "PropertiesChanged", path,
+                UNIT_IFACE, Gio.DBusSignalFlags.NONE,
+                self._on_properties_changed, unit,
+            )
+            self.states[unit] = self._get_active_state(path)
+
+    def _call_sync(self, path, iface, method, params):
+        return self.bus.call_sync(
+            SYSTEMD_BUS_NAME, path, iface, method, params,
+            None, Gio.DBusCallFlags.NONE, -1, None,
+        )
+
+    def _call(self, path, iface, method, params):
+        # Fire-and-forget: replies are only checked for errors
+        self.bus.call(
+            SYSTEMD_BUS_NAME, path, iface, method, params,
+            None, Gio.DBusCallFlags.NONE, -1, None,
+            self._on_call_done, method,
+        )
+
+    def _on_call_done(self, bus, result, method):
+        try:
+            bus.call_finish(result)
+        except GLib.Error as e:
+            print(f"systemd {method} failed: {e.message}")
+
+    def _get_active_state(self, path):
+        try:
+            reply = self._call_sync(path, PROPERTIES_IFACE, "Get",
+                                    GLib.Variant("(ss)", (UNIT_IFACE, "ActiveState")))
+            return reply.unpack()[0]
+        except GLib.Error:
+            return "unknown"
+
+    def _on_properties_changed(self, bus, sender, path, iface, signal, params, unit):
+        _, changed, invalidated = params.unpack()
+        if "ActiveState" in changed:
+            state = changed["ActiveState"]
+        elif "ActiveState" in invalidated:
+            state = self._get_active_state(path)
+        else:
+            return
+        if state != self.states.get(unit):
+            self.states[unit] = state
+            if self.on_change:
+                self.on_change(unit, state)
+
+    def is_active(self, unit):
+        return self.states.get(unit) in ACTIVE_STATES
+
+    def start(self, units):
+        for unit in units:
+            self._call(SYSTEMD_PATH, MANAGER_IFACE, "StartUnit", GLib.Variant("(ss)", (unit, "replace")))
+
+    def stop(self, units):
+        for unit in units:
+            self._call(SYSTEMD_PATH, MANAGER_IFACE, "StopUnit", GLib.Variant("(ss)", (unit, "replace")))
+
+    def restart(self, units):
+        for unit in units:
+            self._call(SYSTEMD_PATH, MANAGER_IFACE, "RestartUnit", GLib.Variant("(ss)", (unit, "replace")))
+
+    def enable(self, units):
+        # One call for all unit files (runtime=False, force=True), then reload
+        # like `systemctl enable` does
+        self._call(SYSTEMD_PATH, MANAGER_IFACE, "EnableUnitFiles",
+                   GLib.Variant("(asbb)", (list(units), False, True)))
+        self.reload()
+
+    def disable(self, units):
+        self._call(SYSTEMD_PATH, MANAGER_IFACE, "DisableUnitFiles",
+                   GLib.Variant("(asb)", (list(units), False)))
+        self.reload()
+
+    def reload(self):
+        """Equivalent of `systemctl --user daemon-reload`."""
+        self._call(SYSTEMD_PATH, MANAGER_IFACE, "Reload", None)
+
+    def enable_and_start(self, units):
+        self.enable(units)
+        self.start(units)
+
+    def stop_and_disable(self, units):
+        self.stop(units)
+        self.disable(units)
+
+
+class SystemctlUnits:
+    """Fallback when the systemd bus is unreachable: batched `systemctl` calls."""
+
+    def __init__(self, units, on_change=None):
+        self.units = list(units)
+
+    def _systemctl(self, *args):
+        subprocess.run(["systemctl", "--user", *args])
+
+    def is_active(self, unit):
+        try:
+            result = subprocess.run(
+                ["systemctl", "--user", "is-active", unit],
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                text=True
+            )
+            return result.returncode == 0
+        except Exception:
+            return False
+
+    def start(self, units):
+        self._systemctl("start", *units)
+
+    def stop(self, units):
+        self._systemctl("stop", *units)
+
+    def restart(self, units):
+        self._systemctl("restart", *units)
+
+    def enable(self, units):
+        self._systemctl("enable", *units)
+
+    def disable(self, units):
+        self._systemctl("disable", *units)
+
+    def reload(self):
+        self._systemctl("daemon-reload")
+
+    def enable_and_start(self, units):
+        self._systemctl("enable", "--now", *units)
+
+    def stop_and_disable(self, units):
+        self._systemctl("disable", "--now", *units)
+
+
+def connect_units(units, on_change=None):
+    """Returns a D-Bus backed unit controller, or the systemctl fallback."""
+    try:
+        return SystemdUnits(units, on_change)
+    except GLib.Error as e:
+        print(f"systemd D-Bus unavailable ({e.message}), falling back to systemctl")
+        return SystemctlUnits(units, on_change)
@@ -0,0 +1,268 @@
+"""Auto-tuned rclone transfers, checkers and chunk size.
+
+After each run, the single pass over its rclone log (cdsync/rclonelog.py)
+measures it (files transferred, size histogram, throughput, API
+rate-limit errors and retries) and picks the settings for the next run of
+the same profile:
+
+    "bisync"  periodic / directory-event / resync runs
+    "upload"  batch smart syncs and scoped directory uploads
+
+- API rate limiting: transfers back off by a quarter.
+- Mostly small files: transfers grow (per-file latency dominates), unless
+  the last increase made throughput drop, in which case it is undone.
+- Mostly large files: transfers shrink and the upload chunk size grows.
+Checkers follow at twice the transfers. Every value stays within the bounds
+in config.env (TUNE_*), and each decision is written to the CDSync log.
+With AUTO_TUNE=false the fixed defaults are used.
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import time
+
+from cdsync.config import Config, atomic_write
+from cdsync.logparse import COPIED, RCLONE, UPDATED
+from cdsync.status import BASE_DIR, state_path
+
+MiB = 1024 * 1024
+
+DEFAULTS = {
+    "bisync": {"transfers": 8, "checkers": 16, "chunk_mib": 8},
+    "upload": {"transfers": 8, "checkers": 8, "chunk_mib": 8},
+}
+
+DEFAULT_BOUNDS = {
+    "TUNE_TRANSFERS_MIN": 2,
+    "TUNE_TRANSFERS_MAX": 32,
+    "TUNE_CHECKERS_MIN": 4,
+    "TUNE_CHECKERS_MAX": 64,
+    "TUNE_CHUNK_MAX_MIB": 256,
+    # Upload buffers: chunk size x transfers stays below this
+    "TUNE_MEMORY_MIB": 1024,
+}
+
+# Size histogram buckets (upper bounds)
+BUCKETS = (("<1M", MiB), ("1M-64M", 64 * MiB), ("64M-1G", 1024 * MiB), (">1G", None))
+
+SMALL_SHARE = 0.5        # "mostly small": at least half the files below 1 MiB
+LARGE_SHARE = 0.5        # "mostly large": at least half the bytes in files >= 64 MiB
+THROUGHPUT_DROP = 0.8    # an increase that lost 20% throughput is undone
+HISTORY = 20             # runs kept per profile
+
+_RATE_LIMIT_RE = re.compile(
+    r"rateLimitExceeded|userRateLimitExceeded|Too Many Requests|\b429\b|Rate exceeded", re.IGNORECASE
+)
+_RETRY_RE = re.compile(r"low level retry|Attempt \d+/\d+ failed|pacer: ", re.IGNORECASE)
+# Substrings (lowercase) one of the two patterns above needs; cheaper to test first
+_ERROR_MARKERS = ("rate", "429", "too many", "retry", "attempt", "pacer")
+
+
+def load_bounds(config):
+    bounds = {}
+    for name, default in DEFAULT_BOUNDS.items():
+        try:
+            bounds[name] = int(config.get(name, default))
+        except (TypeError, ValueError):
+            bounds[name] = default
+    return bounds
+
+
+def _clamp(value, low, high):
+    return max(low, min(high, value))
+
+
+class RunMeter:
+    """Measures one run from its rclone log (and the local files it moved), a line at a time."""
+
+    def __init__(self, local_dir):
+        self.local_dir = local_dir
+        self.files = 0
+        self.sizes = 0
+        self.histogram = {name: 0 for name, _ in BUCKETS}
+        self.large_bytes = 0
+        self.rate_limited = 0
+        self.retries = 0
+        self.stats_bytes = None
+        self.seen = set()
+
+    def add(self, line, event=None, stats=None, check_errors=True):
+        """One log line, with its ActivityEvent and stats fields when it has them.
+
+        `check_errors=False` skips the rate-limit/retry patterns, for lines
+        known not to be errors (INFO records of a JSON log).
+        """
+        if event is not None and event.source == RCLONE and event.action in (COPIED, UPDATED):
+            if event.path in self.seen:
+                return
+            self.seen.add(event.path)
+            self.files += 1
+            try:
+                size = os.path.getsize(os.path.join(self.local_dir, event.path))
+            except OSError:
+                return
+            self.sizes += size
+            if size >= 64 * MiB:
+                self.large_bytes += size
+            for name, limit in BUCKETS:
+                if limit is None or size < limit:
+                    self.histogram[name] += 1
+                    break
+            return
+        if check_errors and any(marker in line.lower() for marker in _ERROR_MARKERS):
+            if _RATE_LIMIT_RE.search(line):
+                self.rate_limited += 1
+            elif _RETRY_RE.search(line):
+                self.retries += 1
+        if stats:
+            self.stats_bytes = stats["bytes_transferred"]
+
+    def result(self, duration):
+        transferred = self.stats_bytes if self.stats_bytes is not None else self.sizes
+        return {
+            "finished_at": time.time(),
+            "duration": round(duration, 1),
+            "files": self.files,
+            "bytes": transferred,
+            "throughput": round(transferred / duration) if duration > 0 else 0,
+            "histogram": self.histogram,
+            "large_share": round(self.large_bytes / self.sizes, 2) if self.sizes else 0,
+            "rate_limited": self.rate_limited,
+            "retries": self.retries,
+        }
+
+
+def choose(current, stats, previous, bounds):
+    """Returns (settings, reason) for the next run."""
+    transfers = current["transfers"]
+    chunk = current["chunk_mib"]
+    # Lowest transfers value that already cost throughput: not tried again
+    ceiling = current.get("ceiling")
+    reason = "unchanged (run too small to judge)"
+    small_share = stats["histogram"]["<1M"] / stats["files"] if stats["files"] else 0
+
+    if stats["rate_limited"]:
+        transfers = int(transfers * 0.75)
+        reason = f"API rate limiting ({stats['rate_limited']} errors)"
+    elif stats["files"] >= 2 * transfers:
+        raised_last = previous is not None and previous.get("transfers", transfers) < transfers
+        if raised_last and stats["throughput"] < THROUGHPUT_DROP * previous.get("throughput", 0):
+            ceiling = transfers
+            transfers = previous["transfers"]
+            reason = "throughput dropped after raising transfers"
+        elif small_share >= SMALL_SHARE and (ceiling is None or transfers + 2 < ceiling):
+            transfers += 2
+            reason = f"mostly small files ({small_share:.0%} below 1 MiB)"
+        elif stats["large_share"] >= LARGE_SHARE:
+            transfers -= 1
+            reason = f"mostly large files ({stats['large_share']:.0%} of bytes in files >= 64 MiB)"
+    elif stats["files"] and stats["large_share"] >= LARGE_SHARE:
+        reason = f"large files ({stats['large_share']:.0%} of bytes in files >= 64 MiB)"
+
+    # Chunk size: big enough to keep large uploads streaming
+    if stats["files"]:
+        largest = next((name for name, _ in reversed(BUCKETS) if stats["histogram"][name]), "<1M")
+        chunk = {"<1M": 8, "1M-64M": 8, "64M-1G": 64, ">1G": 256}[largest]
+
+    transfers = _clamp(transfers, bounds["TUNE_TRANSFERS_MIN"], bounds["TUNE_TRANSFERS_MAX"])
+    checkers = _clamp(2 * transfers, bounds["TUNE_CHECKERS_MIN"], bounds["TUNE_CHECKERS_MAX"])
+    chunk = min(chunk, bounds["TUNE_CHUNK_MAX_MIB"])
+    # Each transfer buffers one chunk
+    while chunk > 8 and chunk * transfers > bounds["TUNE_MEMORY_MIB"]:
+        chunk //= 2
+    settings = {"transfers": transfers, "checkers": checkers, "chunk_mib": chunk}
+    if ceiling is not None:
+        settings["ceiling"] = ceiling
+    return settings, reason
+
+
+class Tuner:
+    def __init__(self, base_dir=BASE_DIR, path=None):
+        self.config = Config(os.path.join(base_dir, "config.env"))
+        self.path = path or state_path("-tuning.json", base_dir)
+        try:
+            with open(self.path) as f:
+                self.state = json.load(f)
+        except (OSError, ValueError):
+            self.state = {}
+
+    @property
+    def enabled(self):
+        return self.config.get("AUTO_TUNE", "true") == "true"
+
+    def settings(self, profile):
+        defaults = dict(DEFAULTS[profile])
+        if profile == "upload":
+            try:
+                defaults["transfers"] = int(self.config.get("SMART_SYNC_TRANSFERS", defaults["transfers"]))
+            except ValueError:
+                pass
+        if not self.enabled:
+            return defaults
+        return self.state.get(profile, {}).get("settings", defaults)
+
+    def flags(self, profile, max_transfers=None):
+        """rclone flags; `max_transfers` caps them to the run's share of MAX_TRANSFERS."""
+        s = self.settings(profile)
+        transfers, checkers = s["transfers"], s["checkers"]
+        if max_transfers:
+            transfers = min(transfers, max_transfers)
+            checkers = min(checkers, 2 * max_transfers)
+        return [
+            "--transfers", str(transfers),
+            "--checkers", str(checkers),
+            "--drive-chunk-size", f"{s['chunk_mib']}M",
+        ]
+
+    def record(self, profile, stats):
+        """Stores the run and picks the next settings. Returns (old, new, reason)."""
+        entry = self.state.setdefault(profile, {})
+        current = self.settings(profile)
+        history = entry.setdefault("history", [])
+        previous = history[-1] if history else None
+        if self.enabled:
+            new, reason = choose(current, stats, previous, load_bounds(self.config))
+        else:
+            new, reason = current, "auto-tune disabled"
+        history.append(dict(stats, **current))
+        del history[:-HISTORY]
+        entry["settings"] = new
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        atomic_write(self.path, json.dumps(self.state, indent=1))
+        return current, new, reason
+
+
+def describe(profile, old, new, reason, stats):
+    changes = []
+    for key, unit in (("transfers", ""), ("checkers", ""), ("chunk_mib", "M")):
+        label = "chunk" if key == "chunk_mib" else key
+        if old[key] != new[key]:
+            changes.append(f"{label} {old[key]}{unit} → {new[key]}{unit}")
+        else:
+            changes.append(f"{label} {new[key]}{unit}")
+    rate = stats["throughput"] / MiB
+    return (
+        f"INFO: 🎛️ Auto-tune ({profile}): {', '.join(changes)} — {reason}. "
+        f"Last run: {stats['files']} files, {rate:.1f} MiB/s, "
+        f"{stats['rate_limited']} rate-limit errors, {stats['retries']} retries."
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python3 -m cdsync.tuning")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_flags = sub.add_parser("flags", help="Print the rclone flags for the next run")
+    p_flags.add_argument("profile", choices=DEFAULTS)
+    p_flags.add_argument("--max-transfers", type=int, help="Cap (this run's share of MAX_TRANSFERS)")
+    args = parser.parse_args(argv)
+
+    tuner = Tuner()
+    if args.command == "flags":
+        print(" ".join(tuner.flags(args.profile, args.max_transfers)))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,662 @@
+"""CDSync watcher daemon.
+
+Reads inotify directly, coalesces events per path in memory and queues each
+batch as a cdsync-core.sh job (see cdsync.scheduler). Also hosts the status
+hub (see cdsync.status).
+Serves every configured sync pair (see cdsync.pairs) from one inotify
+instance, one scheduler and one rclone rcd; batches, manifests and poll
+intervals are kept per pair. The global bandwidth and transfer limits
+follow the weekly schedule (see cdsync.schedule). Large files still being
+written are held back until they settle (see cdsync.settle).
+Started by cdsync-watcher.sh with config.env exported into the environment.
+"""
+import collections
+import os
+import selectors
+import signal
+import sqlite3
+import subprocess
+import sys
+import time
+
+from cdsync.dirsync import plan_directory_sync
+from cdsync.ignore import DEFAULT_TTL, SmartIgnore
+from cdsync.inotify import IN_MOVED_FROM, IN_MOVED_TO, IN_Q_OVERFLOW, RecursiveWatch
+from cdsync.manifest import Manifest
+from cdsync.pairs import load_pairs
+from cdsync.poller import AdaptivePoller
+from cdsync.rcd import RcdServer
+from cdsync.schedule import OVERRIDE_MINUTES, Schedule, default_rc_dir, load_schedule, set_bwlimit
+from cdsync.scheduler import FULL_BISYNC, MAX_RUNNING, Budget, Job, Scheduler
+from cdsync.settle import WriteSettle, load_settle
+from cdsync.status import BASE_DIR, DEFAULT_PAIR, StatusHub
+
+# Events are accumulated for this long before a batch is dispatched
+BATCH_WINDOW = 5
+# Minimum delay between restarts of a crashed rclone rcd
+RCD_RESTART_DELAY = 60
+# How often the schedule is checked and running rclone processes are
+# brought to its bandwidth limit
+SCHEDULE_CHECK = 15
+
+
+class EventBatch:
+    """Events of one window, coalesced per path (insertion ordered)."""
+
+    def __init__(self):
+        self.paths = {}  # path -> set of event names
+        self.dirs = {}   # directory path -> set of event names
+        self.moves = {}  # inotify cookie -> [from path, to path], in event order
+        self.overflow = False
+
+    def add(self, event):
+        if event.mask & IN_Q_OVERFLOW:
+            # Events were lost: only a full bisync is safe
+            self.overflow = True
+        elif event.is_dir:
+            self.dirs.setdefault(event.path, set()).add(event.name)
+        if event.cookie and event.mask & (IN_MOVED_FROM | IN_MOVED_TO):
+            self.moves.setdefault(event.cookie, [None, None])[bool(event.mask & IN_MOVED_TO)] = event.path
+        self.paths.setdefault(event.path, set()).add(event.name)
+
+    def take_moves(self, can_move):
+        """Removes the renames made within the batch and returns them as [(from, to)].
+
+        Both ends must be in the batch (a move into or out of the tree stays
+        an upload or a deletion), the source must not have been written in
+        this window (its remote copy would be stale anyway), the destination
+        must still exist, and `can_move(src, dst)` must agree. Chains
+        (a -> b -> c) become one move; paths written under a moved directory
+        before it moved are carried over to its new place.
+        """
+        moves = []
+        via = {}  # chain end -> paths it passed through
+        for src, dst in self.moves.values():
+            if src is None or dst is None or self.paths.get(src, set()) & {"create", "close_write"}:
+                continue
+            chained = next((m for m in moves if m[1] == src), None)
+            if chained is not None:
+                via.setdefault(dst, via.pop(src, [])).append(src)
+                chained[1] = dst
+            else:
+                moves.append([src, dst])
+        self.moves = {}
+        taken = []
+        for src, dst in moves:
+            if src == dst or not os.path.lexists(dst) or os.path.lexists(src) or not can_move(src, dst):
+                continue
+            for path in [src, dst] + via.get(dst, []):
+                self.dirs.pop(path, None)
+                names = self.paths.pop(path, set()) - {"moved_from", "moved_to"}
+                if path == dst and names:
+                    self.paths[dst] = names  # Written after the move
+            for table in (self.paths, self.dirs):
+                for path in [p for p in table if p.startswith(src + "/")]:
+                    table.setdefault(dst + path[len(src):], set()).update(table.pop(path))
+            taken.append((src, dst))
+        return taken
+
+    @property
+    def has_dir_event(self):
+        return self.overflow or bool(self.dirs)
+
+    def __bool__(self):
+        return bool(self.paths)
+
+    def __len__(self):
+        return len(self.paths)
+
+
+class PairState:
+    """What the watcher tracks for one sync pair."""
+
+    def __init__(self, pair, poller=None, settle=None):
+        self.pair = pair
+        self.name = pair.name
+        self.local_dir = pair.local_dir
+        # Periodic full bisync on an adaptive interval (see cdsync.poller)
+        self.poller = poller
+        self.batch = EventBatch()
+        self.deadline = None
+        # Files held back until they stop being written (see cdsync.settle)
+        self.settle = settle if settle is not None else WriteSettle()
+        self.remote_changes = 0
+        try:
+            self.manifest = Manifest(self.local_dir, pair=self.name)
+        except (OSError, sqlite3.Error) as e:
+            print(f"WARNING: Manifest unavailable for {self.name} ({e}). Offline changes are left to the timer.")
+            self.manifest = None
+
+    def update_manifest(self, method, paths):
+        if self.manifest is None or not paths:
+            return
+        try:
+            getattr(self.manifest, method)(paths)
+        except sqlite3.Error as e:
+            print(f"WARNING: Manifest update failed: {e}")
+
+    def close(self):
+        if self.manifest is not None:
+            self.manifest.close()
+
+
+class JobLimit:
+    """The rc socket of one core run and the bandwidth its rclone process has.
+
+    Each rclone process of the run binds the socket anew (cdsync-core.sh,
+    rc_flags) and starts with the run's initial share; a changed socket
+    inode means a new process.
+    """
+
+    def __init__(self, socket_path, bwlimit):
+        self.socket_path = socket_path
+        self.initial = bwlimit
+        self.process = None  # (st_ino, st_mtime_ns) of the socket
+        self.bwlimit = bwlimit
+
+    def apply(self, rate):
+        try:
+            st = os.stat(self.socket_path)
+        except OSError:
+            return  # Between rclone processes
+        process = (st.st_ino, st.st_mtime_ns)
+        if process != self.process:
+            self.process, self.bwlimit = process, self.initial
+        if self.bwlimit != rate and set_bwlimit(self.socket_path, rate):
+            print(f"Limits: bandwidth of running rclone set to {rate or 'off'}")
+            self.bwlimit = rate
+
+    def remove(self):
+        try:
+            os.unlink(self.socket_path)
+        except OSError:
+            pass
+
+
+class Watcher:
+    def __init__(self, pairs, base_dir=BASE_DIR, window=BATCH_WINDOW, ignore_ttl=DEFAULT_TTL, rcd=None,
+                 pollers=None, max_running=MAX_RUNNING, budget=None, schedule=None, settle=None):
+        pollers = pollers or {}
+        # settle: () -> WriteSettle, one per pair
+        settle = settle or WriteSettle
+        self.pairs = {pair.name: PairState(pair, pollers.get(pair.name), settle()) for pair in pairs}
+        self.core_script = os.path.join(base_dir, "cdsync-core.sh")
+        self.window = window
+        self.hub = StatusHub()
+        # Every core run goes through the scheduler: by priority, one per pair
+        self.scheduler = Scheduler(
+            self.start_job, self.hub, max_running=max_running,
+            on_start=self.on_job_start, on_finish=self.on_job_finish,
+            budget=budget, priorities={pair.name: pair.priority for pair in pairs},
+        )
+        self.hub.handlers["submit"] = self.on_submit
+        # Smart Ignore entries arrive from cdsync-core.sh over the hub socket
+        # (absolute paths: one list serves every pair)
+        self.ignore = SmartIgnore(ttl=ignore_ttl)
+        self.hub.handlers["ignore"] = self.on_ignore
+        self.hub.handlers["poll"] = self.on_poll_settings
+        # (handler, message) from hub threads, run by the watcher loop: pair
+        # and poller state is only touched from there
+        self.deferred = collections.deque()
+        # Long-lived rclone backend (SYNC_ENGINE=rcd), see cdsync.rcd
+        self.rcd = rcd
+        self.rcd_started_at = 0
+        # Weekly limits; running rclone processes are reached through the rc
+        # socket each core run gets: {job seq: JobLimit}
+        self.schedule = schedule or Schedule([])
+        self.limits = None  # active window and override end: (Window, until)
+        self.limits_checked_at = 0
+        self.rc_dir = default_rc_dir(base_dir)
+        self.job_limits = {}
+        self.hub.handlers["limits"] = self.on_limits
+
+    def pair_for_path(self, path):
+        for state in self.pairs.values():
+            if state.pair.contains(path):
+                return state
+        return None
+
+    def start_job(self, job, share):
+        """Starts a scheduled cdsync-core.sh run without a shell."""
+        args, stdin_lines = job.core_args()
+        # Marks the run as started by the scheduler (no re-submission); the
+        # pair and its share of the global limits are passed along
+        env = dict(os.environ, CDSYNC_SCHEDULED="1", CDSYNC_PAIR=job.pair)
+        env.pop("CDSYNC_MAX_TRANSFERS", None)
+        env.pop("CDSYNC_BWLIMIT", None)
+        if share["transfers"]:
+            env["CDSYNC_MAX_TRANSFERS"] = str(share["transfers"])
+        # "off" rather than nothing: the core would fall back to BWLIMIT
+        env["CDSYNC_BWLIMIT"] = share["bwlimit"] or "off"
+        limit = JobLimit(os.path.join(self.rc_dir, f"job-{job.seq}.sock"), share["bwlimit"])
+        env["CDSYNC_RC_SOCKET"] = limit.socket_path
+        self.job_limits[job.seq] = limit
+        return self.run_core(*args, stdin_lines=stdin_lines, env=env)
+
+    def run_core(self, *args, stdin_lines=None, env=None):
+        """Starts a cdsync-core.sh run without a shell."""
+        if stdin_lines is None:
+            return subprocess.Popen(["/bin/bash", self.core_script, *args], env=env)
+        proc = subprocess.Popen(["/bin/bash", self.core_script, *args], stdin=subprocess.PIPE, env=env)
+        # The core reads the whole list before taking the lock
+        try:
+            proc.stdin.write("".join(line + "\n" for line in stdin_lines).encode())
+            proc.stdin.close()
+        except BrokenPipeError:
+            pass
+        return proc
+
+    # --- Periodic bisync ---
+
+    def on_submit(self, msg):
+        """Hub "submit" handler.
+
+        Submissions naming no pair go to every pair (periodic, Sync Now), to
+        the pair holding the path (smart sync) or to the default pair. The
+        poll timer's runs wait for each pair's adaptive interval.
+        """
+        kind = msg.get("kind")
+        name = msg.get("pair")
+        if name:
+            targets = [self.pairs[name]] if name in self.pairs else []
+        elif kind in ("periodic", "sync-now"):
+            targets = list(self.pairs.values())
+        elif msg.get("paths"):
+            targets = [self.pair_for_path(msg["paths"][0])]
+        else:
+            targets = [self.pairs.get(DEFAULT_PAIR)]
+        targets = [state for state in targets if state is not None]
+        if not targets:
+            print(f"Scheduler: rejected submission: no sync pair for {name or msg.get('paths') or kind}")
+        for state in targets:
+            if kind == "periodic" and state.poller is not None and not state.poller.due():
+                continue
+            self.scheduler.handle_message(dict(msg, pair=state.name))
+
+    def defer(self, handler, msg):
+        """Runs handler(msg) on the watcher loop (called from hub threads)."""
+        self.deferred.append((handler, msg))
+        self.scheduler.wake()
+
+    def run_deferred(self):
+        while self.deferred:
+            handler, msg = self.deferred.popleft()
+            handler(msg)
+
+    def on_ignore(self, msg):
+        # SmartIgnore is locked: entries apply at once, before the run's events
+        self.ignore.handle_message(msg)
+        self.defer(self.count_remote_changes, msg)
+
+    def count_remote_changes(self, msg):
+        # Entries are what rclone changed locally: remote-originated changes
+        for path, _, _ in msg.get("entries", []):
+            state = self.pair_for_path(path)
+            if state is not None:
+                state.remote_changes += 1
+
+    def on_poll_settings(self, msg):
+        """Hub "poll" handler: {"op": "poll", "interval": seconds[, "pair": name]} (tray's Set Interval).
+
+        Without a pair, applies to the pairs that follow POLL_INTERVAL.
+        """
+        self.defer(self.apply_poll_settings, msg)
+
+    def apply_poll_settings(self, msg):
+        name = msg.get("pair")
+        try:
+            interval = float(msg["interval"])
+        except (KeyError, TypeError, ValueError):
+            return
+        for state in self.pairs.values():
+            if state.poller is None or (name and state.name != name):
+                continue
+            if not name and state.pair.poll_interval is not None:
+                continue  # Has its own PAIR_<name>_POLL_INTERVAL
+            poller = state.poller
+            poller.base = poller.interval = interval
+            poller.minimum = min(poller.minimum, poller.base)
+            poller.maximum = max(poller.maximum, poller.base)
+            poller.reason = "interval changed"
+            self.publish_poll(state)
+
+    def on_job_start(self, job):
+        state = self.pairs.get(job.pair)
+        if state is not None and job.kind in FULL_BISYNC + ("resync",):
+            state.remote_changes = 0
+            if state.poller is not None:
+                state.poller.started()
+                self.publish_poll(state)
+
+    def on_job_finish(self, job, exit_code):
+        limit = self.job_limits.pop(job.seq, None)
+        if limit is not None:
+            limit.remove()
+        state = self.pairs.get(job.pair)
+        if state is None or state.poller is None:
+            return
+        if job.kind in FULL_BISYNC and exit_code == 0:
+            state.poller.record_run(state.remote_changes)
+            state.poller.started()
+            print(f"Poll interval ({state.name}): {state.poller.interval / 60:.1f} min ({state.poller.reason})")
+            self.publish_poll(state)
+
+    def schedule_periodic(self, state):
+        if state.poller is None or not state.poller.due():
+            return
+        if self.scheduler.is_running(state.name) or self.scheduler.has_pending(FULL_BISYNC, state.name):
+            return  # Counted from when that bisync starts
+        self.scheduler.submit(Job("periodic", pair=state.name))
+        state.poller.started()
+
+    def publish_poll(self, state):
+        self.hub.set_poll(**state.poller.describe(), pair=state.name)
+
+    # --- Bandwidth schedule ---
+
+    def on_limits(self, msg):
+        """Hub "limits" handler: {"op": "limits", "window": name | "unlimited" | None, "minutes": n}.
+
+        Forces a window for a while (tray, `cdsync schedule`); None resumes the schedule.
+        """
+        try:
+            minutes = float(msg.get("minutes") or OVERRIDE_MINUTES)
+        except (TypeError, ValueError):
+            return
+        if not self.schedule.set_override(msg.get("window"), minutes):
+            print(f"Limits: unknown schedule window {msg.get('window')!r}")
+            return
+        # Applied by the watcher loop
+        self.limits_checked_at = 0
+        self.scheduler.wake()
+
+    def check_schedule(self):
+        if time.monotonic() - self.limits_checked_at < SCHEDULE_CHECK:
+            return
+        self.limits_checked_at = time.monotonic()
+        window = self.schedule.active()
+        override_until = self.schedule.override_until()
+        if self.limits != (window, override_until):
+            self.limits = (window, override_until)
+            # New runs get their share of the window's limits
+            self.scheduler.budget.set(window.transfers, window.bwlimit)
+            self.hub.set_limits(window.name, window.bwlimit, window.transfers, override_until)
+            print(f"Limits: {window.describe()}")
+        self.apply_bwlimit()
+
+    def apply_bwlimit(self):
+        """Brings running rclone processes to the current bandwidth share, in flight."""
+        rate = self.scheduler.budget.share()["bwlimit"]
+        if self.rcd is not None and self.rcd.bwlimit != rate:
+            # Also used when the rcd is restarted
+            self.rcd.bwlimit = rate
+            if self.rcd.alive():
+                set_bwlimit(self.rcd.socket_path, rate)
+        for job in self.scheduler.running_jobs():
+            limit = self.job_limits.get(job.seq)
+            if limit is not None:
+                limit.apply(rate)
+
+    def check_rcd(self):
+        if self.rcd is None:
+            return
+        if not self.rcd.alive() and time.monotonic() - self.rcd_started_at >= RCD_RESTART_DELAY:
+            print("WARNING: rclone rcd is not running. Restarting it...")
+            self.start_rcd()
+        elif not self.scheduler.is_running() and not self.hub.snapshot()["running"]:
+            self.rcd.trim_log()
+
+    def start_rcd(self):
+        self.rcd_started_at = time.monotonic()
+        if self.rcd.start():
+            print(f"rclone rcd backend ready: {self.rcd.socket_path}")
+        else:
+            # cdsync-core.sh falls back to one rclone process per operation
+            print("WARNING: rclone rcd failed to start. Using the rclone CLI.")
+
+    def sync_running(self, state):
+        # The hub also sees runs started outside the scheduler (manual runs)
+        if self.scheduler.is_running(state.name):
+            return True
+        return self.hub.snapshot()["pairs"].get(state.name, {}).get("running", False)
+
+    def dispatch(self, state, batch):
+        self.ignore.expire()
+        label = f" [{state.name}]" if state.name != DEFAULT_PAIR else ""
+        print(f"--- Processing Batch{label} ({len(batch)} paths) ---")
+
+        self.submit_moves(state, batch.take_moves(self.can_move))
+        if not batch:
+            return
+
+        plan = None
+        if batch.has_dir_event:
+            if not batch.overflow:
+                plan = plan_directory_sync(batch.dirs, state.local_dir)
+            if plan is None:
+                print("📂 Directory Change Detected in Batch. Triggering FULL BISYNC.")
+                # Overflow or a change at the sync root: bisync scans all.
+                self.scheduler.submit(Job("bisync", pair=state.name))
+                return
+            lines = plan.lines(state.local_dir)
+            state.update_manifest("mark_dirty", plan.copy_roots + plan.purge_roots)
+            print(f"📂 Directory Change Detected in Batch. Triggering Scoped Sync ({len(plan)} subtrees).")
+            for line in lines:
+                print(f" -> {line}")
+            self.scheduler.submit(Job("dir-sync", lines=lines, pair=state.name))
+        else:
+            print("📄 File-Only Batch. Triggering one Batch Sync...")
+
+        paths = []
+        ignored = []
+        for path in sorted(batch.paths):
+            if path in batch.dirs or (plan is not None and plan.covers(path)):
+                continue  # Handled by the scoped directory sync
+            if self.ignore.match(path):
+                print(f" -> Ignored (Smart List): {path}")
+                ignored.append(path)
+                continue
+            if "\n" in path:
+                print(f" -> Skipped (newline in name, left to the timer): {path!r}")
+                continue
+            if not state.settle.check(path, batch.paths[path]):
+                print(f" -> Held until written (settling): {path}")
+                continue
+            print(f" -> Syncing File: {path}")
+            paths.append(path)
+
+        # Downloads left by rclone are in sync by definition
+        state.update_manifest("record_synced", ignored)
+        self.submit_files(state, paths)
+
+    def can_move(self, src, dst):
+        # Renames rclone made locally need no remote move; the core reads
+        # "from<TAB>to" lines
+        return not self.ignore.match(dst) and "\t" not in src + dst and "\n" not in src + dst
+
+    def submit_moves(self, state, moves):
+        """Queues renames as server-side moves (cdsync-core.sh --moves)."""
+        if not moves:
+            return
+        prefix = state.local_dir + "/"
+        lines = []
+        for src, dst in moves:
+            print(f"🔀 Move: {src} -> {dst}")
+            lines.append(f"{src[len(prefix):]}\t{dst[len(prefix):]}")
+        state.update_manifest("mark_dirty", [path for move in moves for path in move])
+        self.scheduler.submit(Job("move", lines=lines, pair=state.name))
+
+    def submit_files(self, state, paths):
+        if not paths:
+            return
+        state.update_manifest("mark_dirty", paths)
+        self.scheduler.submit(Job("files", paths=paths, pair=state.name))
+        if state.poller is not None and state.poller.user_activity():
+            print(f"Poll interval ({state.name}): {state.poller.interval / 60:.1f} min ({state.poller.reason})")
+            self.publish_poll(state)
+
+    def release_settled(self, state):
+        """Submits the held files that stopped changing."""
+        paths = state.settle.due()
+        for path in paths:
+            print(f" -> Settled, syncing file: {path}")
+        self.submit_files(state, paths)
+
+    def catch_up(self, state):
+        """Uploads changes made while the watcher was not running.
+
+        Only directories that are dirty or whose mtime changed are listed
+        (see cdsync.manifest). The first start just records the tree.
+        """
+        if state.manifest is None:
+            return
+        try:
+            if state.manifest.is_empty():
+                print(f"Manifest ({state.name}): recording the current tree (first start)...")
+                state.manifest.baseline()
+                return
+            changed = state.manifest.scan()
+        except (OSError, sqlite3.Error) as e:
+            print(f"WARNING: Manifest scan failed: {e}")
+            return
+        paths = [os.path.join(state.local_dir, rel) for rel in changed if "\n" not in rel]
+        if paths:
+            print(f"📄 {len(paths)} files changed while stopped. Triggering one Batch Sync...")
+            state.update_manifest("mark_dirty", paths)
+            self.scheduler.submit(Job("files", paths=paths, pair=state.name))
+
+    def run(self):
+        states = list(self.pairs.values())
+        # One inotify instance for every pair
+        watch = RecursiveWatch([state.local_dir for state in states])
+        self.hub.start()
+        for state in states:
+            if state.poller is not None:
+                self.publish_poll(state)
+        os.makedirs(self.rc_dir, mode=0o700, exist_ok=True)
+        self.check_schedule()
+        if self.rcd is not None:
+            self.start_rcd()
+        print(f"Monitored Directories: {len(watch.wds)} directories in {len(states)} sync pairs")
+        for state in states:
+            print(f" -> {state.name}: {state.local_dir}")
+            self.catch_up(state)
+
+        selector = selectors.DefaultSelector()
+        selector.register(watch, selectors.EVENT_READ)
+        selector.register(self.scheduler, selectors.EVENT_READ)
+
+        try:
+            while True:
+                # Wake up at least every window (every second while a job
+                # runs) to reap finished syncs and start the next job
+                timeout = 1 if self.scheduler.running else min(self.window, SCHEDULE_CHECK)
+                for state in states:
+                    if state.deadline is not None:
+                        timeout = min(timeout, max(0, state.deadline - time.monotonic()))
+                    if state.poller is not None:
+                        timeout = min(timeout, max(0, state.poller.next_due() - time.monotonic()))
+                    if state.settle.next_due() is not None:
+                        timeout = min(timeout, max(0, state.settle.next_due() - time.monotonic()))
+
+                for key, _ in selector.select(timeout):
+                    if key.fileobj is watch:
+                        for event in watch.read_events():
+                            state = self.pair_for_path(event.path)
+                            if state is not None:
+                                state.batch.add(event)
+                self.run_deferred()
+
+                for state in states:
+                    if state.batch and state.deadline is None:
+                        state.deadline = time.monotonic() + self.window
+                    # While a sync of the pair runs, keep accumulating: its
+                    # Smart Ignore entries are only known once it finishes
+                    if state.deadline is not None and time.monotonic() >= state.deadline \
+                            and not self.sync_running(state):
+                        batch, state.batch, state.deadline = state.batch, EventBatch(), None
+                        self.dispatch(state, batch)
+                    self.release_settled(state)
+                    self.schedule_periodic(state)
+                self.scheduler.poll()
+                self.check_schedule()
+                self.check_rcd()
+        finally:
+            selector.close()
+            self.scheduler.close()
+            watch.close()
+            self.hub.stop()
+            if self.rcd is not None:
+                self.rcd.stop()
+            for state in states:
+                state.close()
+
+
+def _terminate(signum, frame):
+    raise SystemExit(0)
+
+
+def _poller(minutes, environ):
+    try:
+        base = float(minutes) * 60
+        minimum = float(environ.get("POLL_INTERVAL_MIN", 1)) * 60
+        maximum = float(environ.get("POLL_INTERVAL_MAX", 60)) * 60
+    except ValueError:
+        base, minimum, maximum = 300, 60, 3600
+    if base <= 0:
+        return None
+    adaptive = environ.get("ADAPTIVE_POLL", "true") == "true"
+    return AdaptivePoller(base, minimum, maximum, adaptive=adaptive)
+
+
+def main():
+    # Line-buffered output for the journal
+    sys.stdout.reconfigure(line_buffering=True)
+
+    pairs = []
+    for pair in load_pairs(os.environ):
+        if os.path.isdir(pair.local_dir):
+            pairs.append(pair)
+        else:
+            print(f"ERROR: Sync directory not found: {pair.local_dir} ({pair.name})")
+    if not pairs:
+        print("ERROR: No sync pair to watch (LOCAL_SYNC_DIR / SYNC_PAIRS not set, or config.env not loaded?)")
+        return 1
+
+    signal.signal(signal.SIGTERM, _terminate)
+    signal.signal(signal.SIGINT, _terminate)
+
+    try:
+        ignore_ttl = int(os.environ.get("SMART_IGNORE_TTL", DEFAULT_TTL))
+    except ValueError:
+        ignore_ttl = DEFAULT_TTL
+
+    pollers = {}
+    for pair in pairs:
+        minutes = pair.poll_interval if pair.poll_interval is not None else os.environ.get("POLL_INTERVAL", 5)
+        pollers[pair.name] = _poller(minutes, os.environ)
+
+    try:
+        max_running = max(1, int(os.environ.get("MAX_CONCURRENT_SYNCS", MAX_RUNNING)))
+    except ValueError:
+        max_running = MAX_RUNNING
+    schedule = load_schedule(os.environ)
+
+    rcd = None
+    if os.environ.get("SYNC_ENGINE") == "rcd":
+        # Runs on the shared rcd share its log and stats: one at a time
+        max_running = 1
+        config_path = os.environ.get("RCLONE_CONFIG_PATH") or os.path.expanduser("~/.config/rclone/rclone.conf")
+        # Its --bwlimit is set from the schedule before it starts
+        rcd = RcdServer(config_path)
+    # Limits set from the schedule when the watcher starts
+    budget = Budget(min(max_running, len(pairs)))
+
+    print("Starting CDSync Watcher (inotify)...")
+    Watcher(pairs, ignore_ttl=ignore_ttl, rcd=rcd, pollers=pollers, max_running=max_running, budget=budget,
+            schedule=schedule, settle=lambda: load_settle(os.environ)).run()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
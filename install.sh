@@ -6,6 +6,7 @@ CONFIG_FILE="$BASE_DIR/config.env"
 SYSTEMD_DIR="$HOME/.config/systemd/user"
 AUTOSTART_DIR="$HOME/.config/autostart"
 APP_DIR="$HOME/.local/share/applications"
+BIN_DIR="$HOME/.local/bin"
 SERVICE_NAME="cdsync-$(basename "$BASE_DIR")-$(echo -n "$BASE_DIR" | md5sum | cut -c1-6)"
 
 # --- HELPER FUNCTIONS ---
@@ -23,7 +24,7 @@ check_python_deps() {
 install_core() {
     # 1. Pre-flight Checks
     if ! command -v rclone &> /dev/null; then echo "❌ rclone not found."; exit 1; fi
-    if ! command -v inotifywait &> /dev/null; then echo "❌ inotify-tools not found."; exit 1; fi
+    if ! command -v python3 &> /dev/null; then echo "❌ python3 not found."; exit 1; fi
     
     if [ ! -f "$CONFIG_FILE" ]; then
         echo "❌ config.env not found. Please create it first."
@@ -32,17 +33,27 @@ install_core() {
 
     source "$CONFIG_FILE"
     
-    # Check Remote Connection
-    if ! rclone lsd "$RCLONE_REMOTE" --max-depth 1 --config "$HOME/.config/rclone/rclone.conf" &> /dev/null; then
-        echo "❌ Could not connect to remote '$RCLONE_REMOTE'."
+    # Every sync pair (the default one plus SYNC_PAIRS, see cdsync/pairs.py)
+    PAIRS=$(PYTHONPATH="$BASE_DIR" python3 -m cdsync.pairs list)
+    if [ -z "$PAIRS" ]; then
+        echo "❌ No sync pair configured (RCLONE_REMOTE/LOCAL_SYNC_DIR or SYNC_PAIRS)."
         exit 1
     fi
 
-    # Create Local Dir if needed
-    if [ ! -d "$LOCAL_SYNC_DIR" ]; then
-        mkdir -p "$LOCAL_SYNC_DIR"
-        echo "✅ Created local directory: $LOCAL_SYNC_DIR"
-    fi
+    while IFS=$'\t' read -r PAIR_NAME PAIR_REMOTE PAIR_LOCAL PAIR_PRIORITY; do
+        # Check Remote Connection
+        if ! rclone lsd "$PAIR_REMOTE" --max-depth 1 --config "${RCLONE_CONFIG_PATH:-$HOME/.config/rclone/rclone.conf}" &> /dev/null; then
+            echo "❌ Could not connect to remote '$PAIR_REMOTE' (pair: $PAIR_NAME)."
+            exit 1
+        fi
+
+        # Create Local Dir if needed
+        if [ ! -d "$PAIR_LOCAL" ]; then
+            mkdir -p "$PAIR_LOCAL"
+            echo "✅ Created local directory: $PAIR_LOCAL"
+        fi
+        echo "✅ Sync pair $PAIR_NAME: $PAIR_REMOTE <-> $PAIR_LOCAL (priority $PAIR_PRIORITY)"
+    done <<< "$PAIRS"
 
     echo "⚙️  Installing/Updating Core Services (Systemd)..."
     
@@ -94,6 +105,16 @@ EOF
     systemctl --user daemon-reload
     
     echo "✅ Core Services Installed (Stopped)."
+
+    install_cli
+}
+
+install_cli() {
+    # `cdsync status --watch` etc.
+    mkdir -p "$BIN_DIR"
+    chmod +x "$BASE_DIR/cdsync-cli.py"
+    ln -sf "$BASE_DIR/cdsync-cli.py" "$BIN_DIR/cdsync"
+    echo "✅ CLI installed: $BIN_DIR/cdsync"
 }
 
 start_services() {
@@ -5,6 +5,7 @@ SYSTEMD_DIR="$HOME/.config/systemd/user"
 SYSTEMD_DIR="$HOME/.config/systemd/user"
 AUTOSTART_DIR="$HOME/.config/autostart"
 APP_DIR="$HOME/.local/share/applications"
+BIN_DIR="$HOME/.local/bin"
 SERVICE_NAME="cdsync-$(basename "$BASE_DIR")-$(echo -n "$BASE_DIR" | md5sum | cut -c1-6)"
 
 echo "------------------------------------------------"
@@ -46,5 +47,11 @@ else
     echo "ℹ️  Systemd services not found. Skipping."
 fi
 
+# 3. REMOVE CLI LINK (only if it points to this checkout)
+if [ "$(readlink "$BIN_DIR/cdsync")" = "$BASE_DIR/cdsync-cli.py" ]; then
+    echo "Removing CLI link..."
+    rm "$BIN_DIR/cdsync"
+fi
+
 echo "✅ UNINSTALLATION SUCCESSFUL!"
 echo "Note: Configuration files, logs, and Python dependencies were NOT removed."